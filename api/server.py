@@ -0,0 +1,298 @@
+# api/server.py
+
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, List, Literal, Optional
+from uuid import UUID
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.callbacks import AsyncCallbackHandler
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+# Garante que o servidor encontra os módulos de 'src' (mesmos nomes usados pelo grafo)
+src_path = str(Path(__file__).resolve().parent.parent / "src")
+if src_path not in sys.path:
+    sys.path.append(src_path)
+
+from graph import build_async_graph, astream_graph, serialize_state, warmup
+from agents import reranker_agent, retriever_agent, self_check_stats
+from utils import load_env, llm_registry
+from utils.batching import MicroBatcher, QueueFullError
+from utils.executor import run_blocking
+from utils.deadline import new_deadline
+from utils.memo import memo_stats
+from utils.tracing import tracer
+
+
+# --- Modelos de requisição ---
+
+RetrievalMode = Literal["dense", "sparse", "hybrid"]
+
+class AskRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    retrieval_mode: Optional[RetrievalMode] = None
+    # Prazo da pergunta em segundos, contado da chegada (padrão: REQUEST_DEADLINE_SECONDS)
+    timeout_seconds: Optional[float] = Field(None, gt=0)
+
+class RetrieveRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    retrieval_mode: Optional[RetrievalMode] = None
+
+
+# --- Componentes de concorrência ---
+
+class BatchingRetriever:
+    """
+    Retriever que encaminha as buscas ao micro-batcher, agrupando embeddings
+    e buscas FAISS de requisições concorrentes numa única chamada.
+    """
+
+    def __init__(self, retriever, batcher: MicroBatcher):
+        self.retriever = retriever
+        self.batcher = batcher
+
+    @property
+    def article_index(self):
+        return self.retriever.article_index
+
+    @property
+    def config(self):
+        return self.retriever.config
+
+    def fetch_articles(self, citations):
+        return self.retriever.fetch_articles(citations)
+
+    def get_relevant_documents(self, queries: List[str], mode: Optional[str] = None, k: Optional[int] = None):
+        return self.retriever.get_relevant_documents(queries, mode=mode, k=k)
+
+    async def aget_relevant_documents(self, queries: List[str], mode: Optional[str] = None, k: Optional[int] = None):
+        # Um k diferente do padrão (nova tentativa do answerer) não cabe no lote, que usa um k único
+        if k is not None:
+            return await self.retriever.aget_relevant_documents(queries, mode=mode, k=k)
+        return await self.batcher.submit((list(queries), mode))
+
+
+class LLMGateCallback(AsyncCallbackHandler):
+    """
+    Segura uma vaga do semáforo do LLMGate só enquanto cada chamada ao modelo
+    roda (do on_*_start ao on_llm_end/on_llm_error). Um por requisição: close()
+    devolve as vagas de chamadas que não chegaram ao fim (ex.: canceladas pelo deadline).
+    """
+
+    def __init__(self, semaphore: asyncio.Semaphore):
+        self._semaphore = semaphore
+        self._held: set[UUID] = set()
+
+    async def _acquire(self, run_id: UUID) -> None:
+        await self._semaphore.acquire()
+        self._held.add(run_id)
+
+    def _release(self, run_id: UUID) -> None:
+        if run_id in self._held:
+            self._held.discard(run_id)
+            self._semaphore.release()
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs) -> None:
+        await self._acquire(run_id)
+
+    async def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs) -> None:
+        await self._acquire(run_id)
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        self._release(run_id)
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        self._release(run_id)
+
+    def close(self) -> None:
+        for run_id in list(self._held):
+            self._release(run_id)
+
+
+class LLMGate:
+    """
+    Limita quantas chamadas ao provedor LLM rodam ao mesmo tempo; o resto do
+    grafo (cache semântico, recuperação) não espera por vaga. Acima de
+    max_pending perguntas em andamento novas requisições são rejeitadas com
+    429 em vez de acumularem na memória.
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def reserve(self) -> Callable[[], None]:
+        """Reserva uma vaga de pergunta (ou 429); devolve a liberação, que só vale uma vez."""
+        if self.pending >= self.max_pending:
+            raise QueueFullError(f"Limite de {self.max_pending} perguntas pendentes atingido")
+        self.pending += 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.pending -= 1
+
+        return release
+
+    def callback(self) -> LLMGateCallback:
+        """Callback da requisição que passa cada chamada ao LLM pelo semáforo."""
+        return LLMGateCallback(self._semaphore)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserva uma vaga (ou 429) e devolve o callback da requisição; libera tudo ao sair."""
+        release = self.reserve()
+        callback = self.callback()
+        try:
+            yield callback
+        finally:
+            callback.close()
+            release()
+
+
+def _serialize_documents(documents) -> List[dict]:
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def _graph_config(graph_config: dict, gate_callback: LLMGateCallback) -> dict:
+    """Configuração do grafo para uma requisição: o callback do LLMGate chega a todas as chamadas ao LLM."""
+    return {**graph_config, "callbacks": [*graph_config.get("callbacks", []), gate_callback]}
+
+
+def _reranker_stats() -> Optional[dict]:
+    """Estatísticas do reranker só se ele já foi construído: /stats não carrega o cross-encoder."""
+    if not reranker_agent.initialized or reranker_agent.resolve() is None:
+        return None
+    return reranker_agent.stats()
+
+
+def _graph_inputs(body: AskRequest) -> dict:
+    # O prazo começa na chegada: a espera por vaga no LLMGate também conta
+    inputs = {"question": body.question, "deadline": new_deadline(body.timeout_seconds)}
+    if body.retrieval_mode:
+        inputs["retrieval_mode"] = body.retrieval_mode
+    return inputs
+
+
+# --- Aplicação ---
+
+def create_app(graph=None, retriever=None) -> FastAPI:
+    """
+    Cria a aplicação ASGI sobre o grafo assíncrono.
+    graph e retriever podem ser injetados (ex.: testes com LLM_PROVIDER=fake).
+    """
+    load_env()
+    graph = graph or build_async_graph()
+    retriever = retriever or retriever_agent
+
+    batcher = MicroBatcher(
+        # lambda: o retriever (proxy preguiçoso) só é carregado no warmup
+        lambda items: retriever.search_many([queries for queries, _ in items], [mode for _, mode in items]),
+        max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "32")),
+        max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "5")),
+        max_queue=int(os.getenv("BATCH_MAX_QUEUE", "256")),
+    )
+    batching_retriever = BatchingRetriever(retriever, batcher)
+    gate = LLMGate(
+        max_concurrency=int(os.getenv("SERVER_MAX_LLM_CONCURRENCY", "4")),
+        max_pending=int(os.getenv("SERVER_MAX_PENDING", "64")),
+    )
+    graph_config = {"configurable": {"retriever": batching_retriever}}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Modelos, índice e clientes LLM carregados antes da primeira requisição
+        await run_blocking(warmup)
+        batcher.start()
+        yield
+        await batcher.stop()
+
+    app = FastAPI(title="Dr. Llama API", lifespan=lifespan)
+
+    @app.exception_handler(QueueFullError)
+    async def queue_full_handler(request: Request, exc: QueueFullError):
+        return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "batcher": batcher.stats(),
+            "pending_questions": gate.pending,
+            "llm_clients": llm_registry.stats(),
+            "memo": memo_stats(),
+            "retriever": retriever.stats(),
+            "reranker": _reranker_stats(),
+            "self_check": self_check_stats(),
+        }
+
+    @app.get("/metrics")
+    async def metrics(kind: Optional[str] = None):
+        """p50/p95/p99 (ms) por nó, chamada ao LLM e etapa da busca; ?kind=node|llm|retrieval|request filtra."""
+        return {"latency": tracer.latency_summary(kind)}
+
+    @app.post("/ask")
+    async def ask(body: AskRequest):
+        inputs = _graph_inputs(body)
+        with tracer.span("ask", kind="request"):
+            async with gate.admit() as gate_callback:
+                final_state = await graph.ainvoke(inputs, _graph_config(graph_config, gate_callback))
+        return {
+            **serialize_state(final_state),
+            "cache_hit": final_state.get("cache_hit", False),
+        }
+
+    @app.post("/ask/stream")
+    async def ask_stream(body: AskRequest):
+        # A vaga é reservada antes de abrir o stream para que o 429 saia como status HTTP
+        release = gate.reserve()
+        gate_callback = gate.callback()
+        inputs = _graph_inputs(body)
+
+        def close() -> None:
+            gate_callback.close()
+            release()
+
+        async def events():
+            try:
+                config = _graph_config(graph_config, gate_callback)
+                async for kind, payload in astream_graph(graph, inputs, config):
+                    if kind == "token":
+                        event = {"type": "token", "content": payload}
+                    elif kind == "revision":
+                        event = {"type": "revision", "node": payload}
+                    else:
+                        event = {"type": "final", **serialize_state(payload)}
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            finally:
+                close()
+
+        # Se o cliente cair antes de o gerador começar, o finally nunca roda: a BackgroundTask libera a vaga
+        return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(close))
+
+    @app.post("/retrieve")
+    async def retrieve(body: RetrieveRequest):
+        documents = await batching_retriever.aget_relevant_documents(body.queries, mode=body.retrieval_mode)
+        return {"documents": _serialize_documents(documents)}
+
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("SERVER_HOST", "0.0.0.0"), port=int(os.getenv("SERVER_PORT", "8000")))
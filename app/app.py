@@ -9,13 +9,13 @@ import os
 # Garante que a aplicação consegue encontrar o pacote 'src'
 try:
     # Abordagem 1: Tenta a importação direta
-    from src.graph import build_graph
+    from src.graph import build_graph, context_documents, stream_graph, warmup
 except ImportError:
     # Abordagem 2: Se falhar, adiciona os paths e tenta de novo
     try:
         src_path = str(Path(__file__).resolve().parent.parent)
         sys.path.append(src_path)
-        from src.graph import build_graph
+        from src.graph import build_graph, context_documents, stream_graph, warmup
     except ImportError as e:
         st.error(f"Erro Crítico: Não foi possível encontrar o módulo 'src.graph'. Verifique a sua estrutura de pastas e a instalação. Detalhes: {e}")
         st.stop()
@@ -52,6 +52,7 @@ st.divider()
 def load_graph():
     print("A carregar e a compilar o grafo... (isto só deve acontecer uma vez)")
     graph = build_graph()
+    warmup()
     print("Grafo carregado com sucesso.")
     return graph
 
@@ -66,6 +67,13 @@ for message in st.session_state.messages:
     avatar_to_use = message.get("avatar", AVATAR_SUCCESS if message["role"] == "assistant" else "👤")
     with st.chat_message(message["role"], avatar=avatar_to_use):
         st.markdown(message["content"])
+        # Resposta transmitida que foi retirada após o self-check
+        if message.get("retracted_answer"):
+            with st.expander("⚠️ Resposta inicial retirada (não fiel às fontes)"):
+                st.markdown(message["retracted_answer"])
+        elif message.get("revised_answer"):
+            with st.expander("ℹ️ Resposta revisada após a verificação das fontes"):
+                st.markdown(message["revised_answer"])
         # Mostra as fontes se for uma resposta do assistente e elas existirem
         if message.get("sources"):
             with st.expander("Fontes Utilizadas"):
@@ -88,25 +96,51 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
     print(user_message)
     
     with st.chat_message("assistant", avatar=AVATAR_SUCCESS): # Avatar temporário
-        with st.spinner("Analisando documentos, gerando resposta e fazendo verificação..."):
-            final_state = app.invoke({"question": user_message["content"]})
+        placeholder = st.empty()
+        placeholder.markdown("_Analisando documentos e gerando resposta..._")
+        streamed_answer = ""
+        first_answer = ""
+        final_state = {}
+        
+        # Mostra os tokens do answerer (e das reescritas) assim que chegam
+        for kind, payload in stream_graph(app, {"question": user_message["content"]}):
+            if kind == "token":
+                streamed_answer += payload
+                placeholder.markdown(streamed_answer + "▌")
+            elif kind == "revision":
+                first_answer = first_answer or streamed_answer
+                streamed_answer = ""
+                placeholder.markdown("_Revisando a resposta..._")
+            else:
+                final_state = payload
+        first_answer = first_answer or streamed_answer
+        
+        if streamed_answer:
+            placeholder.markdown(streamed_answer + "\n\n_Verificando fidelidade às fontes..._")
 
     answer = final_state.get("answer", "Desculpe, ocorreu um erro.")
-    documents = final_state.get("documents", [])
+    documents = context_documents(final_state)
     verdict_obj = final_state.get("verdict")
 
     # Escolhe o avatar com base no veredito
     if verdict_obj and verdict_obj.verdict == "nao_fiel":
         avatar_to_display = AVATAR_FAIL
+        # A resposta já exibida é retirada e fica anotada no histórico
+        retracted_answer = first_answer or None
     else:
         avatar_to_display = AVATAR_SUCCESS
+        retracted_answer = None
+    # A resposta final não é a que foi transmitida primeiro: o usuário vê o aviso
+    revised_answer = first_answer if first_answer and first_answer.strip() not in answer else None
     
     # Adiciona a resposta do assistente ao estado da sessão
     st.session_state.messages.append({
         "role": "assistant", 
         "content": answer, 
         "sources": documents,
-        "avatar": avatar_to_display
+        "avatar": avatar_to_display,
+        "retracted_answer": retracted_answer,
+        "revised_answer": revised_answer
     })
     
     # Redesenha a página para mostrar a nova resposta do assistente
@@ -0,0 +1,135 @@
+"""
+Benchmark dos índices aproximados (HNSW, IVF-Flat, IVF-PQ) contra o índice plano.
+
+Cada tipo de índice é construído em memória a partir do index.faiss da
+ingestão e avaliado numa varredura de nprobe (IVF) / efSearch (HNSW):
+- recall@k: fração dos k vizinhos exatos (busca no índice plano) encontrados;
+- p50/p99 da latência de uma busca com uma consulta;
+- memória: tamanho do índice serializado.
+
+As consultas são as perguntas de eval/test-questions.json (embutidas com o
+mesmo modelo do retriever) mais vetores do próprio índice com ruído.
+--scale N replica o corpus N vezes (com ruído) para simular um índice maior.
+
+Uso (a partir da raiz do projeto, com o índice já criado pela ingestão):
+    python bench/bench_ann.py [--k 10] [--scale 1] [--queries 200]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.ann_index import build_ann_index, tune_ann_index
+from src.utils.vector_store import INDEX_FILENAME, read_index
+
+DB_FAISS_PATH = project_root / "vectorstores" / "db_faiss"
+QUESTIONS_PATH = project_root / "eval" / "test-questions.json"
+
+# (tipo, parâmetro de busca, valores da varredura)
+SWEEPS = [
+    ("hnsw", "ef_search", [16, 32, 64, 128]),
+    ("ivf_flat", "nprobe", [1, 4, 16, 64]),
+    ("ivf_pq", "nprobe", [1, 4, 16, 64]),
+]
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def embed_questions() -> np.ndarray:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)["questions"]]
+    model = HuggingFaceEmbeddings(model_name="thenlper/gte-small", model_kwargs={"device": "cpu"})
+    return np.asarray(model.embed_documents(questions), dtype=np.float32)
+
+
+def load_corpus(scale: int, rng: np.random.Generator) -> faiss.Index:
+    """Índice plano da ingestão, opcionalmente replicado com ruído (--scale)."""
+    flat = read_index(DB_FAISS_PATH / INDEX_FILENAME, mmap=False)
+    if scale <= 1:
+        return flat
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    noise = float(np.std(vectors)) * 0.1
+    scaled = faiss.IndexFlatL2(flat.d)
+    scaled.add(vectors)
+    for _ in range(scale - 1):
+        scaled.add((vectors + rng.normal(0, noise, vectors.shape)).astype(np.float32))
+    return scaled
+
+
+def make_queries(flat: faiss.Index, count: int, with_questions: bool, rng: np.random.Generator) -> np.ndarray:
+    sample = rng.choice(flat.ntotal, size=min(count, flat.ntotal), replace=False)
+    vectors = np.stack([flat.reconstruct(int(position)) for position in sample])
+    # Ruído para a consulta não ser exatamente um vetor do índice
+    queries = [(vectors + rng.normal(0, float(np.std(vectors)) * 0.05, vectors.shape)).astype(np.float32)]
+    if with_questions:
+        queries.append(embed_questions())
+    return np.concatenate(queries)
+
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, positions = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += len(set(positions[0].tolist()) & set(expected.tolist()))
+    return {
+        "recall": found / truth.size,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def report(label: str, result: dict, size_mb: float):
+    print(
+        f"{label:<24} recall {result['recall']:6.1%} | "
+        f"p50 {result['p50']:7.3f} ms | p99 {result['p99']:7.3f} ms | {size_mb:8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10, help="vizinhos por consulta (recall@k)")
+    parser.add_argument("--queries", type=int, default=200, help="vetores do índice usados como consulta")
+    parser.add_argument("--scale", type=int, default=1, help="replica o corpus N vezes para simular um índice maior")
+    parser.add_argument("--no-questions", action="store_true", help="não embute as perguntas do eval (dispensa o modelo)")
+    parser.add_argument("--pq-m", type=int, default=16, help="subquantizadores do IVF-PQ")
+    parser.add_argument("--nlist", type=int, default=None, help="listas invertidas do IVF (padrão: ~4*sqrt(N))")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    flat = load_corpus(args.scale, rng)
+    queries = make_queries(flat, args.queries, not args.no_questions, rng)
+    _, truth = flat.search(queries, args.k)
+    print(f"{flat.ntotal} vetores (d={flat.d}) | {len(queries)} consultas | recall@{args.k}\n")
+
+    report("flat (exato)", measure(flat, queries, truth, args.k), len(faiss.serialize_index(flat)) / 1024 ** 2)
+    for index_type, parameter, values in SWEEPS:
+        start = time.perf_counter()
+        index = build_ann_index(flat, index_type, nlist=args.nlist, pq_m=args.pq_m)
+        build_seconds = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 1024 ** 2
+        print(f"\n{index_type}: construído em {build_seconds:.1f} s")
+        for value in values:
+            tune_ann_index(index, **{parameter: value})
+            report(f"  {parameter}={value}", measure(index, queries, truth, args.k), size_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark dos backends de embedding: torch (HuggingFaceEmbeddings), onnx e onnx_int8.
+
+Cada backend roda num subprocesso próprio, para que o pico de RSS medido seja
+só dele, e reporta:
+- latência por consulta (p50/p95), embutindo as perguntas do eval uma a uma;
+- vazão em lote (textos/s), embutindo chunks do docstore (ou as perguntas);
+- pico de RSS do processo;
+- cosseno mínimo/médio dos vetores em relação ao backend torch.
+
+Uso (a partir da raiz do projeto, após python ingest/export_onnx.py):
+    python bench/bench_embeddings.py [--backends torch onnx onnx_int8] [--batch-texts 512]
+"""
+
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.embeddings import EMBEDDING_BACKENDS, cosine_agreement
+
+QUESTIONS_PATH = project_root / "eval" / "test-questions.json"
+DOCSTORE_PATH = project_root / "vectorstores" / "db_faiss" / "docstore.sqlite"
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_texts(batch_texts: int):
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)["questions"]]
+    if DOCSTORE_PATH.exists():
+        with sqlite3.connect(str(DOCSTORE_PATH)) as conn:
+            rows = conn.execute("SELECT page_content FROM docs ORDER BY position LIMIT ?", (batch_texts,)).fetchall()
+        chunks = [row[0] for row in rows]
+    else:
+        chunks = (questions * (batch_texts // len(questions) + 1))[:batch_texts]
+    return questions, chunks
+
+
+def run_backend(backend: str, batch_texts: int, output: str):
+    """Executado no subprocesso: mede um backend e grava o resultado (e os vetores) em output."""
+    os.environ["EMBEDDING_BACKEND"] = backend
+    from src.utils import load_env
+    from src.utils.embeddings import create_embeddings
+
+    load_env()  # não sobrescreve o EMBEDDING_BACKEND definido acima
+    questions, chunks = load_texts(batch_texts)
+
+    start = time.perf_counter()
+    model = create_embeddings()
+    load_seconds = time.perf_counter() - start
+    model.embed_query(questions[0])  # aquecimento
+
+    latencies = []
+    vectors = []
+    for question in questions:
+        start = time.perf_counter()
+        vectors.append(model.embed_query(question))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    model.embed_documents(chunks)
+    throughput = len(chunks) / (time.perf_counter() - start)
+
+    np.save(output + ".npy", np.asarray(vectors, dtype=np.float32))
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "load_s": load_seconds,
+            "p50": statistics.median(latencies),
+            "p95": percentile(latencies, 95),
+            "throughput": throughput,
+            # ru_maxrss em KB no Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--batch-texts", type=int, default=512, help="textos embutidos na medição de vazão")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args.child, args.batch_texts, args.output)
+        return
+
+    results, vectors = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            output = str(Path(tmp) / f"{backend}.json")
+            command = [sys.executable, __file__, "--child", backend, "--output", output, "--batch-texts", str(args.batch_texts)]
+            if subprocess.run(command).returncode != 0:
+                print(f"{backend:<10} falhou (modelo ONNX exportado? python ingest/export_onnx.py)")
+                continue
+            with open(output, "r", encoding="utf-8") as f:
+                results[backend] = json.load(f)
+            vectors[backend] = np.load(output + ".npy")
+
+    print()
+    for backend, result in results.items():
+        line = (
+            f"{backend:<10} carga {result['load_s']:5.1f} s | consulta p50 {result['p50']:6.2f} ms p95 {result['p95']:6.2f} ms | "
+            f"lote {result['throughput']:7.1f} textos/s | pico RSS {result['peak_rss_mb']:7.1f} MB"
+        )
+        if "torch" in vectors and backend != "torch":
+            agreement = cosine_agreement(vectors["torch"], vectors[backend])
+            line += f" | cosseno vs torch mín {agreement['min_cosine']:.4f} médio {agreement['mean_cosine']:.4f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
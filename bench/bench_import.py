@@ -0,0 +1,59 @@
+"""
+Benchmark do tempo de importação do pacote de agentes.
+
+Mede, em processos novos, quanto custa `import src.agents` (deve ficar bem
+abaixo de 1 s, já que os singletons são preguiçosos) e quanto custa o
+warmup() explícito que carrega embeddings, índice FAISS e clientes LLM.
+
+Uso (a partir da raiz do projeto):
+    python bench/bench_import.py [--runs 5] [--warmup]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import src.agents; print(time.perf_counter() - t)"
+WARMUP_SNIPPET = (
+    "import time; import src.agents as a; t = time.perf_counter(); a.warmup(); print(time.perf_counter() - t)"
+)
+
+
+def measure(snippet: str, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", snippet],
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    print(
+        f"{label:<22} mediana {statistics.median(timings):6.3f} s | "
+        f"mín {min(timings):6.3f} s | máx {max(timings):6.3f} s ({len(timings)} execuções)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="também mede o warmup() (carrega modelos e índice)")
+    args = parser.parse_args()
+
+    report("import src.agents", measure(IMPORT_SNIPPET, args.runs))
+    if args.warmup:
+        report("warmup()", measure(WARMUP_SNIPPET, args.runs))
+
+
+if __name__ == "__main__":
+    main()
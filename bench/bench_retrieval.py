@@ -0,0 +1,104 @@
+"""
+Benchmark de latência e taxa de acerto da busca (densa, BM25 e híbrida).
+
+Para cada pergunta de eval/test-questions.json, os artigos esperados são
+extraídos do ground_truth ("Art. 39"); há acerto quando algum documento
+recuperado tem um desses artigos no metadado `article`. Perguntas sem
+artigo no ground_truth entram só na medição de latência.
+
+Uso (a partir da raiz do projeto, com o índice já criado pela ingestão):
+    python bench/bench_retrieval.py [--runs 3] [--k 2]
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.agents import retriever_agent
+
+QUESTIONS_PATH = project_root / "eval" / "test-questions.json"
+
+# (rótulo, modo, fusão)
+CONFIGURATIONS = [
+    ("dense", "dense", None),
+    ("sparse (BM25)", "sparse", None),
+    ("hybrid (RRF)", "hybrid", "rrf"),
+    ("hybrid (weighted)", "hybrid", "weighted"),
+]
+
+_article_number = re.compile(r"Art\.\s*(\d+)")
+
+
+def load_questions() -> list:
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    return [
+        (item["question"], set(_article_number.findall(item["ground_truth"])))
+        for item in questions
+    ]
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(mode: str, questions: list, runs: int) -> dict:
+    latencies = []
+    hits = 0
+    evaluated = 0
+    for run_index in range(runs):
+        for question, expected in questions:
+            start = time.perf_counter()
+            documents = retriever_agent.get_relevant_documents([question], mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if run_index == 0 and expected:
+                evaluated += 1
+                found = {m for doc in documents for m in _article_number.findall(doc.metadata.get("article", ""))}
+                hits += bool(found & expected)
+    return {
+        "hit_rate": hits / evaluated if evaluated else 0.0,
+        "evaluated": evaluated,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="repetições de cada pergunta para medir latência")
+    parser.add_argument("--k", type=int, default=None, help="documentos por consulta (padrão: o do retriever)")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    retriever_agent.resolve()
+    if args.k:
+        retriever_agent.config.k = args.k
+
+    print(f"{len(questions)} perguntas | {retriever_agent.config}\n")
+    for label, mode, fusion in CONFIGURATIONS:
+        if fusion:
+            retriever_agent.fusion = fusion
+        if retriever_agent.resolve_mode(mode) != mode:
+            print(f"{label:<20} indisponível (índice sem BM25; rode a ingestão novamente)")
+            continue
+        # Aquecimento: primeira consulta carrega páginas do índice e caches do SQLite
+        retriever_agent.get_relevant_documents([questions[0][0]], mode=mode)
+        result = run(mode, questions, args.runs)
+        print(
+            f"{label:<20} acerto {result['hit_rate']:6.1%} ({result['evaluated']} perguntas) | "
+            f"p50 {result['p50']:7.2f} ms | p95 {result['p95']:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Quantas chamadas ao LLM do self-check a pré-verificação por regras evita.
+
+Lê o results.csv de uma avaliação (eval/evaluate_rag.py) e aplica
+utils/faithfulness.precheck a cada resposta, usando os contextos salvos.
+Como o CSV guarda só o texto dos chunks (sem o metadado 'article'), os
+artigos citados são conferidos pelo texto do contexto; o número exato,
+com os metadados, sai no report.md de uma avaliação nova (seção Self-Check).
+
+Uso (a partir da raiz do projeto):
+    python bench/bench_self_check.py [--results eval/evaluation/results/latest/results.csv] [--min-overlap 0.3]
+"""
+
+import argparse
+import ast
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils.faithfulness import precheck
+
+DEFAULT_RESULTS = project_root / "eval" / "evaluation" / "results" / "latest" / "results.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", default=str(DEFAULT_RESULTS), help="results.csv de uma avaliação")
+    parser.add_argument("--min-overlap", type=float, default=0.3, help="sobreposição mínima de trigramas para aprovar")
+    args = parser.parse_args()
+
+    results = pd.read_csv(args.results)
+    decisions = Counter()
+    start = time.perf_counter()
+    for _, row in results.iterrows():
+        contexts = ast.literal_eval(row["contexts"]) if isinstance(row["contexts"], str) else []
+        result = precheck(str(row["answer"]), [], "\n\n".join(contexts), min_overlap=args.min_overlap)
+        decisions[result.verdict or "llm"] += 1
+        print(f"Q{row.get('id', '?')}: {result.verdict or 'LLM':<8} | {result.reasoning}")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    total = sum(decisions.values())
+    if not total:
+        print("Nenhuma resposta no arquivo.")
+        return
+    avoided = decisions["fiel"] + decisions["nao_fiel"]
+    print(
+        f"\n{total} respostas | decididas pelas regras: {avoided} ({avoided / total:.0%}; "
+        f"{decisions['fiel']} fiéis, {decisions['nao_fiel']} não fiéis) | ao LLM: {decisions['llm']} | "
+        f"{elapsed_ms / total:.2f} ms por resposta"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -35,16 +35,20 @@ except ImportError:
         sys.exit(1)
 
 try:
-    from src import build_graph
+    from src.graph import build_graph, context_documents, warmup
     print("Grafo importado")
 except ImportError:
     try:
-        from src.graph import build_graph
+        sys.path.append(str(project_root / "src"))
+        from graph import build_graph, context_documents, warmup
         print("Grafo importado (path alternativo)")
     except ImportError as e:
         print(f"Erro ao importar grafo: {e}")
         sys.exit(1)
 
+# Mesmo módulo 'agents' usado pelo grafo, para ler os contadores do self-check
+from agents import self_check_stats
+
 class RAGEvaluator:
     """
     Avaliador RAG refatorado usando llm_factory e estrutura organizada
@@ -70,6 +74,8 @@ class RAGEvaluator:
         # Inicializar componentes
         try:
             self.graph = build_graph()
+            # Carrega modelos e índice agora para não contaminar o tempo da 1ª pergunta
+            warmup()
             print("Grafo carregado")
         except Exception as e:
             print(f"Erro ao carregar grafo: {e}")
@@ -149,7 +155,7 @@ class RAGEvaluator:
             
             # Extrair dados
             answer = result.get("answer", "")
-            documents = result.get("documents", [])
+            documents = context_documents(result)
             contexts = [doc.page_content[:1000] for doc in documents[:5]]
             verdict = result.get("verdict", {})
             
@@ -172,6 +178,8 @@ class RAGEvaluator:
                 "processing_time": processing_time,
                 "status": status,
                 "num_documents": len(documents),
+                "attempts": len(result.get("attempts", [])),
+                "skipped_stages": ",".join(dict.fromkeys(result.get("skipped_stages", []))),
                 "timestamp": datetime.now().isoformat()
             }
             
@@ -188,6 +196,8 @@ class RAGEvaluator:
                 "processing_time": 0,
                 "status": "error",
                 "num_documents": 0,
+                "attempts": 0,
+                "skipped_stages": "",
                 "timestamp": datetime.now().isoformat()
             }
     
@@ -382,6 +392,7 @@ class RAGEvaluator:
             'success_rate': success_count / total * 100,
             'avg_processing_time': avg_time,
             'avg_documents_retrieved': avg_docs,
+            'self_check': self_check_stats(),
             'category_stats': category_stats
         }
     
@@ -425,6 +436,17 @@ Método utilizado: {ragas_results.get('method', 'manual')}
 | **Context Precision** | {ragas_results.get('context_precision', 0):.3f} |
 | **Context Recall** | {ragas_results.get('context_recall', 0):.3f} |
 
+"""
+        
+        # Self-check: decisões das regras x chamadas ao LLM
+        self_check = custom_metrics.get('self_check')
+        if self_check and self_check['total']:
+            report += f"""## Self-Check
+
+- **Verificações**: {self_check['total']}
+- **Decididas pelas regras (sem LLM)**: {self_check['llm_calls_avoided']} ({self_check['avoided_rate']:.1%}) — {self_check['rules_fiel']} fiéis, {self_check['rules_nao_fiel']} não fiéis
+- **Enviadas ao LLM (casos ambíguos)**: {self_check['llm']}
+
 """
         
         # Análise por categoria
@@ -564,6 +586,8 @@ def main():
         
         print(f"• Taxa de sucesso: {custom_metrics.get('success_rate', 0):.1f}%")
         print(f"• Tempo médio: {custom_metrics.get('avg_processing_time', 0):.2f}s")
+        self_check = custom_metrics.get('self_check', {})
+        print(f"• Self-check: {self_check.get('llm_calls_avoided', 0)} de {self_check.get('total', 0)} chamadas ao LLM evitadas")
         
         if "error" not in ragas_results:
             print(f"• Faithfulness: {ragas_results.get('faithfulness', 0):.3f}")
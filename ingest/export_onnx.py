@@ -0,0 +1,106 @@
+"""
+Exporta o gte-small para ONNX (fp32 e int8) e verifica a compatibilidade dos
+vetores com o backend PyTorch e com o índice FAISS já criado.
+
+Para uma amostra de chunks do docstore (ou das perguntas do eval, se ainda
+não houver índice), compara o vetor de cada backend ONNX com:
+- o do HuggingFaceEmbeddings (PyTorch) para o mesmo texto;
+- o vetor salvo no index.faiss, e se a busca com o vetor ONNX devolve o
+  próprio chunk como primeiro resultado (recall@1).
+O resultado fica em embedding_meta.json e o script sai com erro se algum
+backend ficar abaixo da tolerância (cosseno mínimo em TOLERANCES).
+
+Uso (a partir da raiz do projeto):
+    python ingest/export_onnx.py [--output models/gte-small-onnx] [--no-quantize] [--samples 256]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parent.parent
+src_path = str(project_root / "src")
+if src_path not in sys.path:
+    sys.path.append(src_path)
+from utils.embeddings import (
+    DEFAULT_ONNX_DIR, EMBEDDING_MODEL, ONNX_INT8_FILENAME, TOLERANCES,
+    OnnxEmbeddings, cosine_agreement, export_onnx, write_onnx_meta,
+)
+from utils.vector_store import DOCSTORE_FILENAME, INDEX_FILENAME, read_index
+
+DB_FAISS_PATH = project_root / "vectorstores" / "db_faiss"
+QUESTIONS_PATH = project_root / "eval" / "test-questions.json"
+
+
+def sample_texts(samples: int):
+    """(posições no índice, textos): chunks do docstore ou, sem índice, perguntas do eval."""
+    docstore = DB_FAISS_PATH / DOCSTORE_FILENAME
+    if docstore.exists():
+        with sqlite3.connect(str(docstore)) as conn:
+            rows = conn.execute(
+                "SELECT position, page_content FROM docs ORDER BY random() LIMIT ?", (samples,)
+            ).fetchall()
+        return [row[0] for row in rows], [row[1] for row in rows]
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        return None, [item["question"] for item in json.load(f)["questions"]][:samples]
+
+
+def verify(model_dir: Path, backend: str, texts, positions, reference: np.ndarray, flat_index) -> dict:
+    embeddings = OnnxEmbeddings(model_dir, quantized=backend == "onnx_int8")
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+    result = cosine_agreement(reference, vectors)
+    if flat_index is not None:
+        stored = np.stack([flat_index.reconstruct(int(position)) for position in positions])
+        against_index = cosine_agreement(stored, vectors)
+        _, nearest = flat_index.search(vectors, 1)
+        result["index_min_cosine"] = against_index["min_cosine"]
+        result["index_recall_at_1"] = float(np.mean(nearest[:, 0] == np.asarray(positions)))
+    result["tolerance"] = TOLERANCES[backend]
+    result["passed"] = result["min_cosine"] >= TOLERANCES[backend]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=str(DEFAULT_ONNX_DIR), help="pasta do modelo exportado (ONNX_MODEL_DIR)")
+    parser.add_argument("--no-quantize", action="store_true", help="não gera a versão int8")
+    parser.add_argument("--samples", type=int, default=256, help="textos usados na verificação")
+    args = parser.parse_args()
+
+    model_dir = Path(args.output)
+    print(f"Exportando {EMBEDDING_MODEL} para {model_dir}...")
+    meta = export_onnx(model_dir, quantize=not args.no_quantize)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    positions, texts = sample_texts(args.samples)
+    reference = np.asarray(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"}).embed_documents(texts),
+        dtype=np.float32,
+    )
+    flat_index = read_index(DB_FAISS_PATH / INDEX_FILENAME, mmap=False) if positions else None
+    print(f"Verificando com {len(texts)} {'chunks do índice' if positions else 'perguntas do eval'}...")
+
+    backends = ["onnx"] + ([] if not (model_dir / ONNX_INT8_FILENAME).exists() else ["onnx_int8"])
+    meta["verification"] = {}
+    for backend in backends:
+        result = verify(model_dir, backend, texts, positions, reference, flat_index)
+        meta["verification"][backend] = result
+        line = f"{backend:<10} cosseno vs PyTorch: mín {result['min_cosine']:.5f} | médio {result['mean_cosine']:.5f}"
+        if "index_min_cosine" in result:
+            line += f" | vs índice: mín {result['index_min_cosine']:.5f} | recall@1 {result['index_recall_at_1']:.1%}"
+        print(f"{line} | {'OK' if result['passed'] else 'FORA DA TOLERÂNCIA'} (>= {result['tolerance']})")
+    write_onnx_meta(model_dir, meta)
+
+    if not all(result["passed"] for result in meta["verification"].values()):
+        sys.exit(1)
+    print(f"Modelo ONNX salvo em: {model_dir}. Ative com EMBEDDING_BACKEND=onnx ou onnx_int8 no config/.env.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,103 @@
+import argparse
+import hashlib
+import multiprocessing
 import os
+import queue
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import requests
 from tqdm import tqdm
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 import re
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+src_path = str(Path(__file__).resolve().parent.parent / "src")
+if src_path not in sys.path:
+    sys.path.append(src_path)
+from utils import load_env
+from utils.ann_index import ANN_FILENAME, INDEX_TYPES, build_ann_index, remove_ann_index, save_ann_index
+from utils.embeddings import create_embeddings
+from utils.vector_store import save_vector_store, load_vector_store_for_update, read_manifest
 
 # --- CONFIGURAÇÃO ---
 DATA_PATH = "data/raw"
 DB_FAISS_PATH = "vectorstores/db_faiss"
 
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+# Pipeline de ingestão
+PARSE_BATCH_SIZE = 64      # chunks por mensagem na fila entre os workers e o embedding
+QUEUE_SIZE = 16            # mensagens na fila antes de os workers esperarem
+QUEUE_POLL_SECONDS = 5     # espera na fila antes de conferir se algum worker morreu
+INDEX_BATCH_SIZE = 256     # chunks embutidos e adicionados ao índice por vez
+ENCODE_BATCH_SIZE = 64     # batch_size interno do sentence-transformers
+
 
 SOURCES = [
     {
         "name": "constituicao_federal.pdf",
         "url": "https://www2.senado.leg.br/bdsf/bitstream/handle/id/685819/CF88_EC135_2025_separata.pdf",
-        "pretty_name": "Constituição Federal de 1988"
+        "pretty_name": "Constituição Federal de 1988",
+        "aliases": ["cf", "cf88", "cf/88", "constituição", "constituição federal"]
     },
     {
         "name": "codigo_defesa_consumidor.pdf",
         "url": "https://www2.senado.leg.br/bdsf/bitstream/handle/id/533814/cdc_e_normas_correlatas_2ed.pdf",
-        "pretty_name": "Código de Defesa do Consumidor"
+        "pretty_name": "Código de Defesa do Consumidor",
+        "aliases": ["cdc", "código de defesa do consumidor", "código do consumidor"]
     }
 ]
 # --------------------
 
+def iter_pages(path: str):
+    """Gera as páginas do PDF uma a uma, sem carregar o documento inteiro."""
+    return PyPDFLoader(path).lazy_load()
+
 def process_pdf_with_article_metadata(path: str, pretty_name: str, text_splitter: RecursiveCharacterTextSplitter):
     """
-    Carrega um PDF e o processa para extrair artigos como metadados para cada chunk.
+    Processa um PDF página a página e gera (yield) seus chunks com o artigo como metadado.
+    O artigo corrente atravessa as quebras de página; nenhuma lista com o
+    documento inteiro é mantida em memória.
     """
     print(f"Processando com metadados: {pretty_name}...")
-    
-    # Carrega o PDF inteiro, mas mantém as páginas separadas
-    loader = PyPDFLoader(path)
-    pages = loader.load_and_split()
-    
-    all_chunks = []
+
     current_article_text = "Não especificado"
-    
+    total_chunks = 0
+
     # Regex para encontrar "Art. Xº" ou "Art. Xo" ou "Art. X."
     article_pattern = re.compile(r"(Art\.\s*\d+[ºo]?)")
 
-    for page in pages:
+    def make_chunks(text: str, article: str, page_number: int):
+        for chunk_content in text_splitter.split_text(text):
+            yield Document(
+                page_content=chunk_content,
+                metadata={
+                    "source": path,
+                    "pretty_name": pretty_name,
+                    "article": article,
+                    "page": page_number
+                }
+            )
+
+    for page in iter_pages(path):
         content = page.page_content
         page_number = page.metadata.get('page', 0) + 1 # PyPDFLoader começa a página 0
-        
+
         # Encontra todos os inícios de artigo na página
         matches = list(article_pattern.finditer(content))
-        
+
         if not matches:
             # Se não houver novos artigos na página, todos os chunks pertencem ao último artigo visto
-            chunks = text_splitter.split_text(content)
-            for chunk_content in chunks:
-                new_doc = Document(
-                    page_content=chunk_content,
-                    metadata={
-                        "source": path,
-                        "pretty_name": pretty_name,
-                        "article": current_article_text,
-                        "page": page_number
-                    }
-                )
-                all_chunks.append(new_doc)
+            for doc in make_chunks(content, current_article_text, page_number):
+                total_chunks += 1
+                yield doc
             continue
 
         # Se houver artigos na página, processa o conteúdo entre eles
@@ -72,35 +106,215 @@ def process_pdf_with_article_metadata(path: str, pretty_name: str, text_splitter
             # O texto antes do artigo atual ainda pertence ao artigo anterior
             before_article_content = content[start_index:match.start()]
             if before_article_content.strip():
-                chunks = text_splitter.split_text(before_article_content)
-                for chunk_content in chunks:
-                     all_chunks.append(Document(
-                        page_content=chunk_content,
-                        metadata={
-                            "source": path, "pretty_name": pretty_name, 
-                            "article": current_article_text, "page": page_number
-                        }
-                    ))
-            
+                for doc in make_chunks(before_article_content, current_article_text, page_number):
+                    total_chunks += 1
+                    yield doc
+
             # Atualiza o artigo atual
             current_article_text = match.group(1).strip()
             start_index = match.start()
 
             # Se este for o último artigo encontrado na página, o resto da página pertence a ele
             if i == len(matches) - 1:
-                 remaining_content = content[start_index:]
-                 chunks = text_splitter.split_text(remaining_content)
-                 for chunk_content in chunks:
-                     all_chunks.append(Document(
-                        page_content=chunk_content,
-                        metadata={
-                            "source": path, "pretty_name": pretty_name, 
-                            "article": current_article_text, "page": page_number
-                        }
-                    ))
-
-    print(f"Documento '{pretty_name}' dividido em {len(all_chunks)} chunks com metadados de artigo.")
-    return all_chunks
+                for doc in make_chunks(content[start_index:], current_article_text, page_number):
+                    total_chunks += 1
+                    yield doc
+
+    print(f"Documento '{pretty_name}' dividido em {total_chunks} chunks com metadados de artigo.")
+
+def chunk_identity(doc: Document, occurrences: dict):
+    """
+    Calcula o id estável de um chunk a partir de (fonte, página, hash do conteúdo).
+    Chunks idênticos na mesma página recebem um contador de ocorrência,
+    mantido em `occurrences` ao longo do stream de uma mesma ingestão.
+    Retorna (hash do chunk, id do vetor).
+    """
+    source = doc.metadata["source"]
+    page = doc.metadata["page"]
+    chunk_hash = hashlib.sha256(
+        f"{doc.metadata.get('article', '')}\n{doc.page_content}".encode("utf-8")
+    ).hexdigest()
+
+    key = (source, page, chunk_hash)
+    occurrence = occurrences.get(key, 0)
+    occurrences[key] = occurrence + 1
+
+    doc_id = hashlib.sha1(f"{source}|{page}|{chunk_hash}|{occurrence}".encode("utf-8")).hexdigest()
+    return chunk_hash, doc_id
+
+def create_text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def _parse_source_worker(path: str, pretty_name: str, chunk_queue, batch_size: int):
+    """
+    Roda num processo do pool: processa um PDF e envia seus chunks para a fila
+    em lotes. Sempre sinaliza o fim da fonte, mesmo em caso de erro (o erro
+    em si chega ao processo principal pelo future).
+    """
+    try:
+        batch = []
+        for doc in process_pdf_with_article_metadata(path, pretty_name, create_text_splitter()):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                chunk_queue.put(batch)  # bloqueia se a fila estiver cheia (backpressure)
+                batch = []
+        if batch:
+            chunk_queue.put(batch)
+    finally:
+        chunk_queue.put(None)
+
+def stream_chunks(sources, workers: int, queue_size: int = QUEUE_SIZE):
+    """
+    Gera os chunks de todas as fontes, processando os PDFs em paralelo num pool
+    de processos. Os chunks passam por uma fila limitada: se o embedding ficar
+    para trás, os workers esperam em vez de acumular o corpus na memória.
+    O paralelismo é por documento, já que o artigo corrente atravessa as páginas.
+    """
+    if workers <= 1 or len(sources) <= 1:
+        text_splitter = create_text_splitter()
+        for path, pretty_name in sources:
+            yield from process_pdf_with_article_metadata(path, pretty_name, text_splitter)
+        return
+
+    # spawn: o processo principal já carregou o torch, que não convive bem com fork
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        chunk_queue = manager.Queue(maxsize=queue_size)
+        futures = [
+            pool.submit(_parse_source_worker, path, pretty_name, chunk_queue, PARSE_BATCH_SIZE)
+            for path, pretty_name in sources
+        ]
+        try:
+            yield from drain_chunk_queue(chunk_queue, futures)
+        except BaseException:
+            # Workers parados num put da fila cheia travariam o encerramento do pool;
+            # sem o manager, o put falha e eles terminam
+            pool.shutdown(wait=False, cancel_futures=True)
+            manager.shutdown()
+            raise
+
+def drain_chunk_queue(chunk_queue, futures, poll_seconds: float = QUEUE_POLL_SECONDS):
+    """
+    Consome os lotes da fila até receber o fim de cada fonte. A espera é
+    limitada: a cada poll_seconds sem lote, confere os workers, já que um
+    processo morto (ex.: OOM) nunca envia o fim e a ingestão travaria.
+    """
+    remaining = len(futures)
+    while remaining:
+        try:
+            batch = chunk_queue.get(timeout=poll_seconds)
+        except queue.Empty:
+            _check_workers(futures)
+            continue
+        if batch is None:
+            remaining -= 1
+            continue
+        yield from batch
+    for future in futures:
+        future.result()  # propaga erros de parsing
+
+def _check_workers(futures):
+    """Propaga a falha de um worker; erro se todos terminaram sem enviar o fim de cada fonte."""
+    for future in futures:
+        if future.done() and future.exception() is not None:
+            raise future.exception()
+    if all(future.done() for future in futures):
+        raise RuntimeError("Os workers de parsing terminaram sem sinalizar o fim de todas as fontes.")
+
+class BatchEmbedder:
+    """
+    Embute textos em lotes com o modelo de embeddings configurado.
+    Com processes > 1 e o backend PyTorch, usa o pool multiprocesso do
+    sentence-transformers (start_multi_process_pool/encode_multi_process); os
+    vetores são os mesmos de embed_documents, com o mesmo pré-processamento e
+    encode_kwargs. O backend ONNX paraleliza dentro do próprio processo (ONNX_THREADS).
+    """
+
+    def __init__(self, embeddings_model: Embeddings, processes: int = 1):
+        self.embeddings_model = embeddings_model
+        if processes > 1 and not hasattr(embeddings_model, "encode_kwargs"):
+            print("AVISO: --embed-processes só vale para o backend torch; usando 1 processo.")
+            processes = 1
+        self.processes = processes
+        self.pool = None
+
+    def __enter__(self):
+        if self.processes > 1:
+            client = self._client()
+            self.pool = client.start_multi_process_pool(target_devices=["cpu"] * self.processes)
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self._client().stop_multi_process_pool(self.pool)
+            self.pool = None
+
+    def _client(self):
+        # langchain_huggingface guarda o SentenceTransformer em _client
+        return getattr(self.embeddings_model, "_client", None) or self.embeddings_model.client
+
+    def embed(self, texts):
+        if self.pool is None:
+            return self.embeddings_model.embed_documents(texts)
+        # Mesmo pré-processamento de HuggingFaceEmbeddings.embed_documents
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = self._client().encode_multi_process(texts, self.pool, **self.embeddings_model.encode_kwargs)
+        return vectors.tolist()
+
+def add_batch(db, embeddings_model, embedder: BatchEmbedder, batch):
+    """Embute um lote de (id, chunk) e adiciona os vetores ao índice (criando-o se preciso)."""
+    ids = [doc_id for doc_id, _ in batch]
+    texts = [doc.page_content for _, doc in batch]
+    metadatas = [doc.metadata for _, doc in batch]
+    text_embeddings = list(zip(texts, embedder.embed(texts)))
+
+    if db is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings_model, metadatas=metadatas, ids=ids)
+    db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return db
+
+def source_aliases():
+    """Nomes pelos quais cada fonte é citada nas consultas (para o índice de artigos)."""
+    return {
+        os.path.join(DATA_PATH, source["name"]): [source["pretty_name"], *source.get("aliases", [])]
+        for source in SOURCES
+    }
+
+def report_changes_by_source(manifest, previous_manifest, added_ids, current_ids):
+    """Resumo por fonte, comparando o manifesto anterior com o atual."""
+    for source in sorted({row[0] for row in manifest} | {row[0] for row in previous_manifest.values()}):
+        source_added = sum(1 for row in manifest if row[0] == source and row[3] in added_ids)
+        source_removed = sum(1 for row in previous_manifest.values() if row[0] == source and row[3] not in current_ids)
+        if source_added or source_removed:
+            print(f"  {source}: +{source_added} / -{source_removed} chunks")
+
+def report_peak_memory():
+    """
+    Imprime o pico de memória residente (RSS) da ingestão: o do processo principal
+    (embedding + índice) e o maior entre os processos filhos (parsing dos PDFs).
+    """
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    main_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20
+    print(f"Pico de RSS: processo principal {main_rss:.0f} MiB | maior processo filho {children_rss:.0f} MiB")
+
+def build_search_index(db, index_type: str, params: dict):
+    """
+    Índice aproximado (HNSW, IVF-Flat ou IVF-PQ) gravado ao lado do index.faiss.
+    O índice plano continua sendo salvo: ele é a fonte dos vetores (MMR,
+    quase-duplicados) e das atualizações incrementais; o aproximado só responde
+    às buscas. Com "flat", um índice aproximado antigo é removido.
+    """
+    if index_type == "flat":
+        remove_ann_index(DB_FAISS_PATH)
+        return
+    print(f"Construindo o índice aproximado ({index_type})...")
+    start = time.perf_counter()
+    index = build_ann_index(db.index, index_type, **params)
+    save_ann_index(index, DB_FAISS_PATH, index_type, {key: value for key, value in params.items() if value is not None})
+    size_mb = os.path.getsize(os.path.join(DB_FAISS_PATH, ANN_FILENAME)) / 1024 ** 2
+    print(f"Índice {index_type} com {index.ntotal} vetores construído em {time.perf_counter() - start:.1f} s ({size_mb:.1f} MB)")
 
 def download_files():
     """
@@ -141,50 +355,143 @@ def download_files():
             print(f"Arquivo '{source['name']}' já existe. Pulando o download.")
 
 
-def create_vector_db():
+def create_vector_db(workers: int = 1, batch_size: int = INDEX_BATCH_SIZE, encode_batch_size: int = ENCODE_BATCH_SIZE, embed_processes: int = 1,
+                     index_type: str = "flat", ann_params: dict = None):
     """
-    Cria o banco de dados de vetores a partir dos PDFs na pasta de dados,
+    Cria (ou atualiza) o banco de dados de vetores a partir dos PDFs na pasta de dados,
     usando a lógica de processamento de metadados de artigo.
+
+    Pipeline: os PDFs são processados em paralelo (`workers` processos) e os chunks
+    chegam por uma fila limitada; só os chunks que não estão no manifesto da última
+    ingestão são embutidos, em lotes de `batch_size`, e cada lote é adicionado ao
+    índice assim que fica pronto. Com index_type diferente de "flat", um índice
+    aproximado é construído a partir do plano ao final (ver build_search_index).
     """
     print("\nIniciando a criação do banco de dados de vetores...")
 
-    # Instancia o text_splitter que vamos usar para todos os documentos
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-    
-    final_documents_with_metadata = []
-
-    # Itera sobre nossas fontes definidas em SOURCES
+    sources = []
     for source in SOURCES:
         file_path = os.path.join(DATA_PATH, source["name"])
         if os.path.exists(file_path):
-            # Usa nossa nova função de processamento inteligente
-            processed_docs = process_pdf_with_article_metadata(
-                path=file_path,
-                pretty_name=source["pretty_name"],
-                text_splitter=text_splitter
-            )
-            final_documents_with_metadata.extend(processed_docs)
+            sources.append((file_path, source["pretty_name"]))
         else:
             print(f"AVISO: Arquivo {source['name']} não encontrado. Pulando a indexação.")
 
-    if not final_documents_with_metadata:
+    if not sources:
         print("Nenhum documento foi processado. Verifique a pasta de dados e os arquivos.")
         return
-        
-    print(f"\nTotal de {len(final_documents_with_metadata)} chunks de texto criados com metadados.")
 
-    embeddings_model = HuggingFaceEmbeddings(
-        model_name='thenlper/gte-small',
-        model_kwargs={'device': 'cpu'}
-    )
+    # EMBEDDING_BACKEND (torch, onnx ou onnx_int8) vem do config/.env
+    load_env()
+    embeddings_model = create_embeddings(batch_size=encode_batch_size)
+
+    db = load_vector_store_for_update(DB_FAISS_PATH, embeddings_model)
+    if db is None:
+        print("Criando o índice FAISS e indexando os documentos... Isso pode levar alguns minutos.")
+        existing_ids = set()
+        previous_manifest = {}
+    else:
+        print("Índice existente encontrado. Atualizando apenas os chunks alterados...")
+        existing_ids = set(db.index_to_docstore_id.values())
+        previous_manifest = read_manifest(DB_FAISS_PATH)
+
+    manifest = []
+    occurrences = {}
+    added_ids = set()
+    pending = []
+    embed_seconds = 0.0
+    start = time.perf_counter()
+
+    with BatchEmbedder(embeddings_model, processes=embed_processes) as embedder, tqdm(unit="chunk", desc="Embutindo") as pbar:
+        def flush():
+            nonlocal db, embed_seconds
+            batch_start = time.perf_counter()
+            db = add_batch(db, embeddings_model, embedder, pending)
+            embed_seconds += time.perf_counter() - batch_start
+            added_ids.update(doc_id for doc_id, _ in pending)
+            pbar.update(len(pending))
+            pending.clear()
 
-    print("Criando o índice FAISS e indexando os documentos... Isso pode levar alguns minutos.")
-    db = FAISS.from_documents(final_documents_with_metadata, embeddings_model)
+        for doc in stream_chunks(sources, workers):
+            chunk_hash, doc_id = chunk_identity(doc, occurrences)
+            manifest.append((doc.metadata["source"], doc.metadata["page"], chunk_hash, doc_id))
+            if doc_id in existing_ids:
+                continue
+            pending.append((doc_id, doc))
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
 
-    os.makedirs(DB_FAISS_PATH, exist_ok=True)
-    db.save_local(DB_FAISS_PATH)
+    if not manifest:
+        print("Nenhum documento foi processado. Verifique a pasta de dados e os arquivos.")
+        return
+
+    elapsed = time.perf_counter() - start
+    print(f"\nTotal de {len(manifest)} chunks de texto criados com metadados.")
+
+    current_ids = {row[3] for row in manifest}
+    removed_ids = [doc_id for doc_id in existing_ids if doc_id not in current_ids]
+    report_changes_by_source(manifest, previous_manifest, added_ids, current_ids)
+    if removed_ids:
+        db.delete(removed_ids)
+
+    # Formato sem pickle: index.faiss (lido via mmap) + docstore.sqlite (com o manifesto)
+    save_vector_store(db, DB_FAISS_PATH, manifest=manifest, source_aliases=source_aliases())
+    build_search_index(db, index_type, ann_params or {})
+    print(
+        f"Chunks reaproveitados: {len(current_ids & existing_ids)} | "
+        f"adicionados: {len(added_ids)} | removidos: {len(removed_ids)}"
+    )
+    if added_ids:
+        print(
+            f"Embedding: {len(added_ids) / embed_seconds:.1f} chunks/s | "
+            f"pipeline completo: {len(manifest) / elapsed:.1f} chunks/s ({elapsed:.1f} s)"
+        )
     print(f"Banco de dados de vetores salvo em: {DB_FAISS_PATH}")
+    report_peak_memory()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingestão dos PDFs e criação do índice FAISS.")
+    parser.add_argument("--workers", type=int, default=min(len(SOURCES), os.cpu_count() or 1),
+                        help="processos para o parsing dos PDFs (um PDF por processo)")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE,
+                        help="chunks embutidos e adicionados ao índice por lote")
+    parser.add_argument("--encode-batch-size", type=int, default=ENCODE_BATCH_SIZE,
+                        help="batch_size repassado ao sentence-transformers (ou ao ONNX Runtime)")
+    parser.add_argument("--embed-processes", type=int, default=1,
+                        help="processos do pool multiprocesso de embedding (1 = processo atual)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="índice de busca: flat (exato) ou aproximado (hnsw, ivf_flat, ivf_pq)")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="listas invertidas do IVF (padrão: ~4*sqrt(N))")
+    parser.add_argument("--pq-m", type=int, default=16,
+                        help="subquantizadores do IVF-PQ (precisa dividir a dimensão, 384)")
+    parser.add_argument("--pq-nbits", type=int, default=8,
+                        help="bits por código do IVF-PQ")
+    parser.add_argument("--hnsw-m", type=int, default=32,
+                        help="vizinhos por nó do HNSW")
+    parser.add_argument("--ef-construction", type=int, default=80,
+                        help="efConstruction do HNSW")
+    parser.add_argument("--train-size", type=int, default=None,
+                        help="vetores amostrados para treinar o IVF (padrão: 39 por centróide)")
+    return parser.parse_args()
 
 if __name__ == '__main__':
+    args = parse_args()
     download_files()
-    create_vector_db()
\ No newline at end of file
+    create_vector_db(
+        workers=args.workers,
+        batch_size=args.batch_size,
+        encode_batch_size=args.encode_batch_size,
+        embed_processes=args.embed_processes,
+        index_type=args.index_type,
+        ann_params={
+            "nlist": args.nlist,
+            "pq_m": args.pq_m,
+            "pq_nbits": args.pq_nbits,
+            "hnsw_m": args.hnsw_m,
+            "ef_construction": args.ef_construction,
+            "train_size": args.train_size,
+        },
+    )
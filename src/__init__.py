@@ -1,3 +1,11 @@
 from .agents import *
 from .utils import *
-from .graph import build_graph
\ No newline at end of file
+
+# O grafo (LangGraph) só é importado quando usado, mantendo 'import src' leve
+_GRAPH_EXPORTS = {"build_graph", "build_async_graph", "stream_graph", "astream_graph"}
+
+def __getattr__(name):
+    if name in _GRAPH_EXPORTS:
+        from . import graph
+        return getattr(graph, name)
+    raise AttributeError(f"module 'src' has no attribute '{name}'")
\ No newline at end of file
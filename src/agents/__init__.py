@@ -1,7 +1,19 @@
-from .query_expander import expand_query
+from .query_expander import expand_query, aexpand_query
 from .retriever import retriever_agent
-from .answerer import generate_answer
-from .self_checker import check_faithfulness, FaithfulnessCheck
+from .answerer import generate_answer, agenerate_answer, format_docs_for_answerer
+from .answerer import correct_answer, acorrect_answer, extractive_answer
+from .self_checker import check_faithfulness, acheck_faithfulness, FaithfulnessCheck, self_check_stats, rules_only_check
 from .safety import apply_disclaimer
-from .supervisor import supervise_question, supervisor_agent
-from .rephrase import rephrase_agent
\ No newline at end of file
+from .supervisor import supervise_question, asupervise_question, quick_supervise_question, rules_need_clarification, supervisor_agent
+from .rephrase import rephrase_agent
+from .reranker import reranker_agent, reranker_enabled
+
+
+def warmup():
+    """
+    Inicializa explicitamente os singletons (modelo de embeddings, índice FAISS,
+    clientes LLM e, se configurado, o reranker). Servidores devem chamar no boot
+    para que a primeira pergunta não pague a carga dos modelos.
+    """
+    for agent in (retriever_agent, supervisor_agent, rephrase_agent, reranker_agent):
+        agent.resolve()
\ No newline at end of file
@@ -2,7 +2,7 @@ import sys
 from pathlib import Path
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 
 src_path = str(Path(__file__).resolve().parent)
@@ -10,25 +10,19 @@ if src_path not in sys.path:
     sys.path.append(src_path)
     
 from utils import create_llm
+from utils.article_index import article_number
+from utils.context_builder import build_context
 
-def format_docs_for_answerer(docs: List[Document]) -> str:
+def format_docs_for_answerer(docs: List[Document], question: str = "") -> str:
     """
-    Helper para formatar documentos, usando o 'pretty_name' dos metadados.
+    Helper para formatar documentos, usando o 'pretty_name' e o artigo dos metadados.
+    Respeita o orçamento de tokens do provedor/modelo (ver utils/context_builder.py):
+    chunks do mesmo artigo são unidos e blocos longos são cortados por sentença.
     """
-    output = []
-    for doc in docs:
-        # Tenta buscar o 'pretty_name'; se falhar, usa o nome do ficheiro 'source'
-        pretty_name = doc.metadata.get('pretty_name', Path(doc.metadata.get('source', 'N/A')).name)
-        output.append(
-            f"--- Documento Fonte: {pretty_name} ---\n{doc.page_content}"
-        )
-    return "\n\n".join(output)
+    return build_context(docs, question)
 
 
-def generate_answer(question: str, documents: List[Document]) -> str:
-    llm = create_llm()
-
-    prompt_template = """
+ANSWER_PROMPT = """
     Você é um assistente jurídico especializado em Direito do Consumidor. Sua tarefa é analisar situações práticas e fornecer orientação baseada na legislação brasileira.
 
     METODOLOGIA DE ANÁLISE OBRIGATÓRIA:
@@ -62,15 +56,98 @@ def generate_answer(question: str, documents: List[Document]) -> str:
     
     RESPOSTA ESTRUTURADA:
     """
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    
-    context_string = format_docs_for_answerer(documents)
-    
-    chain = prompt | llm | StrOutputParser()
+
+def _answer_chain():
+    prompt = ChatPromptTemplate.from_template(ANSWER_PROMPT)
+    return prompt | create_llm() | StrOutputParser()
+
+
+def generate_answer(question: str, documents: List[Document], context: Optional[str] = None) -> str:
+    """
+    Gera a resposta. `context` permite reaproveitar o contexto já montado
+    (o grafo monta uma vez e o self-checker usa o mesmo texto).
+    """
+    chain = _answer_chain()
     
     response = chain.invoke({
         "question": question,
-        "context": context_string
+        "context": context if context is not None else format_docs_for_answerer(documents, question)
     })
     
-    return response
\ No newline at end of file
+    return response
+
+
+async def agenerate_answer(question: str, documents: List[Document], context: Optional[str] = None) -> str:
+    """Versão assíncrona de generate_answer."""
+    chain = _answer_chain()
+    
+    return await chain.ainvoke({
+        "question": question,
+        "context": context if context is not None else format_docs_for_answerer(documents, question)
+    })
+
+
+CORRECTION_PROMPT = """
+    Você é um assistente jurídico revisando a própria resposta. Algumas citações
+    da RESPOSTA ANTERIOR não correspondem aos artigos do contexto.
+
+    PROBLEMAS ENCONTRADOS NAS CITAÇÕES:
+    {issues}
+
+    REGRAS DA REVISÃO:
+    - Mantenha a mesma estrutura e o que estiver correto na resposta anterior
+    - Corrija ou remova cada citação listada acima, usando SOMENTE artigos presentes no contexto
+    - Para CADA norma mencionada: [Fonte: Nome do Documento, Art. XX]
+
+    CONTEXTO LEGISLATIVO:
+    {context}
+
+    PERGUNTA DO USUÁRIO:
+    {question}
+
+    RESPOSTA ANTERIOR:
+    {answer}
+
+    RESPOSTA REVISADA:
+    """
+
+def _correction_chain():
+    prompt = ChatPromptTemplate.from_template(CORRECTION_PROMPT)
+    return prompt | create_llm() | StrOutputParser()
+
+
+def correct_answer(question: str, answer: str, issues: str, context: str) -> str:
+    """
+    Passada única de correção das citações: o contexto já inclui o texto real
+    dos artigos citados que faltavam (ver graph.correct_citations_node).
+    """
+    return _correction_chain().invoke({"question": question, "answer": answer, "issues": issues, "context": context})
+
+
+async def acorrect_answer(question: str, answer: str, issues: str, context: str) -> str:
+    """Versão assíncrona de correct_answer."""
+    return await _correction_chain().ainvoke({"question": question, "answer": answer, "issues": issues, "context": context})
+
+
+def extractive_answer(question: str, documents: List[Document], max_documents: int = 3, max_chars: int = 400) -> str:
+    """
+    Resposta determinística, sem LLM, para quando o prazo da requisição acaba
+    antes do answerer: os trechos mais relevantes recuperados, cada um com a
+    citação no formato [Fonte: Nome do Documento, Art. XX].
+    """
+    if not documents:
+        return "Não consegui gerar a resposta a tempo e nenhum documento relevante foi encontrado."
+    excerpts = []
+    for doc in documents[:max_documents]:
+        text = " ".join(doc.page_content.split())
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + "..."
+        number = article_number(doc.metadata.get("article", ""))
+        source = doc.metadata.get("pretty_name", "Documento")
+        citation = f"[Fonte: {source}, Art. {number}]" if number else f"[Fonte: {source}]"
+        excerpts.append(f"- {text} {citation}")
+    return (
+        "**Fundamento Legal:** Não houve tempo para elaborar a análise; "
+        "seguem os dispositivos mais relevantes encontrados para a sua pergunta:\n"
+        + "\n".join(excerpts)
+    )
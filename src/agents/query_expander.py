@@ -8,15 +8,12 @@ src_path = str(Path(__file__).parent.parent)
 if src_path not in sys.path:
     sys.path.append(src_path)
 from utils import create_llm
+from utils.memo import get_memo
+from utils.tracing import get_logger
 
-def expand_query(question: str) -> List[str]:
-    """
-    Pega na pergunta original do utilizador e gera 3 consultas de busca alternativas
-    para melhorar a recuperação de documentos, incluindo termos legais relacionados.
-    """
-    llm = create_llm()
+logger = get_logger("query_expander")
 
-    prompt_template = """
+EXPAND_QUERY_PROMPT = """
 Você é um gerador de consultas para busca densa em legislação brasileira (CDC).
 Regras obrigatórias:
 - Retorne exatamente 3 consultas curtas (3–6 palavras), uma por linha.
@@ -30,21 +27,51 @@ Pergunta:
 
 Saída:
 """
-    
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    
+
+_memo = get_memo("query_expander", EXPAND_QUERY_PROMPT)
+
+def _expansion_chain():
+    prompt = ChatPromptTemplate.from_template(EXPAND_QUERY_PROMPT)
     # Esta cadeia gera uma única string com 3 linhas
-    expansion_chain = prompt | llm | StrOutputParser()
-    
-    result_string = expansion_chain.invoke({"question": question})
-    
-    
+    return prompt | create_llm() | StrOutputParser()
+
+def _parse_queries(result_string: str) -> List[str]:
     # Divide a string em uma lista de consultas
     queries = result_string.strip().split('\n')
     cleaned_queries = [q.lstrip("0123456789. \t") for q in queries if q]
     
-    # Adiciona a pergunta original à lista também, por segurança
-    final_queries = list(set(cleaned_queries))
+    # Remove duplicados
+    return list(set(cleaned_queries))
+
+def expand_query(question: str) -> List[str]:
+    """
+    Pega na pergunta original do utilizador e gera 3 consultas de busca alternativas
+    para melhorar a recuperação de documentos, incluindo termos legais relacionados.
+    """
+    cached = _memo.get(question)
+    if cached is not None:
+        logger.info("CONSULTAS EXPANDIDAS (memo): %s", cached)
+        return list(cached)
+
+    result_string = _expansion_chain().invoke({"question": question})
+    final_queries = _parse_queries(result_string)
+    
+    _memo.set(question, final_queries)
+    
+    logger.info("CONSULTAS EXPANDIDAS: %s", final_queries)
+    return final_queries
+
+async def aexpand_query(question: str) -> List[str]:
+    """Versão assíncrona de expand_query."""
+    cached = _memo.get(question)
+    if cached is not None:
+        logger.info("CONSULTAS EXPANDIDAS (memo): %s", cached)
+        return list(cached)
+
+    result_string = await _expansion_chain().ainvoke({"question": question})
+    final_queries = _parse_queries(result_string)
+    
+    _memo.set(question, final_queries)
     
-    print(f"--- CONSULTAS EXPANDIDAS: {final_queries} ---")
-    return final_queries # Remove duplicados e retorna
\ No newline at end of file
+    logger.info("CONSULTAS EXPANDIDAS: %s", final_queries)
+    return final_queries
@@ -10,6 +10,17 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 from utils import create_llm
+from utils.memo import get_memo
+from utils.lazy import LazyProxy
+
+REPHRASE_PROMPT = """
+Reescreva a pergunta abaixo em português jurídico claro e objetivo, mantendo o mesmo sentido.
+Regras:
+- 1 frase, até 25 palavras.
+- Sem listas, sem explicações, sem aspas.
+Pergunta: {question}
+Saída:
+""".strip()
 
 class SimpleRephraser:
     """
@@ -21,25 +32,42 @@ class SimpleRephraser:
         self.llm = create_llm()
         # Tornar a geração mais rápida e estável
         
-        self.prompt = ChatPromptTemplate.from_template(
-            """
-Reescreva a pergunta abaixo em português jurídico claro e objetivo, mantendo o mesmo sentido.
-Regras:
-- 1 frase, até 25 palavras.
-- Sem listas, sem explicações, sem aspas.
-Pergunta: {question}
-Saída:
-""".strip()
-        )
+        self.prompt = ChatPromptTemplate.from_template(REPHRASE_PROMPT)
         self.chain = self.prompt | self.llm | StrOutputParser()
+        self.memo = get_memo("rephrase", REPHRASE_PROMPT)
 
     def rephrase(self, question: str) -> str:
-        text = self.chain.invoke({"question": question}).strip()
+        cached = self.memo.get(question)
+        if cached is not None:
+            return cached
+
+        text = self.chain.invoke({"question": question})
+        return self._finalize(question, text)
+
+    async def arephrase(self, question: str) -> str:
+        """Versão assíncrona de rephrase."""
+        cached = self.memo.get(question)
+        if cached is not None:
+            return cached
+
+        text = await self.chain.ainvoke({"question": question})
+        return self._finalize(question, text)
+
+    def fallback(self, question: str) -> str:
+        """Sem chamada ao LLM (prazo curto): reformulação memoizada ou a própria pergunta."""
+        cached = self.memo.get(question)
+        if cached is not None:
+            return cached
+        line = " ".join(question.split()).rstrip(".!")
+        return line if line.endswith("?") else line + "?"
+
+    def _finalize(self, question: str, text: str) -> str:
         # Pega a primeira linha e higieniza
-        line = text.splitlines()[0].strip().strip('"').strip("'")
+        line = text.strip().splitlines()[0].strip().strip('"').strip("'")
         if not line.endswith("?"):
             line += "?"
+        self.memo.set(question, line)
         return line
 
-# Instância singleton compatível com import existente
-rephrase_agent = SimpleRephraser()
+# Instância singleton compatível com import existente (inicializada no primeiro uso ou no warmup)
+rephrase_agent = LazyProxy(SimpleRephraser, "rephrase_agent")
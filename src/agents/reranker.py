@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+
+src_path = str(Path(__file__).parent.parent)
+if src_path not in sys.path:
+    sys.path.append(src_path)
+from utils import load_env
+from utils.executor import run_blocking
+from utils.lazy import LazyProxy
+from utils.memo import normalize_question
+from utils.tokens import estimate_prefill_seconds, estimate_tokens
+
+
+def reranker_enabled() -> bool:
+    """O reranker é opcional: só entra no grafo com RERANKER_MODEL definido."""
+    load_env()
+    return bool(os.getenv("RERANKER_MODEL"))
+
+
+class CrossEncoderReranker:
+    """
+    Reordena os chunks recuperados com um cross-encoder (CPU) que pontua cada
+    par (pergunta, chunk), mantendo só os top_n melhores dentro de um orçamento
+    de tokens. Scores ficam em cache por (hash da pergunta, id do chunk), então
+    chunks já vistos para a mesma pergunta não voltam ao modelo.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, top_n: int = 4, token_budget: int = 1500, cache_size: int = 4096):
+        # Import pesado (sentence-transformers/torch) só na construção
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.top_n = top_n
+        self.token_budget = token_budget
+        self.cache_size = cache_size
+
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.scored_pairs = 0
+        self.cached_pairs = 0
+        self.total_seconds = 0.0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def _chunk_id(doc: Document) -> str:
+        return doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    def score(self, question: str, documents: List[Document]) -> List[float]:
+        """Score de cada documento para a pergunta; só os pares fora do cache vão ao modelo."""
+        question_hash = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:16]
+        keys = [(question_hash, self._chunk_id(doc)) for doc in documents]
+
+        with self._lock:
+            scores = {key: self._scores[key] for key in keys if key in self._scores}
+        missing = [(key, doc) for key, doc in zip(keys, documents) if key not in scores]
+
+        if missing:
+            pairs = [(question, doc.page_content) for _, doc in missing]
+            predicted = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            with self._lock:
+                for (key, _), value in zip(missing, predicted):
+                    scores[key] = float(value)
+                    self._scores[key] = float(value)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        with self._lock:
+            self.scored_pairs += len(missing)
+            self.cached_pairs += len(documents) - len(missing)
+        return [scores[key] for key in keys]
+
+    def rerank(self, question: str, documents: List[Document]) -> Tuple[List[Document], dict]:
+        """
+        Devolve os documentos mantidos (do maior para o menor score) e um relatório
+        com a latência adicionada e os tokens/prefill estimados economizados.
+        """
+        start = time.perf_counter()
+        scores = self.score(question, documents) if documents else []
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)
+
+        kept = []
+        kept_tokens = 0
+        for doc, _ in ranked[:self.top_n]:
+            tokens = estimate_tokens(doc.page_content)
+            # O melhor chunk sempre entra, mesmo acima do orçamento
+            if kept and kept_tokens + tokens > self.token_budget:
+                break
+            kept.append(doc)
+            kept_tokens += tokens
+
+        elapsed = time.perf_counter() - start
+        input_tokens = sum(estimate_tokens(doc.page_content) for doc in documents)
+        saved_tokens = input_tokens - kept_tokens
+        report = {
+            "candidates": len(documents),
+            "kept": len(kept),
+            "latency_ms": elapsed * 1000,
+            "input_tokens": input_tokens,
+            "kept_tokens": kept_tokens,
+            "saved_tokens": saved_tokens,
+            "estimated_prefill_saved_ms": estimate_prefill_seconds(saved_tokens) * 1000,
+        }
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += elapsed
+            self.tokens_saved += saved_tokens
+        return kept, report
+
+    async def arerank(self, question: str, documents: List[Document]) -> Tuple[List[Document], dict]:
+        """Versão assíncrona: o cross-encoder é CPU-bound e roda no pool de threads limitado."""
+        return await run_blocking(self.rerank, question, documents)
+
+    def stats(self) -> dict:
+        total_pairs = self.scored_pairs + self.cached_pairs
+        return {
+            "calls": self.calls,
+            "avg_latency_ms": self.total_seconds * 1000 / self.calls if self.calls else 0.0,
+            "score_cache_hit_rate": self.cached_pairs / total_pairs if total_pairs else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "estimated_prefill_saved_ms": estimate_prefill_seconds(self.tokens_saved) * 1000,
+        }
+
+
+def create_reranker() -> Optional[CrossEncoderReranker]:
+    """Cria o reranker a partir do config/.env (None se RERANKER_MODEL não estiver definido)."""
+    if not reranker_enabled():
+        return None
+    return CrossEncoderReranker(
+        model_name=os.getenv("RERANKER_MODEL"),
+        batch_size=int(os.getenv("RERANKER_BATCH_SIZE", "16")),
+        top_n=int(os.getenv("RERANKER_TOP_N", "4")),
+        token_budget=int(os.getenv("RERANKER_TOKEN_BUDGET", "1500")),
+        cache_size=int(os.getenv("RERANKER_CACHE_SIZE", "4096")),
+    )
+
+# --- Singleton (inicializado no primeiro uso ou no warmup) ---
+reranker_agent = LazyProxy(create_reranker, "reranker_agent")
@@ -1,45 +1,402 @@
+import hashlib
+import os
+import sys
+from dataclasses import dataclass, replace
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from langchain_core.documents import Document
 
+src_path = str(Path(__file__).parent.parent)
+if src_path not in sys.path:
+    sys.path.append(src_path)
+from utils import load_env
+from utils.diversity import collapse_near_duplicates, mmr_select, normalize_rows
+from utils.executor import run_blocking
+from utils.lazy import LazyProxy
+from utils.query_cache import QueryEmbeddingCache, normalize_query
+from utils.sparse_index import reciprocal_rank_fusion, weighted_fusion
+from utils.tracing import StageTimings, get_logger
+
+logger = get_logger("retriever")
+
+# dense: só FAISS | sparse: só BM25 | hybrid: fusão dos dois rankings
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+@dataclass
+class RetrievalConfig:
+    """
+    Quantos e quais documentos cada busca devolve. As etapas por vetor
+    (MMR, similaridade mínima e colapso de quase-duplicados) usam os vetores
+    já presentes no índice FAISS, sem embutir os chunks de novo.
+    """
+    k: int = 2                     # documentos por consulta
+    fetch_k: int = 10              # candidatos por consulta antes da fusão/MMR
+    max_documents: int = 6         # teto de documentos por chamada (0 = sem teto)
+    mmr_lambda: float = 1.0        # 1 = só relevância (desligado); 0 = só diversidade
+    min_similarity: float = 0.0    # cosseno mínimo consulta-chunk (0 = desligado)
+    max_per_source: int = 0        # quota de documentos por fonte (0 = sem quota)
+    dedup_threshold: float = 1.0   # cosseno a partir do qual dois chunks são quase-duplicados (1 = desligado)
+
+    @classmethod
+    def from_env(cls) -> "RetrievalConfig":
+        config = cls(
+            k=int(os.getenv("RETRIEVAL_K", cls.k)),
+            fetch_k=int(os.getenv("RETRIEVAL_FETCH_K", cls.fetch_k)),
+            max_documents=int(os.getenv("RETRIEVAL_MAX_DOCUMENTS", cls.max_documents)),
+            mmr_lambda=float(os.getenv("RETRIEVAL_MMR_LAMBDA", cls.mmr_lambda)),
+            min_similarity=float(os.getenv("RETRIEVAL_MIN_SIMILARITY", cls.min_similarity)),
+            max_per_source=int(os.getenv("RETRIEVAL_MAX_PER_SOURCE", cls.max_per_source)),
+            dedup_threshold=float(os.getenv("RETRIEVAL_DEDUP_THRESHOLD", cls.dedup_threshold)),
+        )
+        # Com o reranker no grafo, a busca traz mais candidatos para ele escolher
+        if os.getenv("RERANKER_MODEL"):
+            overfetch = int(os.getenv("RERANKER_OVERFETCH", "3"))
+            config.k *= overfetch
+            config.max_documents *= overfetch
+        return config
+
+    def widened(self, k: int) -> "RetrievalConfig":
+        """Cópia com k documentos por consulta e o teto por chamada aumentado na mesma proporção."""
+        max_documents = self.max_documents * k // self.k if self.max_documents > 0 else 0
+        return replace(self, k=k, fetch_k=max(self.fetch_k, k), max_documents=max(max_documents, self.max_documents))
+
+    @property
+    def selects_candidates(self) -> bool:
+        """Se a seleção por consulta precisa de mais candidatos que k."""
+        return self.mmr_lambda < 1 or self.min_similarity > 0
+
+def compute_index_version(db_faiss_path: str) -> str:
+    """
+    Identificador da versão do índice FAISS em disco (nome, tamanho e mtime
+    de cada arquivo). Muda sempre que uma nova ingestão regrava o índice.
+    """
+    digest = hashlib.sha1()
+    for file in sorted(Path(db_faiss_path).iterdir()):
+        stat = file.stat()
+        digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
 class RetrieverAgent:
     
     def __init__(self):
         # --- CONFIGURAÇÃO ---
         project_root = Path(__file__).parent.parent.parent
         db_faiss_path = str(project_root / "vectorstores" / "db_faiss")
-        embedding_model_name = 'thenlper/gte-small'
         # --------------------
+        load_env()
         
-        self.embeddings_model = HuggingFaceEmbeddings(
-            model_name=embedding_model_name,
-            model_kwargs={'device': 'cpu'}
-        )
+        # Imports pesados (sentence-transformers/torch, FAISS) só na construção
+        from utils.ann_index import load_ann_index, tune_ann_index
+        from utils.article_index import ArticleIndex
+        from utils.embeddings import create_embeddings
+        from utils.sparse_index import BM25Index
+        from utils.vector_store import DOCSTORE_FILENAME, load_vector_store
+        
+        # gte-small em PyTorch ou ONNX Runtime, conforme EMBEDDING_BACKEND
+        self.embeddings_model = create_embeddings()
         
-        self.db = FAISS.load_local(
-            db_faiss_path, 
-            self.embeddings_model, 
-            allow_dangerous_deserialization=True
+        # Vetores das consultas já vistas (ex.: consultas expandidas repetidas)
+        self.query_cache = QueryEmbeddingCache(
+            self.embeddings_model.embed_documents,
+            max_entries=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
         )
+        self.timings = StageTimings()
+        
+        # Vetores via mmap e docstore SQLite lido sob demanda (sem pickle)
+        self.db = load_vector_store(db_faiss_path, self.embeddings_model)
+        
+        # Índice aproximado (HNSW/IVF) da ingestão, se houver, responde às buscas;
+        # o plano continua fornecendo os vetores dos chunks. VECTOR_INDEX=flat força o exato.
+        self.search_index, self.search_index_meta = self.db.index, {"index_type": "flat"}
+        if os.getenv("VECTOR_INDEX", "auto") != "flat":
+            ann_index, meta = load_ann_index(
+                db_faiss_path, self.db.index.ntotal, getattr(self.db.docstore, "index_stamp", None)
+            )
+            if ann_index is not None:
+                tune_ann_index(
+                    ann_index,
+                    nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+                    ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+                )
+                self.search_index, self.search_index_meta = ann_index, meta
+        
+        # Índice BM25 gerado na ingestão, no mesmo docstore.sqlite
+        docstore_path = Path(db_faiss_path) / DOCSTORE_FILENAME
+        self.sparse_index = BM25Index(docstore_path) if docstore_path.exists() else None
+        if not (self.sparse_index and self.sparse_index.available):
+            logger.warning("Índice BM25 não encontrado; usando apenas a busca densa. Rode a ingestão novamente.")
         
-        self.retriever = self.db.as_retriever(search_kwargs={'k': 2})
+        # Índice (fonte, artigo) -> chunks para citações explícitas ("art. 39 cdc")
+        self.article_index = ArticleIndex(
+            docstore_path, max_chunks=int(os.getenv("ARTICLE_LOOKUP_MAX_CHUNKS", "4"))
+        ) if docstore_path.exists() else None
+        # auto: consultas que são só a citação dispensam a busca | augment: sempre busca também | off
+        self.article_lookup = os.getenv("ARTICLE_LOOKUP", "auto")
+        
+        self.index_version = compute_index_version(db_faiss_path)
+        
+        self.config = RetrievalConfig.from_env()
+        # Densa por padrão, como a busca original; híbrida/esparsa são opcionais
+        self.default_mode = os.getenv("RETRIEVAL_MODE", "dense")
+        self.fusion = os.getenv("HYBRID_FUSION", "rrf")  # rrf | weighted
+        self.dense_weight = float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5"))
+        self._legacy_positions = None
 
-    def get_relevant_documents(self, queries: List[str]) -> List[Document]:
+    def resolve_mode(self, mode: Optional[str] = None) -> str:
+        mode = mode or self.default_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de busca inválido: {mode!r} (use {', '.join(RETRIEVAL_MODES)})")
+        if mode != "dense" and not (self.sparse_index and self.sparse_index.available):
+            return "dense"
+        return mode
+
+    def get_relevant_documents(self, queries: List[str], mode: Optional[str] = None, k: Optional[int] = None) -> List[Document]:
         """
         Busca documentos para uma LISTA de consultas, junta os resultados e remove duplicados.
         Esta operação é rápida, pois os modelos já estão carregados.
+        mode escolhe a busca desta chamada (dense, sparse ou hybrid); None usa RETRIEVAL_MODE.
+        k amplia (ou reduz) os documentos por consulta só nesta chamada.
+        """
+        return self.search_many([queries], [mode], k=k)[0]
+
+    def search_many(self, query_groups: List[List[str]], modes: Optional[List[Optional[str]]] = None, k: Optional[int] = None) -> List[List[Document]]:
+        """
+        Busca em lote para vários pedidos ao mesmo tempo (também usado pelo
+        micro-batcher do servidor): as consultas fora do cache são embutidas numa
+        única passada do modelo, a matriz de vetores vai numa única chamada a
+        index.search e o resultado é reagrupado e deduplicado por pedido.
+        """
+        modes = [self.resolve_mode(mode) for mode in (modes or [None] * len(query_groups))]
+        flat_queries = [(normalize_query(query), mode) for group, mode in zip(query_groups, modes) for query in group]
+        if not flat_queries:
+            return [[] for _ in query_groups]
+        
+        # Citações explícitas resolvidas pelo índice de artigos; consultas que são
+        # só a citação ("art. 39 cdc") nem passam pelo embedding/FAISS
+        plans = []
+        for query, mode in flat_queries:
+            cited_ids, pure_citation = self._cited_ids(query)
+            needs_search = not (pure_citation and self.article_lookup == "auto")
+            plans.append((query, mode, cited_ids, needs_search))
+        
+        # A busca puramente esparsa não precisa de embedding
+        dense_plans = [(query, mode) for query, mode, _, needs_search in plans if needs_search and mode != "sparse"]
+        with self.timings.measure("embed"):
+            vectors = self.query_cache.embed([query for query, _ in dense_plans])
+        query_vectors = iter(normalize_rows(vectors) if dense_plans else [])
+        
+        # Fusão híbrida e seleção por vetores (MMR, similaridade mínima) precisam de mais candidatos que k
+        config = self.config if k is None else self.config.widened(k)
+        candidates_k = max(config.k, config.fetch_k) if config.selects_candidates else config.k
+        dense_k = max(candidates_k, config.fetch_k) if any(mode == "hybrid" for _, mode in dense_plans) else candidates_k
+        dense_rankings = iter(self._dense_search(vectors, dense_k))
+        
+        ranked = []
+        for query, mode, cited_ids, needs_search in plans:
+            candidate_ids, query_vector = [], None
+            if needs_search:
+                dense_ranking = None
+                if mode != "sparse":
+                    dense_ranking, query_vector = next(dense_rankings), next(query_vectors)
+                candidate_ids = self._rank(query, dense_ranking, mode, config.fetch_k)[:candidates_k]
+            ranked.append((cited_ids, candidate_ids, query_vector, mode))
+        
+        # Vetores de todos os candidatos lidos do índice de uma só vez
+        doc_vectors = self._document_vectors(
+            list(dict.fromkeys(doc_id for cited, candidates, _, _ in ranked for doc_id in cited + candidates))
+        )
+        id_lists = [
+            (cited, self._select(candidates, query_vector, mode, doc_vectors, config))
+            for cited, candidates, query_vector, mode in ranked
+        ]
+        
+        results = []
+        offset = 0
+        for group in query_groups:
+            results.append(self._finalize(id_lists[offset:offset + len(group)], doc_vectors, config))
+            offset += len(group)
+        return results
+
+    def _cited_ids(self, query: str) -> Tuple[List[str], bool]:
+        if self.article_lookup == "off" or not (self.article_index and self.article_index.available):
+            return [], False
+        return self.article_index.resolve(query)
+
+    def _dense_search(self, vectors, k: int) -> List[List[Tuple[str, float]]]:
+        """Uma única busca FAISS para todas as consultas: ranking (id, score) de cada vetor."""
+        if not len(vectors):
+            return []
+        with self.timings.measure("faiss") as span:
+            span.set(queries=len(vectors), k=k)
+            distances, positions = self.search_index.search(vectors, k)
+        
+        with self.timings.measure("docstore"):
+            index_to_id = self.db.index_to_docstore_id
+            # Distância L2: menor = melhor, então o score do ranking é a distância negativa
+            return [
+                [(index_to_id[int(position)], -float(distance)) for distance, position in zip(row_distances, row_positions) if position != -1]
+                for row_distances, row_positions in zip(distances, positions)
+            ]
+
+    def _rank(self, query: str, dense_ranking: Optional[List[Tuple[str, float]]], mode: str, fetch_k: int) -> List[str]:
+        """Ids dos candidatos de uma consulta, do mais ao menos relevante."""
+        if mode == "dense":
+            fused = dense_ranking
+        else:
+            with self.timings.measure("bm25"):
+                sparse_ranking = self.sparse_index.search(query, fetch_k)
+            if mode == "sparse":
+                fused = sparse_ranking
+            elif self.fusion == "weighted":
+                fused = weighted_fusion([dense_ranking, sparse_ranking], [self.dense_weight, 1 - self.dense_weight])
+            else:
+                fused = reciprocal_rank_fusion([dense_ranking, sparse_ranking])
+        return [doc_id for doc_id, _ in fused]
+
+    def _positions(self, doc_ids: List[str]) -> Dict[str, int]:
+        index_to_id = self.db.index_to_docstore_id
+        if hasattr(index_to_id, "positions"):
+            return index_to_id.positions(doc_ids)
+        # Índice legado (dicionário em memória): mapa inverso calculado uma vez
+        if self._legacy_positions is None:
+            self._legacy_positions = {doc_id: position for position, doc_id in index_to_id.items()}
+        return {doc_id: self._legacy_positions[doc_id] for doc_id in doc_ids if doc_id in self._legacy_positions}
+
+    def _document_vectors(self, doc_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Vetores normalizados dos documentos, reconstruídos do índice (sem novo embedding)."""
+        if not doc_ids:
+            return {}
+        with self.timings.measure("vectors"):
+            positions = self._positions(doc_ids)
+            ids = [doc_id for doc_id in doc_ids if doc_id in positions]
+            try:
+                vectors = self.db.index.reconstruct_batch(np.array([positions[doc_id] for doc_id in ids], dtype=np.int64))
+            except RuntimeError:
+                # Índices sem reconstrução: seleção só pela ordem do ranking
+                return {}
+            return dict(zip(ids, normalize_rows(vectors)))
+
+    def _select(self, candidate_ids: List[str], query_vector: Optional[np.ndarray], mode: str, doc_vectors: Dict[str, np.ndarray], config: RetrievalConfig) -> List[str]:
+        """Escolhe k candidatos de uma consulta: similaridade mínima e MMR."""
+        if not config.selects_candidates or not all(doc_id in doc_vectors for doc_id in candidate_ids):
+            return candidate_ids[:config.k]
+        
+        ids = list(candidate_ids)
+        vectors = np.stack([doc_vectors[doc_id] for doc_id in ids]) if ids else np.empty((0, 0), dtype=np.float32)
+        if query_vector is not None and ids:
+            similarity = vectors @ query_vector
+            if config.min_similarity > 0:
+                keep = similarity >= config.min_similarity
+                ids = [doc_id for doc_id, kept in zip(ids, keep) if kept]
+                vectors, similarity = vectors[keep], similarity[keep]
+        if config.mmr_lambda >= 1 or not ids:
+            return ids[:config.k]
+        
+        # Relevância: cosseno na busca densa; na híbrida/BM25, a posição no ranking fundido
+        if mode == "dense":
+            relevance = similarity
+        else:
+            relevance = 1 - np.arange(len(ids), dtype=np.float32) / len(ids)
+        return [ids[index] for index in mmr_select(relevance, vectors, config.k, config.mmr_lambda)]
+
+    def _finalize(self, id_lists: List[Tuple[List[str], List[str]]], doc_vectors: Dict[str, np.ndarray], config: RetrievalConfig) -> List[Document]:
         """
-        all_doc_lists = self.retriever.batch(queries)
+        Junta os resultados de um pedido, cada consulta como (ids citados, ids
+        da busca): quase-duplicados, quotas por fonte e teto global. Os chunks
+        dos artigos citados vêm antes dos da busca.
+        """
+        cited_ids = list(dict.fromkeys(doc_id for cited, _ in id_lists for doc_id in cited))
+        doc_ids = list(dict.fromkeys(cited_ids + [doc_id for _, selected in id_lists for doc_id in selected]))
+        
+        # Chunks vizinhos (overlap do splitter) viram um só; quem não tem vetor é mantido
+        with_vectors = [doc_id for doc_id in doc_ids if doc_id in doc_vectors]
+        if config.dedup_threshold < 1 and len(with_vectors) > 1:
+            kept = {with_vectors[index] for index in collapse_near_duplicates(
+                np.stack([doc_vectors[doc_id] for doc_id in with_vectors]), config.dedup_threshold
+            )}
+            doc_ids = [doc_id for doc_id in doc_ids if doc_id in kept or doc_id not in doc_vectors]
+        
+        cited_set = set(cited_ids)
+        cited_docs = self._load_documents([doc_id for doc_id in doc_ids if doc_id in cited_set])
+        documents = self._deduplicate([cited_docs, self._load_documents([doc_id for doc_id in doc_ids if doc_id not in cited_set])])
         
+        if config.max_per_source > 0:
+            per_source = {}
+            selected = []
+            for doc in documents:
+                source = doc.metadata.get("source")
+                if per_source.get(source, 0) < config.max_per_source:
+                    per_source[source] = per_source.get(source, 0) + 1
+                    selected.append(doc)
+            documents = selected
+        
+        if config.max_documents > 0:
+            documents = self._cap(documents, {doc.page_content for doc in cited_docs}, config)
+        return documents
+
+    @staticmethod
+    def _cap(documents: List[Document], cited_texts: set, config: RetrievalConfig) -> List[Document]:
+        """
+        Teto global de documentos. Um artigo citado longo não ocupa todas as
+        vagas: até k documentos da busca (no máximo metade do teto) têm vaga
+        reservada, e os citados ficam com o resto.
+        """
+        searched = [doc for doc in documents if doc.page_content not in cited_texts]
+        reserved = min(len(searched), config.k, config.max_documents // 2)
+        cited = [doc for doc in documents if doc.page_content in cited_texts][:config.max_documents - reserved]
+        return (cited + searched)[:config.max_documents]
+
+    def fetch_articles(self, citations: List[Tuple[str, str]]) -> List[Document]:
+        """
+        Documentos com o texto canônico de cada artigo (fonte, número), para
+        corrigir citações que não estavam no contexto. Índices sem o texto por
+        artigo devolvem os primeiros chunks do artigo.
+        """
+        if not (self.article_index and self.article_index.available):
+            return []
+        documents = []
+        for source, number in citations:
+            doc_ids = self.article_index.lookup(source, number)
+            chunks = self._load_documents(doc_ids)
+            if not chunks:
+                continue
+            text = self.article_index.text(source, number)
+            if text is None:
+                documents.extend(chunks)
+            else:
+                documents.append(Document(page_content=text, metadata=dict(chunks[0].metadata), id=doc_ids[0]))
+        return documents
+
+    def _load_documents(self, doc_ids: List[str]) -> List[Document]:
+        with self.timings.measure("docstore"):
+            documents = [self.db.docstore.search(doc_id) for doc_id in doc_ids]
+        return [doc for doc in documents if isinstance(doc, Document)]
+
+    def stats(self) -> dict:
+        """Taxa de acerto do cache de vetores, índice de busca em uso e tempo por estágio da busca."""
+        return {
+            "query_cache": self.query_cache.stats(),
+            "search_index": self.search_index_meta,
+            "timings": self.timings.summary(),
+        }
+
+    @staticmethod
+    def _deduplicate(doc_lists: List[List[Document]]) -> List[Document]:
         final_docs_map = {}
-        for doc_list in all_doc_lists:
+        for doc_list in doc_lists:
             for doc in doc_list:
                 if doc.page_content not in final_docs_map:
                     final_docs_map[doc.page_content] = doc
         
         return list(final_docs_map.values())
 
-# --- Singleton ---    
-retriever_agent = RetrieverAgent()
+    async def aget_relevant_documents(self, queries: List[str], mode: Optional[str] = None, k: Optional[int] = None) -> List[Document]:
+        """
+        Versão assíncrona: embeddings e busca FAISS são CPU-bound, então rodam
+        no pool de threads limitado para não bloquear o event loop.
+        """
+        return await run_blocking(self.get_relevant_documents, queries, mode, k)
+
+# --- Singleton (inicializado no primeiro uso ou no warmup) ---    
+retriever_agent = LazyProxy(RetrieverAgent, "retriever_agent")
@@ -1,8 +1,12 @@
+import os
 import sys
+import threading
 from pathlib import Path
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import List, Literal, Optional
 from langchain_core.documents import Document
 
 src_path = str(Path(__file__).resolve().parent)
@@ -10,6 +14,11 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 from utils import create_llm
+from utils.context_builder import build_context
+from utils.faithfulness import precheck
+from utils.tracing import get_logger
+
+logger = get_logger("self_checker")
 
 class FaithfulnessCheck(BaseModel):
     """
@@ -25,26 +34,13 @@ class FaithfulnessCheck(BaseModel):
     )
 
 def format_docs(docs: List[Document]) -> str:
-    """Helper para formatar a lista de documentos em uma string única."""
-    return "\n\n".join(
-        f"--- Documento Fonte: {doc.metadata.get('source', 'N/A')} ---\n{doc.page_content}"
-        for doc in docs
-    )
-
-def check_faithfulness(answer: str, documents: List[Document]):
     """
-    Função do agente Self-Check.
-    Verifica se a resposta é fiel aos documentos.
+    Helper para formatar a lista de documentos em uma string única,
+    no mesmo formato (e orçamento de tokens) do contexto do answerer.
     """
-    
-    llm = create_llm()
-    
-    try:
-        checker_llm = llm.with_structured_output(FaithfulnessCheck)
-    except NotImplementedError:
-        print("AVISO: O LLM selecionado não suporta 'structured_output' nativamente. A checagem pode falhar.")
+    return build_context(docs)
 
-    prompt_template = """
+CHECK_PROMPT = """
 Você é um verificador de fidelidade PERMISSIVO para respostas jurídicas.
 
 CRITÉRIOS PARA APROVAR (marcar como "FIEL"):
@@ -69,16 +65,102 @@ RESPOSTA A VERIFICAR:
 Responda apenas: FIEL ou NAO_FIEL
 Reasoning: [explicação breve se NAO_FIEL]
 """
+
+def _parse_verdict_text(text: str) -> FaithfulnessCheck:
+    """Converte a resposta em texto livre ("FIEL"/"NAO_FIEL") no veredito estruturado."""
+    normalized = text.upper().replace("Ã", "A")
+    if "NAO_FIEL" in normalized or "NAO FIEL" in normalized:
+        return FaithfulnessCheck(verdict="nao_fiel", reasoning=text.strip())
+    return FaithfulnessCheck(verdict="fiel", reasoning=text.strip())
+
+def _checker_chain():
+    llm = create_llm()
     
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    
-    chain = prompt | checker_llm
-    
-    context_str = format_docs(documents)
+    try:
+        checker_llm = llm.with_structured_output(FaithfulnessCheck)
+    except NotImplementedError:
+        logger.warning("O LLM selecionado não suporta 'structured_output' nativamente. Interpretando a resposta em texto.")
+        checker_llm = llm | StrOutputParser() | RunnableLambda(_parse_verdict_text)
+
+    prompt = ChatPromptTemplate.from_template(CHECK_PROMPT)
     
-    verdict = chain.invoke({
-        "context": context_str,
+    return prompt | checker_llm
+
+# Decisões do self-check por origem: regras (sem LLM), LLM ou sem verificação (prazo esgotado)
+_stats = {"rules_fiel": 0, "rules_nao_fiel": 0, "llm": 0, "unverified": 0}
+_stats_lock = threading.Lock()
+
+def _record(origin: str) -> None:
+    with _stats_lock:
+        _stats[origin] += 1
+
+def self_check_stats() -> dict:
+    """Quantas verificações foram decididas pelas regras (chamadas ao LLM evitadas) e quantas foram ao LLM."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    avoided = stats["rules_fiel"] + stats["rules_nao_fiel"]
+    return {**stats, "total": total, "llm_calls_avoided": avoided, "avoided_rate": avoided / total if total else 0.0}
+
+def _precheck(answer: str, documents: List[Document], context: str) -> Optional[FaithfulnessCheck]:
+    """
+    Pré-verificação determinística (utils/faithfulness.py): devolve o veredito
+    quando as regras são conclusivas e None quando o caso precisa do LLM.
+    Desligada com SELF_CHECK_PRECHECK=false.
+    """
+    if os.getenv("SELF_CHECK_PRECHECK", "true").lower() != "true":
+        return None
+    result = precheck(answer, documents, context, min_overlap=float(os.getenv("SELF_CHECK_MIN_OVERLAP", "0.3")))
+    if result.verdict is None:
+        logger.info("SELF-CHECK: caso ambíguo, consultando o LLM (%s)", result.reasoning)
+        return None
+    _record(f"rules_{result.verdict}")
+    logger.info("SELF-CHECK: decidido pelas regras, sem chamada ao LLM (%s)", result.reasoning)
+    return FaithfulnessCheck(verdict=result.verdict, reasoning=result.reasoning)
+
+def rules_only_check(answer: str, documents: List[Document], context: Optional[str] = None) -> FaithfulnessCheck:
+    """
+    Self-check degradado, para quando o prazo da requisição não comporta a
+    chamada ao LLM: aplica só as regras e, se o caso for ambíguo, aceita a
+    resposta como não verificada (o grafo avisa o usuário).
+    """
+    context = context if context is not None else format_docs(documents)
+    result = precheck(answer, documents, context, min_overlap=float(os.getenv("SELF_CHECK_MIN_OVERLAP", "0.3")))
+    if result.verdict is not None:
+        _record(f"rules_{result.verdict}")
+        return FaithfulnessCheck(verdict=result.verdict, reasoning=result.reasoning)
+    _record("unverified")
+    return FaithfulnessCheck(verdict="fiel", reasoning=f"Não verificada pelo LLM (prazo esgotado). {result.reasoning}")
+
+def check_faithfulness(answer: str, documents: List[Document], context: Optional[str] = None):
+    """
+    Função do agente Self-Check.
+    Verifica se a resposta é fiel aos documentos. Com `context`, reaproveita
+    exatamente o texto que o answerer recebeu, sem formatar de novo.
+    Casos conclusivos pelas regras não chegam ao LLM.
+    """
+    context = context if context is not None else format_docs(documents)
+    verdict = _precheck(answer, documents, context)
+    if verdict is not None:
+        return verdict
+
+    _record("llm")
+    verdict = _checker_chain().invoke({
+        "context": context,
         "answer": answer
     })
     
-    return verdict
\ No newline at end of file
+    return verdict
+
+async def acheck_faithfulness(answer: str, documents: List[Document], context: Optional[str] = None):
+    """Versão assíncrona de check_faithfulness."""
+    context = context if context is not None else format_docs(documents)
+    verdict = _precheck(answer, documents, context)
+    if verdict is not None:
+        return verdict
+
+    _record("llm")
+    return await _checker_chain().ainvoke({
+        "context": context,
+        "answer": answer
+    })
@@ -10,10 +10,23 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 from utils import create_llm
+from utils.memo import get_memo
+from utils.lazy import LazyProxy
+
+# Prompt MUITO mais simples e direto
+SUPERVISOR_PROMPT = """
+Pergunta: "{question}"
+
+Esta pergunta tem FATOS SUFICIENTES para uma resposta jurídica?
+
+Responda apenas: SIM ou NAO
+
+Resposta:"""
 
 class SupervisorAgent:
     def __init__(self):
         self.llm = create_llm()
+        self.memo = get_memo("supervisor", SUPERVISOR_PROMPT)
         
     def supervise(self, question: str) -> Dict:
         """Análise híbrida: heurísticas + LLM"""
@@ -23,19 +36,42 @@ class SupervisorAgent:
         
         if deterministic_result is not None:
             # Se as heurísticas são conclusivas, usa elas
-            intent = self._classify_intent_simple(question)
-            
-            return {
-                "intent": intent,
-                "needs_clarification": deterministic_result,
-                "confidence": "alta" if not deterministic_result else "baixa",
-                "method": "deterministic"
-            }
+            return self._deterministic_result(question, deterministic_result)
         
         # PASSO 2: Se heurísticas não são conclusivas, usa LLM
         return self._llm_analysis(question)
     
-    def _deterministic_check(self, question: str) -> bool | None:
+    async def asupervise(self, question: str) -> Dict:
+        """Versão assíncrona de supervise (só o passo do LLM é assíncrono)"""
+        deterministic_result = self._deterministic_check(question)
+        
+        if deterministic_result is not None:
+            return self._deterministic_result(question, deterministic_result)
+        
+        return await self._allm_analysis(question)
+    
+    def quick_supervise(self, question: str) -> Dict:
+        """Só o passo determinístico (sem LLM), para quando o prazo da requisição está curto"""
+        cached = self.memo.get(question)
+        if cached is not None:
+            return dict(cached)
+        deterministic_result = self._deterministic_check(question)
+        if deterministic_result is not None:
+            return self._deterministic_result(question, deterministic_result)
+        return self._fallback_analysis(question)
+    
+    def _deterministic_result(self, question: str, needs_clarification: bool) -> Dict:
+        intent = self._classify_intent_simple(question)
+        
+        return {
+            "intent": intent,
+            "needs_clarification": needs_clarification,
+            "confidence": "alta" if not needs_clarification else "baixa",
+            "method": "deterministic"
+        }
+    
+    @staticmethod
+    def _deterministic_check(question: str) -> bool | None:
         """
         Regras determinísticas para casos óbvios.
         Retorna:
@@ -116,42 +152,74 @@ class SupervisorAgent:
     def _llm_analysis(self, question: str) -> Dict:
         """Análise via LLM para casos não-determinísticos"""
         
-        # Prompt MUITO mais simples e direto
-        prompt_template = """
-Pergunta: "{question}"
-
-Esta pergunta tem FATOS SUFICIENTES para uma resposta jurídica?
-
-Responda apenas: SIM ou NAO
-
-Resposta:"""
+        cached = self.memo.get(question)
+        if cached is not None:
+            return dict(cached)
+        
+        try:
+            result = self._analysis_chain().invoke({"question": question})
+            return self._parse_analysis(question, result)
+        except:
+            return self._fallback_analysis(question)
+    
+    async def _allm_analysis(self, question: str) -> Dict:
+        """Versão assíncrona de _llm_analysis"""
         
-        prompt = ChatPromptTemplate.from_template(prompt_template)
-        chain = prompt | self.llm | StrOutputParser()
+        cached = self.memo.get(question)
+        if cached is not None:
+            return dict(cached)
         
         try:
-            result = chain.invoke({"question": question}).strip().upper()
-            needs_clarification = "NAO" in result or "NÃO" in result
-            
-            return {
-                "intent": "consumidor",
-                "needs_clarification": needs_clarification,
-                "expanded_queries": [question],
-                "confidence": "media",
-                "method": "llm"
-            }
+            result = await self._analysis_chain().ainvoke({"question": question})
+            return self._parse_analysis(question, result)
         except:
-            # Fallback: assume que não precisa esclarecimento
-            return {
-                "intent": "consumidor", 
-                "needs_clarification": False,
-                "expanded_queries": [question],
-                "confidence": "baixa",
-                "method": "fallback"
-            }
-
-# Instância singleton
-supervisor_agent = SupervisorAgent()
+            return self._fallback_analysis(question)
+    
+    def _analysis_chain(self):
+        prompt = ChatPromptTemplate.from_template(SUPERVISOR_PROMPT)
+        return prompt | self.llm | StrOutputParser()
+    
+    def _parse_analysis(self, question: str, result: str) -> Dict:
+        result = result.strip().upper()
+        needs_clarification = "NAO" in result or "NÃO" in result
+        
+        analysis = {
+            "intent": "consumidor",
+            "needs_clarification": needs_clarification,
+            "expanded_queries": [question],
+            "confidence": "media",
+            "method": "llm"
+        }
+        # Somente resultados do LLM são memoizados; o fallback não
+        self.memo.set(question, analysis)
+        return analysis
+    
+    def _fallback_analysis(self, question: str) -> Dict:
+        # Fallback: assume que não precisa esclarecimento
+        return {
+            "intent": "consumidor", 
+            "needs_clarification": False,
+            "expanded_queries": [question],
+            "confidence": "baixa",
+            "method": "fallback"
+        }
+
+# Instância singleton (inicializada no primeiro uso ou no warmup)
+supervisor_agent = LazyProxy(SupervisorAgent, "supervisor_agent")
 
 def supervise_question(question: str) -> Dict:
-    return supervisor_agent.supervise(question)
\ No newline at end of file
+    return supervisor_agent.supervise(question)
+
+async def asupervise_question(question: str) -> Dict:
+    return await supervisor_agent.asupervise(question)
+
+def quick_supervise_question(question: str) -> Dict:
+    return supervisor_agent.quick_supervise(question)
+
+def rules_need_clarification(question: str) -> bool:
+    """
+    Se as regras determinísticas já pedem esclarecimento. Nesse caso o
+    supervisor decide o mesmo sem LLM (o memo só guarda perguntas que as
+    regras não resolvem), então a decisão pode ser antecipada.
+    """
+    return SupervisorAgent._deterministic_check(question) is True
\ No newline at end of file
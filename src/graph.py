@@ -1,37 +1,255 @@
 print("Iniciando: importando as bibliotecas e instanciando os agentes...")
 
-from typing import List, TypedDict, Literal
+import asyncio
+import logging
+import math
+import os
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple, TypedDict, Literal
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ensure_config, var_child_runnable_config
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import StateGraph, END
 
 from agents import retriever_agent
-from agents import generate_answer
-from agents import check_faithfulness, FaithfulnessCheck
-from agents import expand_query
+from agents import generate_answer, agenerate_answer, format_docs_for_answerer
+from agents import correct_answer, acorrect_answer, extractive_answer
+from agents import check_faithfulness, acheck_faithfulness, rules_only_check, FaithfulnessCheck
+from agents import expand_query, aexpand_query
 from agents import apply_disclaimer
-from agents import supervisor_agent, supervise_question
+from agents import supervisor_agent, supervise_question, asupervise_question, quick_supervise_question, rules_need_clarification
 from agents import rephrase_agent
+from agents import reranker_agent, reranker_enabled
+from agents import warmup as warmup_agents
+from utils import load_env
+from utils.deadline import DeadlineExceeded, acall_with_deadline, call_with_deadline, has_time_for, new_deadline, remaining
+from utils.executor import run_blocking
+from utils.faithfulness import check_citations
+from utils.lazy import LazyProxy
+from utils.semantic_cache import SemanticCache
+from utils.tokens import estimate_tokens
+from utils.tracing import configure_logging, format_latency_summary, format_trace, get_logger, traced_node, tracer
+
+configure_logging()
+logger = get_logger("graph")
 
 # --- Definição do Estado do Grafo ---
 
+def merge_documents(left: List[Document], right: List[Document]) -> List[Document]:
+    """
+    Reducer de 'documents': junta os resultados dos ramos de recuperação
+    que rodam em paralelo, removendo duplicados pelo conteúdo.
+    """
+    merged = {}
+    for doc in (left or []) + (right or []):
+        if doc.page_content not in merged:
+            merged[doc.page_content] = doc
+    return list(merged.values())
+
 class GraphState(TypedDict):
     question: str
     intent: str
     needs_clarification: bool
     expanded_queries: List[str] 
     confidence: str
-    documents: List[Document]
+    documents: Annotated[List[Document], merge_documents]
+    # Subconjunto de 'documents' escolhido pelo reranker (substitui, não acumula)
+    ranked_documents: List[Document]
+    rerank_report: dict
+    # Contexto formatado (com orçamento de tokens) compartilhado por answerer e self-check
+    context: str
     answer: str
+    # Citações da resposta conferidas com os documentos e o índice de artigos
+    citations: List[dict]
+    citations_corrected: bool
     verdict: FaithfulnessCheck
+    # Tentativas do answerer (uma por veredito do self-check) e política de nova tentativa
+    attempts: Annotated[List[dict], operator.add]
+    answer_started: float
+    attempt_started: float
+    attempt_strategy: str
+    cache_hit: bool
+    # Vetor da pergunta calculado no cache_lookup e reaproveitado no cache_store
+    question_vector: Any
+    # Prazo da requisição (time.monotonic) e etapas puladas/degradadas por falta de tempo
+    deadline: float
+    skipped_stages: Annotated[List[str], operator.add]
+    # Reformulação especulativa em segundo plano (Future/Task), usada só pelo fail_node
+    speculative_rephrase: Any
+    retrieval_mode: str
+    trace: Annotated[List[dict], operator.add]
+
+# --- Cache semântico de respostas ---
+
+def create_answer_cache() -> SemanticCache | None:
+    """
+    Cria o cache semântico a partir do config/.env.
+    Usa o mesmo modelo de embeddings (e o cache de vetores de consulta) do RetrieverAgent.
+    """
+    load_env()
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() != "true":
+        return None
+
+    project_root = Path(__file__).parent.parent
+    default_path = project_root / "vectorstores" / "semantic_cache.sqlite"
+
+    return SemanticCache(
+        embed_fn=retriever_agent.query_cache.embed_query,
+        index_version=retriever_agent.index_version,
+        path=os.getenv("SEMANTIC_CACHE_PATH", str(default_path)),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    )
+
+# Criado no primeiro uso: depende do modelo de embeddings do retriever
+answer_cache = LazyProxy(create_answer_cache, "answer_cache")
+
+def warmup():
+    """Carrega modelos, índice, clientes LLM e o cache semântico antes da primeira pergunta."""
+    warmup_agents()
+    answer_cache.resolve()
+
+def context_documents(state: GraphState) -> List[Document]:
+    """Documentos que vão para o answerer: os do reranker, se ele rodou, ou todos os recuperados."""
+    ranked = state.get("ranked_documents")
+    return ranked if ranked is not None else state.get("documents", [])
+
+def serialize_state(state: GraphState) -> dict:
+    """Converte o estado final em um dicionário serializável em JSON."""
+    verdict = state.get("verdict")
+    return {
+        "answer": state["answer"],
+        "intent": state.get("intent"),
+        "confidence": state.get("confidence"),
+        "needs_clarification": state.get("needs_clarification", False),
+        "expanded_queries": state.get("expanded_queries", []),
+        "documents": [
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in context_documents(state)
+        ],
+        "citations": state.get("citations", []),
+        "attempts": state.get("attempts", []),
+        "skipped_stages": list(dict.fromkeys(state.get("skipped_stages", []))),
+        "verdict": verdict.model_dump() if verdict else None,
+    }
+
+def deserialize_state(data: dict) -> dict:
+    state = dict(data)
+    state["documents"] = [Document(**doc) for doc in data.get("documents", [])]
+    if data.get("verdict"):
+        state["verdict"] = FaithfulnessCheck(**data["verdict"])
+    else:
+        state.pop("verdict", None)
+    return state
+
+def _get_retriever(config: RunnableConfig | None):
+    """
+    Retriever da execução: pode ser trocado por requisição via
+    config={"configurable": {"retriever": ...}} (ex.: o micro-batcher do servidor).
+    """
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("retriever") or retriever_agent
+
+# --- Prazo da requisição ---
+
+# Etapas que podem ser puladas ou trocadas por um fallback determinístico
+DEGRADED_STAGES = {
+    "supervisor": "classificação da pergunta pelo LLM",
+    "query_expander": "expansão da consulta",
+    "answerer": "análise do LLM (resposta só com os trechos da lei)",
+    "correct_citations": "correção das citações",
+    "self_check": "verificação de fidelidade pelo LLM",
+    "rephrase": "reformulação da pergunta pelo LLM",
+}
+
+def _degrade(state: GraphState, stage: str, reason: str) -> dict:
+    logger.warning("PRAZO: %s %s (%.1f s restantes)", DEGRADED_STAGES[stage], reason, max(remaining(state), 0))
+    return {"skipped_stages": [stage]}
+
+def _run_stage(state: GraphState, stage: str, fallback: Callable[[], Any], fn: Callable, *args, **kwargs) -> Tuple[Any, dict]:
+    """
+    Executa fn dentro do prazo da requisição. Se não sobra tempo para a etapa
+    (ver utils/deadline.py) ou a chamada estoura o prazo, usa o fallback
+    determinístico. Retorna (resultado, atualização de skipped_stages).
+    """
+    if has_time_for(state, stage):
+        try:
+            return call_with_deadline(state, fn, *args, **kwargs), {}
+        except DeadlineExceeded:
+            reason = "sem resposta a tempo"
+    else:
+        reason = "pulada"
+    return fallback(), _degrade(state, stage, reason)
+
+async def _arun_stage(state: GraphState, stage: str, fallback: Callable[[], Any], make_call: Callable[[], Awaitable]) -> Tuple[Any, dict]:
+    """Versão assíncrona de _run_stage: make_call cria a corrotina só se houver tempo."""
+    if has_time_for(state, stage):
+        try:
+            return await acall_with_deadline(state, make_call()), {}
+        except DeadlineExceeded:
+            reason = "sem resposta a tempo"
+    else:
+        reason = "pulada"
+    return fallback(), _degrade(state, stage, reason)
+
+def _deadline_update(state: GraphState) -> dict:
+    """O prazo começa na primeira etapa, salvo se a requisição já trouxe o seu (ex.: servidor)."""
+    return {"deadline": state.get("deadline") or new_deadline()}
+
+def _cache_lookup(cache: SemanticCache, question: str) -> Tuple[Any, Optional[dict]]:
+    """
+    Embute a pergunta uma única vez: o vetor vai para o estado (cache_store) e
+    fica no cache de consultas do retriever, de onde o retrieve_original o lê.
+    """
+    vector = cache.embed(question)
+    return vector, cache.lookup(question, vector)
 
 # --- NÓS DO GRAFO ---
+def cache_lookup_node(state: GraphState):
+    """Nó que consulta o cache semântico antes do supervisor (e inicia o prazo da requisição)"""
+    deadline = _deadline_update(state)
+    cache = answer_cache.resolve()
+    if cache is None:
+        return {"cache_hit": False, **deadline}
+
+    vector, cached_state = _cache_lookup(cache, state["question"])
+    if cached_state is None:
+        return {"cache_hit": False, "question_vector": vector, **deadline}
+
+    logger.info("CACHE SEMÂNTICO: resposta reaproveitada")
+    return {**deserialize_state(cached_state), "cache_hit": True, **deadline}
+
+def cache_store_node(state: GraphState):
+    """
+    Nó que guarda no cache semântico as respostas aprovadas pelo self-check.
+    Respostas degradadas pelo prazo não são guardadas.
+    """
+    cache = answer_cache.resolve()
+    if cache is not None and _cacheable(state):
+        cache.store(state["question"], serialize_state(state), state.get("question_vector"))
+    return {}
+
+def _cacheable(state: GraphState) -> bool:
+    verdict = state.get("verdict")
+    return verdict is not None and verdict.verdict == "fiel" and not state.get("skipped_stages")
+
 def supervisor_node(state: GraphState):
     """Nó supervisor que classifica e decide próximos passos"""
-    print(" --- EXECUTANDO NÓ: SUPERVISOR ---")
     question = state['question']
     
-    supervision_result = supervise_question(question)
+    supervision_result, degraded = _run_stage(
+        state, "supervisor", lambda: quick_supervise_question(question), supervise_question, question
+    )
     
+    return {**_supervision_update(supervision_result), **degraded}
+
+def _supervision_update(supervision_result: dict) -> dict:
     return {
         "intent": supervision_result["intent"],
         "needs_clarification": supervision_result["needs_clarification"],
@@ -40,51 +258,217 @@ def supervisor_node(state: GraphState):
 
 def query_expander_node(state: GraphState):
     "Nó que executa o agente Query Expander"
-    print(" --- EXECUTANDO NÓ: QUERY EXPANDER ---")
     question = state['question']
-    queries = expand_query(question)
-    return {"expanded_queries": queries}
+    queries, degraded = _run_stage(state, "query_expander", lambda: [question], expand_query, question)
+    return {"expanded_queries": queries, **degraded}
 
-def retrieve_node(state: GraphState):
+def retrieve_original_node(state: GraphState, config: RunnableConfig):
+    """
+    Nó que recupera documentos para a pergunta original.
+    Roda em paralelo com o supervisor e a expansão de consultas.
+    """
+    documents = _get_retriever(config).get_relevant_documents([state["question"]], mode=state.get("retrieval_mode"))
+    return {"documents": documents}
+
+def retrieve_node(state: GraphState, config: RunnableConfig):
     """Nó que executa o agente Retriever."""
-    print("--- EXECUTANDO NÓ: RETRIEVER ---")
     question = state.get("expanded_queries") or [state["question"]]
-    documents = retriever_agent.get_relevant_documents(question)
+    documents = _get_retriever(config).get_relevant_documents(question, mode=state.get("retrieval_mode"))
     return {"documents": documents}
 
+def rerank_node(state: GraphState):
+    """
+    Nó que reordena os chunks recuperados com o cross-encoder e mantém só os
+    melhores dentro do orçamento de tokens (RERANKER_MODEL).
+    """
+    documents, report = reranker_agent.rerank(state["question"], state["documents"])
+    _log_rerank_report(report)
+    return {"ranked_documents": documents, "rerank_report": report}
+
+def _log_rerank_report(report: dict) -> None:
+    logger.info(
+        "RERANKER: %d -> %d chunks | +%.0f ms | %d tokens a menos (~%.0f ms de prefill estimado)",
+        report["candidates"], report["kept"], report["latency_ms"], report["saved_tokens"],
+        report["estimated_prefill_saved_ms"],
+    )
+
+def _build_context(state: GraphState) -> str:
+    """Monta o contexto uma vez; o self-check recebe o mesmo texto pelo estado."""
+    documents = context_documents(state)
+    context = format_docs_for_answerer(documents, state["question"])
+    if logger.isEnabledFor(logging.INFO):
+        raw_tokens = sum(estimate_tokens(doc.page_content) for doc in documents)
+        logger.info("CONTEXTO: %d chunks | ~%d -> ~%d tokens", len(documents), raw_tokens, estimate_tokens(context))
+    return context
+
 def answer_node(state: GraphState):
     """Nó que executa o agente Answerer."""
-    print("--- EXECUTANDO NÓ: ANSWERER ---")
+    started = time.perf_counter()
     question = state["question"]
-    documents = state["documents"]
-    answer = generate_answer(question, documents)
+    documents = context_documents(state)
+    context = _build_context(state)
+    answer, degraded = _run_stage(
+        state, "answerer", lambda: extractive_answer(question, documents),
+        generate_answer, question, documents, context=context,
+    )
     
-    print(f"\n{answer}\n")
+    logger.debug("RESPOSTA:\n%s", answer)
     
-    return {"answer": answer}
+    return {
+        "answer": answer, "context": context, **degraded,
+        **_attempt_start(started, "inicial"), **_start_speculative_rephrase(state),
+    }
+
+def _attempt_start(started: float, strategy: str, first: bool = True) -> dict:
+    update = {"attempt_started": started, "attempt_strategy": strategy}
+    if first:
+        update["answer_started"] = started
+    return update
+
+def citation_check_node(state: GraphState, config: RunnableConfig):
+    """
+    Nó que confere cada citação da resposta contra os documentos recuperados e
+    o índice de artigos da ingestão (sem LLM, microssegundos por citação).
+    """
+    start = time.perf_counter()
+    checks = check_citations(state["answer"], context_documents(state), _get_retriever(config).article_index)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    unresolved = [check for check in checks if check.status != "ok"]
+    logger.info("CITAÇÕES: %d conferidas em %.0f µs | %d fora do contexto", len(checks), elapsed_us, len(unresolved))
+    return {"citations": [asdict(check) for check in checks]}
+
+def _unresolved_citations(state: GraphState) -> List[dict]:
+    return [citation for citation in state.get("citations", []) if citation["status"] != "ok"]
+
+def _citation_issues(unresolved: List[dict]) -> str:
+    lines = []
+    for citation in unresolved:
+        label = f"Art. {citation['number']}" + (f" ({citation['cited_source']})" if citation["cited_source"] else "")
+        if citation["status"] == "missing":
+            lines.append(f"- {label}: não estava no contexto; o texto real do artigo foi adicionado ao contexto. Confira se ele se aplica.")
+        else:
+            lines.append(f"- {label}: não existe nos documentos indexados. Remova ou substitua por um artigo do contexto.")
+    return "\n".join(lines)
+
+def _with_cited_articles(state: GraphState, fetched: List[Document]) -> dict:
+    """Documentos e contexto da correção: os do answerer mais o texto dos artigos que faltavam."""
+    documents = merge_documents(context_documents(state), fetched)
+    return {"ranked_documents": documents, "context": _build_context({**state, "ranked_documents": documents})}
+
+def correct_citations_node(state: GraphState, config: RunnableConfig):
+    """
+    Passada única de correção: busca o texto real dos artigos citados que não
+    estavam no contexto e pede ao answerer que revise só as citações, em vez
+    de deixar a resposta cair no self-check/fail_node.
+    """
+    if not has_time_for(state, "correct_citations"):
+        return {"citations_corrected": True, **_degrade(state, "correct_citations", "pulada")}
+    unresolved = _unresolved_citations(state)
+    fetched = _get_retriever(config).fetch_articles(
+        [(citation["source"], citation["number"]) for citation in unresolved if citation["status"] == "missing"]
+    )
+    update = _with_cited_articles(state, fetched)
+    answer, degraded = _run_stage(
+        state, "correct_citations", lambda: state["answer"],
+        correct_answer, state["question"], state["answer"], _citation_issues(unresolved), update["context"],
+    )
+    return {**update, **degraded, "answer": answer, "citations_corrected": True}
 
 def self_check_node(state: GraphState):
     """
     Nó que executa o agente Self-Check.
     Compara a resposta gerada com os documentos de evidência.
     """
-    print("--- EXECUTANDO NÓ: SELF-CHECK ---")
     answer = state["answer"]
-    documents = state["documents"]
+    documents = context_documents(state)
+    context = state.get("context")
     
-    verdict_obj = check_faithfulness(answer, documents)
-    print(f"--- VEREDITO DO SELF-CHECK: {verdict_obj.verdict} ---")
-    return {"verdict": verdict_obj}
+    verdict_obj, degraded = _run_stage(
+        state, "self_check", lambda: rules_only_check(answer, documents, context=context),
+        check_faithfulness, answer, documents, context=context,
+    )
+    logger.info("VEREDITO DO SELF-CHECK: %s", verdict_obj.verdict)
+    return {"verdict": verdict_obj, "attempts": [_attempt_record(state, verdict_obj)], **degraded}
+
+def _attempt_record(state: GraphState, verdict: FaithfulnessCheck) -> dict:
+    """Registro de uma tentativa: do início do answerer (ou da nova tentativa) até o veredito."""
+    now = time.perf_counter()
+    return {
+        "attempt": len(state.get("attempts", [])) + 1,
+        "strategy": state.get("attempt_strategy", "inicial"),
+        "verdict": verdict.verdict,
+        "seconds": now - state.get("attempt_started", now),
+        "documents": len(context_documents(state)),
+    }
+
+# --- Reformulação especulativa ---
+# Fora do grafo: um nó paralelo seguraria o superstep (e o self-check) até o
+# fim da chamada ao LLM. Em segundo plano, nenhum nó espera por ela e só o
+# fail_node usa o resultado.
+
+_rephrase_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rephrase")
+
+def _speculative_rephrase_enabled(state: GraphState) -> bool:
+    # Especulativo: sem tempo, não reformula (o fail_node usa o fallback se precisar)
+    return os.getenv("SPECULATIVE_REPHRASE", "false").lower() == "true" and has_time_for(state, "rephrase")
+
+def _background_rephrase(question: str) -> str:
+    with tracer.span("speculative_rephrase", kind="background"):
+        return rephrase_agent.rephrase(question)
+
+async def _abackground_rephrase(question: str) -> str:
+    # A Task herda a configuração do answerer: a tag nostream tira esta chamada
+    # do stream da resposta (o contexto é uma cópia, o nó não é afetado)
+    config = ensure_config()
+    var_child_runnable_config.set({**config, "tags": [*config.get("tags", []), TAG_NOSTREAM]})
+    with tracer.span("speculative_rephrase", kind="background"):
+        return await rephrase_agent.arephrase(question)
+
+def _start_speculative_rephrase(state: GraphState) -> dict:
+    """Dispara a reformulação da pergunta numa thread enquanto o fluxo segue para as checagens."""
+    if not _speculative_rephrase_enabled(state):
+        return {}
+    return {"speculative_rephrase": _rephrase_executor.submit(_background_rephrase, state["question"])}
+
+def _astart_speculative_rephrase(state: GraphState) -> dict:
+    """Versão assíncrona de _start_speculative_rephrase (uma Task no mesmo event loop)."""
+    if not _speculative_rephrase_enabled(state):
+        return {}
+    task = asyncio.ensure_future(_abackground_rephrase(state["question"]))
+    # Respostas aprovadas nunca leem a Task: consome o erro para não gerar aviso
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    return {"speculative_rephrase": task}
+
+def _speculative_result(state: GraphState) -> Optional[str]:
+    """Resultado da reformulação especulativa, esperando no máximo o prazo restante."""
+    future = state.get("speculative_rephrase")
+    if future is None:
+        return None
+    timeout = remaining(state)
+    try:
+        return future.result(timeout=None if math.isinf(timeout) else max(timeout, 0))
+    except Exception:
+        return None
+
+async def _aspeculative_result(state: GraphState) -> Optional[str]:
+    task = state.get("speculative_rephrase")
+    if task is None:
+        return None
+    try:
+        return await acall_with_deadline(state, asyncio.shield(task))
+    except Exception:
+        return None
 
 def clarification_node(state: GraphState):
     """Nó que pede esclarecimentos quando a pergunta é incompleta"""
-    print(" --- EXECUTANDO NÓ: CLARIFICATION ---")
     question = state["question"]
-    intent = state["intent"]
     
-    new_query = rephrase_agent.rephrase(question)
+    new_query, degraded = _run_stage(state, "rephrase", lambda: rephrase_agent.fallback(question), rephrase_agent.rephrase, question)
 
-    clarification_response = f"""
+    return {"answer": _clarification_response(question, new_query), **degraded}
+
+def _clarification_response(question: str, new_query: str) -> str:
+    return f"""
 🤔 **Preciso entender melhor sua situação para te ajudar adequadamente.**
 
 Você perguntou sobre: {question}
@@ -101,50 +485,141 @@ Para dar uma resposta jurídica precisa, preciso de mais detalhes:
 
 ❓ **Pode reformular sua pergunta com mais detalhes?**
 """
-    
-    return {"answer": clarification_response}
 
 def safety_node(state: GraphState):
     """Nó que aplica disclaimer de segurança"""
-    print(" --- EXECUTANDO NÓ: SAFETY CHECK ---")
-    answer = state["answer"]
+    answer = state["answer"] + _degraded_note(state.get("skipped_stages", []))
     final_answer_with_disclaimer = apply_disclaimer(answer)
     return {"answer": final_answer_with_disclaimer}
 
+def _degraded_note(skipped_stages: List[str]) -> str:
+    """Aviso ao usuário das etapas puladas ou simplificadas por falta de tempo."""
+    if not skipped_stages:
+        return ""
+    stages = "; ".join(DEGRADED_STAGES[stage] for stage in dict.fromkeys(skipped_stages))
+    return f"\n\n⏱️ **Resposta parcial:** por limite de tempo, estas etapas foram puladas ou simplificadas: {stages}."
+
 # --- NÓ DE ROTEAMENTO CONDICIONAL ---
 
+def route_after_cache(state: GraphState) -> Literal["cached"] | List[str]:
+    """
+    Encerra o fluxo quando o cache semântico já tem a resposta.
+    Caso contrário, dispara em paralelo o supervisor e a recuperação
+    da pergunta original, salvo quando as regras do supervisor já mandam a
+    pergunta para esclarecimento: aí a recuperação nunca seria usada.
+    Perguntas que só o LLM do supervisor manda para esclarecimento ainda
+    pagam a recuperação especulativa.
+    """
+    if state.get("cache_hit"):
+        return "cached"
+    if rules_need_clarification(state["question"]):
+        return ["supervisor"]
+    return ["supervisor", "retrieve_original"]
+
 def route_after_supervisor(state: GraphState) -> Literal["clarification", "retrieve"]:
     """Decide se pede esclarecimento ou segue para recuperação"""
     needs_clarification = state.get("needs_clarification", False)
     
-    # DEBUG: Imprimir para verificar
-    print(f"DEBUG Route: needs_clarification = {needs_clarification}")
-    
     # DECISÃO SIMPLES E CLARA
     if needs_clarification is True:  # Verificação explícita
-        print("Roteando para: clarification")
+        logger.debug("Roteando para: clarification (needs_clarification = %s)", needs_clarification)
         return "clarification"
     else:
-        print("Roteando para: query_expander")
+        logger.debug("Roteando para: query_expander (needs_clarification = %s)", needs_clarification)
         return "query_expander"
 
-def route_after_check(state: GraphState) -> Literal["end_safe", "retry_or_fail"]:
+def route_after_citations(state: GraphState) -> Literal["correct_citations", "self_check"]:
+    """Citações fora do contexto ganham uma (e só uma) passada de correção antes do self-check."""
+    enabled = os.getenv("CITATION_CORRECTION", "true").lower() == "true"
+    if enabled and _unresolved_citations(state) and not state.get("citations_corrected"):
+        return "correct_citations"
+    return "self_check"
+
+def route_after_check(state: GraphState) -> Literal["end_safe", "retry", "fail"]:
     """
-    Decide para onde ir após a checagem de fidelidade.
+    Decide para onde ir após a checagem de fidelidade: resposta não fiel
+    ganha nova tentativa enquanto a política permitir (ver _retry_allowed).
     """
     verdict = state["verdict"].verdict
     if verdict == "fiel":
         return "end_safe"
-    else:
-        return "retry_or_fail"
+    if _retry_allowed(state):
+        return "retry"
+    return "fail"
+
+def _retry_allowed(state: GraphState) -> bool:
+    """
+    Política de novas tentativas: no máximo RETRY_MAX_ATTEMPTS respostas e só
+    se mais uma tentativa, estimada pela duração da última, ainda couber em
+    RETRY_DEADLINE_SECONDS contados do início do answerer e no prazo da requisição.
+    """
+    attempts = state.get("attempts", [])
+    max_attempts = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
+    if not attempts or len(attempts) >= max_attempts:
+        return False
+    elapsed = time.perf_counter() - state.get("answer_started", time.perf_counter())
+    deadline = float(os.getenv("RETRY_DEADLINE_SECONDS", "60"))
+    if elapsed + attempts[-1]["seconds"] > deadline:
+        logger.info("RETRY: sem tempo para outra tentativa (%.1f s de %.0f s)", elapsed, deadline)
+        return False
+    if remaining(state) < attempts[-1]["seconds"]:
+        logger.info("RETRY: sem tempo para outra tentativa (%.1f s restantes no prazo da requisição)", max(remaining(state), 0))
+        return False
+    return True
+
+def _retry_plan(state: GraphState, retriever) -> Tuple[List[Tuple[str, str]], int, str]:
+    """
+    O que muda na nova tentativa: artigos citados no raciocínio do veredito
+    (buscados direto no índice de artigos) e k ampliado (RETRY_K_FACTOR por tentativa).
+    """
+    targets = []
+    article_index = retriever.article_index
+    if article_index is not None and article_index.available:
+        citations, _ = article_index.parse(state["verdict"].reasoning)
+        for source, number in citations:
+            targets.extend((candidate, number) for candidate in ([source] if source else article_index.sources_for(number)))
+    attempt = len(state.get("attempts", []))
+    k = retriever.config.k * int(os.getenv("RETRY_K_FACTOR", "2")) ** attempt
+    strategy = f"k={k}" + "".join(f" + Art. {number}" for number in dict.fromkeys(number for _, number in targets))
+    return targets, k, strategy
+
+def _retry_documents(state: GraphState, fetched: List[Document], widened: List[Document]) -> List[Document]:
+    """Reaproveita os documentos já usados e acrescenta os artigos buscados e a busca ampliada."""
+    return merge_documents(context_documents(state), fetched + widened)
+
+def retry_answer_node(state: GraphState, config: RunnableConfig):
+    """
+    Nova tentativa após um veredito 'nao_fiel': amplia a evidência sem refazer
+    supervisor/expansão e roda de novo só o answerer (seguido das checagens).
+    """
+    started = time.perf_counter()
+    retriever = _get_retriever(config)
+    targets, k, strategy = _retry_plan(state, retriever)
+    logger.info("RETRY: tentativa %d (%s)", len(state.get("attempts", [])) + 1, strategy)
+    fetched = retriever.fetch_articles(targets)
+    widened = retriever.get_relevant_documents([state["question"]], mode=state.get("retrieval_mode"), k=k)
+    documents = _retry_documents(state, fetched, widened)
+    context = _build_context({**state, "ranked_documents": documents})
+    answer, degraded = _run_stage(
+        state, "answerer", lambda: extractive_answer(state["question"], documents),
+        generate_answer, state["question"], documents, context=context,
+    )
+    return {
+        "answer": answer, "context": context, "ranked_documents": documents, **degraded,
+        **_attempt_start(started, strategy, first=False),
+    }
 
 def fail_node(state: GraphState):
-    print(" --- EXECUTANDO NÓ: FAIL --- ")
     question = state["question"]
 
-    new_query = rephrase_agent.rephrase(question)
+    new_query, degraded = _speculative_result(state), {}
+    if not new_query:
+        new_query, degraded = _run_stage(state, "rephrase", lambda: rephrase_agent.fallback(question), rephrase_agent.rephrase, question)
+
+    return {"answer": _fail_response(question, new_query), **degraded}
 
-    intelligent_response = f"""
+def _fail_response(question: str, new_query: str) -> str:
+    return f"""
 🤔 **Não consegui dar uma resposta totalmente precisa, mas tenho sugestões!**
 
 Você perguntou: "{question}"
@@ -155,26 +630,167 @@ Você perguntou: "{question}"
 💡 **Por que essas sugestões?** Baseei-me nos documentos que encontrei e na terminologia jurídica mais adequada para sua pergunta.
 """
 
-    return {"answer": intelligent_response}
+# --- NÓS ASSÍNCRONOS ---
+# Mesma lógica dos nós acima, mas sem bloquear o event loop: chamadas ao LLM
+# usam ainvoke e o trabalho de CPU (embeddings/FAISS) vai para o pool limitado.
+
+async def acache_lookup_node(state: GraphState):
+    deadline = _deadline_update(state)
+    cache = await run_blocking(answer_cache.resolve)
+    if cache is None:
+        return {"cache_hit": False, **deadline}
+
+    vector, cached_state = await run_blocking(_cache_lookup, cache, state["question"])
+    if cached_state is None:
+        return {"cache_hit": False, "question_vector": vector, **deadline}
+
+    logger.info("CACHE SEMÂNTICO: resposta reaproveitada")
+    return {**deserialize_state(cached_state), "cache_hit": True, **deadline}
+
+async def acache_store_node(state: GraphState):
+    cache = answer_cache.resolve()
+    if cache is not None and _cacheable(state):
+        await run_blocking(cache.store, state["question"], serialize_state(state), state.get("question_vector"))
+    return {}
+
+async def asupervisor_node(state: GraphState):
+    question = state["question"]
+    supervision_result, degraded = await _arun_stage(
+        state, "supervisor", lambda: quick_supervise_question(question), lambda: asupervise_question(question)
+    )
+    return {**_supervision_update(supervision_result), **degraded}
+
+async def aquery_expander_node(state: GraphState):
+    question = state["question"]
+    queries, degraded = await _arun_stage(state, "query_expander", lambda: [question], lambda: aexpand_query(question))
+    return {"expanded_queries": queries, **degraded}
+
+async def aretrieve_original_node(state: GraphState, config: RunnableConfig):
+    documents = await _get_retriever(config).aget_relevant_documents([state["question"]], mode=state.get("retrieval_mode"))
+    return {"documents": documents}
+
+async def aretrieve_node(state: GraphState, config: RunnableConfig):
+    queries = state.get("expanded_queries") or [state["question"]]
+    documents = await _get_retriever(config).aget_relevant_documents(queries, mode=state.get("retrieval_mode"))
+    return {"documents": documents}
+
+async def arerank_node(state: GraphState):
+    documents, report = await reranker_agent.arerank(state["question"], state["documents"])
+    _log_rerank_report(report)
+    return {"ranked_documents": documents, "rerank_report": report}
+
+async def aanswer_node(state: GraphState):
+    started = time.perf_counter()
+    question = state["question"]
+    documents = context_documents(state)
+    context = _build_context(state)
+    answer, degraded = await _arun_stage(
+        state, "answerer", lambda: extractive_answer(question, documents),
+        lambda: agenerate_answer(question, documents, context=context),
+    )
+    return {
+        "answer": answer, "context": context, **degraded,
+        **_attempt_start(started, "inicial"), **_astart_speculative_rephrase(state),
+    }
+
+async def acorrect_citations_node(state: GraphState, config: RunnableConfig):
+    if not has_time_for(state, "correct_citations"):
+        return {"citations_corrected": True, **_degrade(state, "correct_citations", "pulada")}
+    unresolved = _unresolved_citations(state)
+    fetched = await run_blocking(
+        _get_retriever(config).fetch_articles,
+        [(citation["source"], citation["number"]) for citation in unresolved if citation["status"] == "missing"],
+    )
+    update = _with_cited_articles(state, fetched)
+    answer, degraded = await _arun_stage(
+        state, "correct_citations", lambda: state["answer"],
+        lambda: acorrect_answer(state["question"], state["answer"], _citation_issues(unresolved), update["context"]),
+    )
+    return {**update, **degraded, "answer": answer, "citations_corrected": True}
+
+async def aself_check_node(state: GraphState):
+    answer = state["answer"]
+    documents = context_documents(state)
+    context = state.get("context")
+    verdict_obj, degraded = await _arun_stage(
+        state, "self_check", lambda: rules_only_check(answer, documents, context=context),
+        lambda: acheck_faithfulness(answer, documents, context=context),
+    )
+    logger.info("VEREDITO DO SELF-CHECK: %s", verdict_obj.verdict)
+    return {"verdict": verdict_obj, "attempts": [_attempt_record(state, verdict_obj)], **degraded}
+
+async def aclarification_node(state: GraphState):
+    question = state["question"]
+    new_query, degraded = await _arun_stage(
+        state, "rephrase", lambda: rephrase_agent.fallback(question), lambda: rephrase_agent.arephrase(question)
+    )
+    return {"answer": _clarification_response(question, new_query), **degraded}
+
+async def aretry_answer_node(state: GraphState, config: RunnableConfig):
+    started = time.perf_counter()
+    retriever = _get_retriever(config)
+    targets, k, strategy = _retry_plan(state, retriever)
+    logger.info("RETRY: tentativa %d (%s)", len(state.get("attempts", [])) + 1, strategy)
+    fetched = await run_blocking(retriever.fetch_articles, targets)
+    widened = await retriever.aget_relevant_documents([state["question"]], mode=state.get("retrieval_mode"), k=k)
+    documents = _retry_documents(state, fetched, widened)
+    context = _build_context({**state, "ranked_documents": documents})
+    answer, degraded = await _arun_stage(
+        state, "answerer", lambda: extractive_answer(state["question"], documents),
+        lambda: agenerate_answer(state["question"], documents, context=context),
+    )
+    return {
+        "answer": answer, "context": context, "ranked_documents": documents, **degraded,
+        **_attempt_start(started, strategy, first=False),
+    }
+
+async def afail_node(state: GraphState):
+    question = state["question"]
+    new_query, degraded = await _aspeculative_result(state), {}
+    if not new_query:
+        new_query, degraded = await _arun_stage(
+            state, "rephrase", lambda: rephrase_agent.fallback(question), lambda: rephrase_agent.arephrase(question)
+        )
+    return {"answer": _fail_response(question, new_query), **degraded}
 
 # --- CONSTRUÇÃO DO GRAFO ---
 
-def build_graph():
+def _compile_workflow(nodes: dict):
     """
-    Constrói o grafo LangGraph conectando os nós com lógica condicional.
+    Conecta os nós com lógica condicional e compila o grafo.
+    Etapas independentes rodam em paralelo (fan-out/fan-in):
+    - recuperação da pergunta original || supervisor -> query expander -> recuperação expandida
+    A reformulação especulativa (SPECULATIVE_REPHRASE) roda em segundo plano,
+    fora do grafo, para não segurar o self-check.
+    O reranker (RERANKER_MODEL) é opcional e fica entre a recuperação e o answerer.
+    Citações fora do contexto passam por uma correção única antes do self-check.
+    Respostas não fiéis voltam ao answerer com mais evidência enquanto houver
+    tentativas e prazo (RETRY_MAX_ATTEMPTS, RETRY_DEADLINE_SECONDS); depois, fail_node.
+    Cada nó confere o prazo da requisição (REQUEST_DEADLINE_SECONDS): com pouco
+    tempo, as etapas opcionais são puladas ou trocadas por fallbacks
+    determinísticos e a resposta avisa quais foram (skipped_stages).
     """
+    load_env()
+    rerank = reranker_enabled()
+    if not rerank:
+        nodes = {name: node for name, node in nodes.items() if name != "reranker"}
+
     workflow = StateGraph(GraphState)
+
+    for name, node in nodes.items():
+        workflow.add_node(name, traced_node(name, node))
     
-    workflow.add_node("supervisor", supervisor_node)
-    workflow.add_node("query_expander", query_expander_node)
-    workflow.add_node("retriever", retrieve_node)
-    workflow.add_node("answerer", answer_node)
-    workflow.add_node("self_check", self_check_node)
-    workflow.add_node("clarification", clarification_node)
-    workflow.add_node("fail_node", fail_node)
-    workflow.add_node("safety_node", safety_node)
+    workflow.set_entry_point("cache_lookup")
     
-    workflow.set_entry_point("supervisor")
+    workflow.add_conditional_edges(
+        "cache_lookup",
+        route_after_cache,
+        {
+            "cached": END,
+            "supervisor": "supervisor",
+            "retrieve_original": "retrieve_original"
+        }
+    )
     
     workflow.add_conditional_edges(
         "supervisor",
@@ -186,31 +802,146 @@ def build_graph():
     )
     
     workflow.add_edge("query_expander", "retriever")
-    workflow.add_edge("retriever", "answerer")
-    workflow.add_edge("answerer", "self_check")
+    # Fan-in: o answerer (ou o reranker) espera pelos dois ramos de recuperação
+    if rerank:
+        workflow.add_edge(["retrieve_original", "retriever"], "reranker")
+        workflow.add_edge("reranker", "answerer")
+    else:
+        workflow.add_edge(["retrieve_original", "retriever"], "answerer")
+    workflow.add_edge("answerer", "citation_check")
+    workflow.add_conditional_edges(
+        "citation_check",
+        route_after_citations,
+        {
+            "correct_citations": "correct_citations",
+            "self_check": "self_check"
+        }
+    )
+    workflow.add_edge("correct_citations", "self_check")
     
     workflow.add_conditional_edges(
         "self_check",
         route_after_check,
         {
             "end_safe": "safety_node",
-            "retry_or_fail": "fail_node"
+            "retry": "retry_answer",
+            "fail": "fail_node"
         }
     )
+    workflow.add_edge("retry_answer", "citation_check")
     
     workflow.add_edge("clarification", "safety_node")
     workflow.add_edge("fail_node", "safety_node")
-    workflow.add_edge("safety_node", END)
+    workflow.add_edge("safety_node", "cache_store")
+    workflow.add_edge("cache_store", END)
 
     app = workflow.compile()
     return app
 
+def build_graph():
+    """
+    Constrói o grafo LangGraph síncrono (graph.invoke).
+    """
+    return _compile_workflow({
+        "cache_lookup": cache_lookup_node,
+        "supervisor": supervisor_node,
+        "retrieve_original": retrieve_original_node,
+        "query_expander": query_expander_node,
+        "retriever": retrieve_node,
+        "reranker": rerank_node,
+        "answerer": answer_node,
+        "citation_check": citation_check_node,
+        "correct_citations": correct_citations_node,
+        "self_check": self_check_node,
+        "retry_answer": retry_answer_node,
+        "clarification": clarification_node,
+        "fail_node": fail_node,
+        "safety_node": safety_node,
+        "cache_store": cache_store_node,
+    })
+
+def build_async_graph():
+    """
+    Constrói o grafo LangGraph assíncrono (await graph.ainvoke).
+    Um único event loop consegue multiplexar muitas perguntas em andamento.
+    """
+    return _compile_workflow({
+        "cache_lookup": acache_lookup_node,
+        "supervisor": asupervisor_node,
+        "retrieve_original": aretrieve_original_node,
+        "query_expander": aquery_expander_node,
+        "retriever": aretrieve_node,
+        "reranker": arerank_node,
+        "answerer": aanswer_node,
+        "citation_check": citation_check_node,
+        "correct_citations": acorrect_citations_node,
+        "self_check": aself_check_node,
+        "retry_answer": aretry_answer_node,
+        "clarification": aclarification_node,
+        "fail_node": afail_node,
+        "safety_node": safety_node,
+        "cache_store": acache_store_node,
+    })
+
+# --- STREAMING ---
+
+# Nós que escrevem (ou reescrevem) a resposta: todos têm os tokens transmitidos
+STREAMED_NODES = frozenset({"answerer", "retry_answer", "correct_citations"})
+
+class _AnswerStream:
+    """Converte o stream 'messages' em eventos, avisando quando uma nova versão da resposta começa."""
+
+    def __init__(self):
+        self.generation = None
+
+    def events(self, payload) -> Iterator[Tuple[str, object]]:
+        chunk, metadata = payload
+        node = metadata.get("langgraph_node")
+        if node not in STREAMED_NODES or not chunk.content:
+            return
+        generation = (node, metadata.get("langgraph_step"))
+        if self.generation is not None and generation != self.generation:
+            yield "revision", node
+        self.generation = generation
+        yield "token", chunk.content
+
+def stream_graph(graph, inputs: dict, config: RunnableConfig | None = None) -> Iterator[Tuple[str, object]]:
+    """
+    Executa o grafo em modo streaming.
+    Gera ("token", texto) para cada pedaço da resposta produzido pelo answerer
+    e pelos nós que a reescrevem (correção de citações, nova tentativa); antes
+    de cada reescrita vem ("revision", nó) e o texto transmitido até ali deve
+    ser descartado. Ao final, ("final", estado) com o estado completo (veredito,
+    documentos...), cuja resposta ainda pode diferir da transmitida (ex.: fail_node).
+    """
+    final_state = {}
+    answer_stream = _AnswerStream()
+    for mode, payload in graph.stream(inputs, config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            yield from answer_stream.events(payload)
+        else:
+            final_state = payload
+    yield "final", final_state
+
+async def astream_graph(graph, inputs: dict, config: RunnableConfig | None = None) -> AsyncIterator[Tuple[str, object]]:
+    """Versão assíncrona de stream_graph (usar com build_async_graph)."""
+    final_state = {}
+    answer_stream = _AnswerStream()
+    async for mode, payload in graph.astream(inputs, config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            for event in answer_stream.events(payload):
+                yield event
+        else:
+            final_state = payload
+    yield "final", final_state
+
 # --- Bloco de Teste Interativo (REPL) ---
 if __name__ == '__main__':
     print("Iniciando o Dr. Llama com Supervisor...")
     graph = build_graph()
+    warmup()
     
-    print("Digite a sua pergunta ou '/bye' para sair.")
+    print("Digite a sua pergunta, '/metrics' para as latências ou '/bye' para sair.")
     while True:
         try:
             question = input("\nPrompt: ")
@@ -221,10 +952,15 @@ if __name__ == '__main__':
             if not question:
                 continue
             
+            if question.lower().strip() == "/metrics":
+                print(format_latency_summary(tracer.latency_summary()))
+                continue
+            
             inputs = {"question": question}
             print("Processando com supervisor...")
             
-            final_state = graph.invoke(inputs)
+            with tracer.span("question", kind="request"):
+                final_state = graph.invoke(inputs)
             final_answer = final_state.get("answer", "Erro: O grafo não produziu uma resposta.")
             
             print("\nResposta:")
@@ -235,6 +971,12 @@ if __name__ == '__main__':
             print(f"Intent: {final_state.get('intent', 'N/A')}")
             print(f"Confidence: {final_state.get('confidence', 'N/A')}")
             print(f"Needed Clarification: {final_state.get('needs_clarification', 'N/A')}")
+            print(f"Cache Hit: {final_state.get('cache_hit', False)}")
+            print(f"Skipped Stages: {', '.join(dict.fromkeys(final_state.get('skipped_stages', []))) or '-'}")
+            for attempt in final_state.get("attempts", []):
+                print(f"Attempt {attempt['attempt']} ({attempt['strategy']}): {attempt['verdict']} em {attempt['seconds']:.1f}s")
+            print("Trace:")
+            print(format_trace(final_state.get("trace", [])))
             
             documents = final_state.get("documents", [])
             if documents:
@@ -1 +1 @@
-from .llm_factory import create_llm
\ No newline at end of file
+from .llm_factory import create_llm, llm_registry, load_env
\ No newline at end of file
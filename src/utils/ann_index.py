@@ -0,0 +1,151 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import faiss
+import numpy as np
+
+from .tracing import get_logger
+
+ANN_FILENAME = "index.ann.faiss"
+ANN_META_FILENAME = "index.ann.json"
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+# O FAISS recomenda ao menos ~39 vetores de treino por centróide
+MIN_TRAIN_PER_CENTROID = 39
+ADD_BATCH_SIZE = 65536
+
+logger = get_logger("ann_index")
+
+
+def default_nlist(ntotal: int) -> int:
+    """Número de listas invertidas: ~4·sqrt(N), limitado pelo tamanho do treino possível."""
+    nlist = max(1, int(4 * math.sqrt(ntotal)))
+    return max(1, min(nlist, ntotal // MIN_TRAIN_PER_CENTROID))
+
+
+def _reconstruct(flat_index, start: int, count: int) -> np.ndarray:
+    return np.asarray(flat_index.reconstruct_n(start, count), dtype=np.float32)
+
+
+def build_ann_index(
+    flat_index,
+    index_type: str,
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 80,
+    train_size: Optional[int] = None,
+    seed: int = 42,
+):
+    """
+    Constrói um índice aproximado a partir do índice plano (fonte da verdade).
+    Os vetores são adicionados na mesma ordem, então a posição no índice
+    aproximado é a mesma do plano e o docstore continua valendo.
+    IVF-Flat e IVF-PQ são treinados numa amostra aleatória de train_size vetores.
+    """
+    if index_type not in INDEX_TYPES or index_type == "flat":
+        raise ValueError(f"Tipo de índice aproximado inválido: {index_type!r}")
+    dimension, ntotal = flat_index.d, flat_index.ntotal
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        nlist = nlist or default_nlist(ntotal)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % pq_m:
+                raise ValueError(f"pq_m ({pq_m}) precisa dividir a dimensão dos vetores ({dimension})")
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+
+        # O PQ também treina 2^nbits centróides por subquantizador
+        centroids = nlist if index_type == "ivf_flat" else max(nlist, 2 ** pq_nbits)
+        train_size = min(ntotal, train_size or centroids * MIN_TRAIN_PER_CENTROID)
+        sample = np.sort(np.random.default_rng(seed).choice(ntotal, size=train_size, replace=False))
+        index.train(np.stack([flat_index.reconstruct(int(position)) for position in sample]).astype(np.float32))
+
+    for start in range(0, ntotal, ADD_BATCH_SIZE):
+        index.add(_reconstruct(flat_index, start, min(ADD_BATCH_SIZE, ntotal - start)))
+    return index
+
+
+def tune_ann_index(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Ajusta o compromisso recall x latência de busca (nprobe no IVF, efSearch no HNSW)."""
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # não é um índice IVF
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def save_ann_index(index, path: Union[str, Path], index_type: str, params: dict) -> None:
+    """
+    Grava o índice aproximado ao lado do index.faiss de que foi construído.
+    Os metadados guardam o carimbo dos dois arquivos; cada um é gravado num
+    temporário e trocado com os.replace, o índice primeiro, então um leitor
+    no meio da troca vê carimbos que não batem e fica com o índice plano.
+    """
+    from .vector_store import INDEX_FILENAME, file_stamp
+
+    path = Path(path)
+    tmp_index = path / (ANN_FILENAME + ".tmp")
+    faiss.write_index(index, str(tmp_index))
+    meta = {
+        "index_type": index_type,
+        "ntotal": index.ntotal,
+        "ann_stamp": file_stamp(tmp_index),
+        "index_stamp": file_stamp(path / INDEX_FILENAME),
+        **params,
+    }
+    tmp_meta = path / (ANN_META_FILENAME + ".tmp")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_index, path / ANN_FILENAME)
+    os.replace(tmp_meta, path / ANN_META_FILENAME)
+
+
+def remove_ann_index(path: Union[str, Path]) -> None:
+    """Remove o índice aproximado (ex.: ao voltar para o índice plano)."""
+    for filename in (ANN_FILENAME, ANN_META_FILENAME):
+        file = Path(path) / filename
+        if file.exists():
+            file.unlink()
+
+
+def load_ann_index(path: Union[str, Path], expected_ntotal: int, index_stamp: Optional[str] = None):
+    """
+    Carrega o índice aproximado salvo pela ingestão, ou None se não houver ou se
+    estiver desatualizado em relação ao índice plano: construído a partir de
+    outro index.faiss (index_stamp, o carimbo do plano carregado), gravado pela
+    metade ou com outro número de vetores. Retorna (índice, metadados).
+    """
+    from .vector_store import file_stamp, read_index
+
+    path = Path(path)
+    ann_path, meta_path = path / ANN_FILENAME, path / ANN_META_FILENAME
+    if not (ann_path.exists() and meta_path.exists()):
+        return None, None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # Metadados de ingestões anteriores ao carimbo só passam pela conferência do ntotal
+    if index_stamp is not None and meta.get("index_stamp", index_stamp) != index_stamp:
+        logger.warning("Índice aproximado construído a partir de outro index.faiss. Usando o plano.")
+        return None, None
+    if "ann_stamp" in meta and file_stamp(ann_path) != meta["ann_stamp"]:
+        logger.warning("%s não corresponde aos seus metadados (troca em andamento?). Usando o plano.", ANN_FILENAME)
+        return None, None
+
+    index = read_index(ann_path, mmap=os.getenv("ANN_MMAP", "true").lower() == "true")
+    if index.ntotal != expected_ntotal:
+        logger.warning("Índice aproximado com %d vetores, plano com %d. Usando o plano.", index.ntotal, expected_ntotal)
+        return None, None
+    return index, meta
@@ -0,0 +1,230 @@
+import re
+import sqlite3
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from .sparse_index import STOPWORDS
+
+ARTICLE_TABLE = "articles"
+ARTICLE_TEXT_TABLE = "article_texts"
+ALIAS_TABLE = "source_aliases"
+
+# Overlap máximo procurado entre chunks vizinhos (o splitter usa 150 caracteres)
+MAX_OVERLAP_CHARS = 300
+
+# "art. 39", "Art 5º", "artigo 49" e, no plural, listas: "arts. 18", "arts. 6º e 7", "artigos 6, 7 e 8"
+_citation_pattern = re.compile(
+    r"\b(?:art(?:igo)?s\.?\s*(?P<list>\d+\s*[ºo°]?(?!\d)(?:\s*(?:,|\be\b)\s*\d+\s*[ºo°]?(?!\d))*)"
+    r"|art(?:igo)?\.?\s*(?P<single>\d+)\s*[ºo°]?(?!\d))",
+    re.IGNORECASE,
+)
+_number_pattern = re.compile(r"\d+")
+_word_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos, para casar "Constituição" com "constituicao"."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def article_numbers(text: str) -> List[str]:
+    """
+    Números de artigo citados no texto, em ordem ("arts. 6º e 7" -> ["6", "7"]).
+    Só o plural abre uma lista: em "art. 49 e 30 dias" vale apenas o 49.
+    """
+    numbers = []
+    for match in _citation_pattern.finditer(text):
+        numbers.extend(_number_pattern.findall(match.group("list") or match.group("single")))
+    return numbers
+
+
+def article_number(article: str) -> Optional[str]:
+    """Número do artigo no metadado do chunk ("Art. 5º" -> "5"); None se não especificado."""
+    match = _number_pattern.search(article or "")
+    return match.group(0) if match else None
+
+
+def strip_overlap(previous: str, current: str) -> Optional[str]:
+    """Remove de `current` o início repetido do fim de `previous`; None se não forem vizinhos."""
+    for size in range(min(len(previous), len(current), MAX_OVERLAP_CHARS), 19, -1):
+        if previous.endswith(current[:size]):
+            return current[size:]
+    return None
+
+
+def join_chunks(texts: Sequence[str]) -> str:
+    """Texto contínuo de chunks consecutivos, sem repetir o overlap do splitter."""
+    text = texts[0] if texts else ""
+    for previous, current in zip(texts, texts[1:]):
+        remainder = strip_overlap(previous, current)
+        text += remainder if remainder is not None else "\n" + current
+    return text
+
+
+def create_article_index(
+    conn: sqlite3.Connection,
+    rows: Iterable[Tuple[str, str, int, int, str, str]],
+    source_aliases: Optional[Mapping[str, Sequence[str]]] = None,
+) -> None:
+    """
+    Cria o índice (fonte, número do artigo) -> chunks no docstore gerado pela ingestão,
+    com o texto canônico de cada artigo (os chunks dele unidos, em ordem).
+    rows: (fonte, artigo do metadado, página, posição no índice FAISS, id do documento, texto).
+    source_aliases: nomes pelos quais cada fonte é citada nas consultas ("cdc", "cf88"...).
+    """
+    rows = [
+        (source, number, page, position, doc_id, text)
+        for source, article, page, position, doc_id, text in rows
+        if (number := article_number(article))
+    ]
+    conn.execute(
+        f"""
+        CREATE TABLE {ARTICLE_TABLE} (
+            source TEXT NOT NULL,
+            number TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            doc_id TEXT NOT NULL
+        )
+        """
+    )
+    conn.executemany(
+        f"INSERT INTO {ARTICLE_TABLE} VALUES (?, ?, ?, ?, ?)",
+        [row[:5] for row in rows],
+    )
+    conn.execute(f"CREATE INDEX idx_{ARTICLE_TABLE} ON {ARTICLE_TABLE} (source, number)")
+
+    chunks: Dict[Tuple[str, str], List[str]] = {}
+    for source, number, _, _, _, text in sorted(rows, key=lambda row: (row[0], row[1], row[2], row[3])):
+        chunks.setdefault((source, number), []).append(text)
+    conn.execute(
+        f"""
+        CREATE TABLE {ARTICLE_TEXT_TABLE} (
+            source TEXT NOT NULL,
+            number TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (source, number)
+        )
+        """
+    )
+    conn.executemany(
+        f"INSERT INTO {ARTICLE_TEXT_TABLE} VALUES (?, ?, ?)",
+        [(source, number, join_chunks(texts)) for (source, number), texts in chunks.items()],
+    )
+
+    conn.execute(f"CREATE TABLE {ALIAS_TABLE} (alias TEXT PRIMARY KEY, source TEXT NOT NULL)")
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {ALIAS_TABLE} VALUES (?, ?)",
+        [
+            (normalize_text(alias), source)
+            for source, aliases in (source_aliases or {}).items()
+            for alias in aliases
+        ],
+    )
+
+
+class ArticleIndex:
+    """
+    Resolve citações explícitas ("art. 39 cdc") direto para os chunks do artigo.
+    A tabela é pequena (uma linha por chunk com artigo) e fica inteira em memória,
+    então cada citação é resolvida com um acesso a dicionário.
+    """
+
+    def __init__(self, path: Union[str, Path], max_chunks: int = 4):
+        self.path = Path(path)
+        self.max_chunks = max_chunks
+        self.chunks: Dict[Tuple[str, str], List[str]] = {}
+        self.aliases: Dict[str, str] = {}
+
+        conn = sqlite3.connect(f"file:{Path(path)}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                f"SELECT source, number, doc_id FROM {ARTICLE_TABLE} ORDER BY source, page, position"
+            ).fetchall()
+            self.aliases = dict(conn.execute(f"SELECT alias, source FROM {ALIAS_TABLE}").fetchall())
+        except sqlite3.OperationalError:
+            # Índice salvo antes do índice de artigos
+            rows = []
+        finally:
+            conn.close()
+
+        for source, number, doc_id in rows:
+            self.chunks.setdefault((source, number), []).append(doc_id)
+        self.sources = sorted({source for source, _ in self.chunks})
+
+        # Apelidos mais longos primeiro ("codigo de defesa do consumidor" antes de "cdc")
+        alias_pattern = "|".join(re.escape(alias) for alias in sorted(self.aliases, key=len, reverse=True))
+        self._alias_pattern = re.compile(rf"\b(?:{alias_pattern})\b") if alias_pattern else None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.chunks)
+
+    def parse(self, query: str) -> Tuple[List[Tuple[Optional[str], str]], bool]:
+        """
+        Extrai as citações de artigo da consulta: [(fonte ou None, número)].
+        Retorna também se a consulta é só a citação (nada além de artigo,
+        fonte e palavras vazias), caso em que a busca vetorial é dispensável.
+        """
+        text = normalize_text(query)
+        numbers = article_numbers(text)
+        if not numbers:
+            return [], False
+
+        sources = []
+        residue = _citation_pattern.sub(" ", text)
+        if self._alias_pattern:
+            sources = [self.aliases[alias] for alias in self._alias_pattern.findall(residue)]
+            residue = self._alias_pattern.sub(" ", residue)
+
+        # Sem fonte citada, o artigo é procurado em todas
+        targets = list(dict.fromkeys(sources)) or [None]
+        citations = [(source, number) for number in dict.fromkeys(numbers) for source in targets]
+
+        remaining = [word for word in _word_pattern.findall(residue) if word not in STOPWORDS]
+        return citations, len(remaining) <= 1
+
+    def lookup(self, source: Optional[str], number: str) -> List[str]:
+        """Ids dos primeiros chunks do artigo (em ordem de página), em uma ou em todas as fontes."""
+        sources = [source] if source else self.sources
+        doc_ids = []
+        for candidate in sources:
+            doc_ids.extend(self.chunks.get((candidate, number), [])[:self.max_chunks])
+        return doc_ids
+
+    def exists(self, source: str, number: str) -> bool:
+        return (source, number) in self.chunks
+
+    def sources_for(self, number: str) -> List[str]:
+        """Fontes que têm o artigo `number`."""
+        return [source for source in self.sources if (source, number) in self.chunks]
+
+    def source_for(self, name: str) -> Optional[str]:
+        """Fonte citada por nome ("Código de Defesa do Consumidor", "CDC"), pelos apelidos da ingestão."""
+        if not self._alias_pattern:
+            return None
+        match = self._alias_pattern.search(normalize_text(name))
+        return self.aliases[match.group(0)] if match else None
+
+    def text(self, source: str, number: str) -> Optional[str]:
+        """Texto canônico do artigo (None se o índice foi salvo antes dos textos por artigo)."""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            row = conn.execute(
+                f"SELECT text FROM {ARTICLE_TEXT_TABLE} WHERE source = ? AND number = ?", (source, number)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def resolve(self, query: str) -> Tuple[List[str], bool]:
+        """Ids dos chunks citados na consulta e se a consulta é só a citação."""
+        citations, pure = self.parse(query)
+        doc_ids = []
+        for source, number in citations:
+            doc_ids.extend(self.lookup(source, number))
+        return list(dict.fromkeys(doc_ids)), pure and bool(doc_ids)
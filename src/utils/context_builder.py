@@ -0,0 +1,152 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from .article_index import normalize_text, strip_overlap
+from .sparse_index import STOPWORDS
+from .tokens import estimate_tokens
+
+# Orçamento de tokens do contexto por provedor; modelos pequenos locais recebem menos
+DEFAULT_BUDGETS = {
+    "ollama": 1500,
+    "groq": 4000,
+    "gemini": 8000,
+    "fake": 1500,
+}
+SMALL_MODEL_BUDGET = 1000
+UNSPECIFIED_ARTICLE = "Não especificado"
+ELLIPSIS = " [...] "
+
+# Não quebra após "Art." nem após o número do artigo ("Art. 39. É vedado...")
+_sentence_split = re.compile(r"(?<![Aa]rt\.)(?<!\d\.)(?<=[.;:!?])\s+|\n+")
+_word_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+def context_budget(provider: Optional[str] = None, model: Optional[str] = None) -> int:
+    """
+    Orçamento de tokens do contexto para o provedor/modelo configurado.
+    CONTEXT_TOKEN_BUDGET no config/.env tem prioridade sobre os padrões.
+    """
+    override = os.getenv("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    provider = (provider or os.getenv("LLM_PROVIDER", "ollama")).lower()
+    model = (model or os.getenv("LLM_MODEL", "llama3.2:1b")).lower()
+    budget = DEFAULT_BUDGETS.get(provider, 2000)
+    # Modelos de 1B-3B (ex.: llama3.2:1b) degradam e ficam lentos com prompts longos
+    if re.search(r"[:\-_](0\.5|1|1\.5|2|3)b\b", model):
+        budget = min(budget, SMALL_MODEL_BUDGET)
+    return budget
+
+
+def _query_terms(question: str) -> Set[str]:
+    return {
+        word for word in _word_pattern.findall(normalize_text(question))
+        if word not in STOPWORDS and (len(word) > 2 or word.isdigit())
+    }
+
+
+def merge_article_chunks(documents: List[Document]) -> List[Tuple[Document, str]]:
+    """
+    Junta os chunks do mesmo artigo (mesma fonte) num bloco só, na posição do
+    primeiro deles, removendo o overlap entre chunks vizinhos.
+    Retorna (documento representativo, texto do bloco).
+    """
+    blocks: Dict[tuple, List[Document]] = {}
+    order = []
+    for index, doc in enumerate(documents):
+        article = doc.metadata.get("article", UNSPECIFIED_ARTICLE)
+        # Chunks sem artigo não são agrupados entre si
+        key = (doc.metadata.get("source"), article) if article != UNSPECIFIED_ARTICLE else ("", index)
+        if key not in blocks:
+            blocks[key] = []
+            order.append(key)
+        blocks[key].append(doc)
+
+    merged = []
+    for key in order:
+        chunks = sorted(blocks[key], key=lambda doc: doc.metadata.get("page", 0))
+        text = chunks[0].page_content
+        for previous, current in zip(chunks, chunks[1:]):
+            remainder = strip_overlap(previous.page_content, current.page_content)
+            text += remainder if remainder is not None else ELLIPSIS + current.page_content
+        merged.append((chunks[0], text))
+    return merged
+
+
+def trim_to_budget(text: str, terms: Set[str], budget: int) -> str:
+    """
+    Corte extrativo por sentença: mantém as sentenças que mais citam termos da
+    pergunta (na ordem original) até o orçamento; sentenças omitidas viram "[...]".
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    sentences = [sentence.strip() for sentence in _sentence_split.split(text) if sentence.strip()]
+
+    def relevance(item):
+        index, sentence = item
+        words = set(_word_pattern.findall(normalize_text(sentence)))
+        # Empate: sentenças do início (caput do artigo) primeiro
+        return (len(words & terms), -index)
+
+    chosen = set()
+    used = 0
+    for index, sentence in sorted(enumerate(sentences), key=relevance, reverse=True):
+        tokens = estimate_tokens(sentence) + 1
+        if used + tokens > budget:
+            continue
+        chosen.add(index)
+        used += tokens
+
+    parts = []
+    for index, sentence in enumerate(sentences):
+        if index in chosen:
+            parts.append(sentence)
+        elif not parts or parts[-1] != "[...]":
+            parts.append("[...]")
+    return " ".join(parts)
+
+
+def _header(doc: Document) -> str:
+    # Tenta buscar o 'pretty_name'; se falhar, usa o nome do ficheiro 'source'
+    pretty_name = doc.metadata.get("pretty_name", Path(doc.metadata.get("source", "N/A")).name)
+    article = doc.metadata.get("article")
+    if article and article != UNSPECIFIED_ARTICLE:
+        return f"--- Documento Fonte: {pretty_name}, {article} ---"
+    return f"--- Documento Fonte: {pretty_name} ---"
+
+
+def build_context(documents: List[Document], question: str = "", budget: Optional[int] = None) -> str:
+    """
+    Monta o contexto do prompt dentro de um orçamento de tokens:
+    1. chunks do mesmo artigo viram um bloco (sem o overlap repetido);
+    2. os blocos mantêm a ordem de relevância da recuperação;
+    3. se não couberem, o orçamento é dividido por "water-filling" (blocos pequenos
+       entram inteiros, a sobra vai para os maiores) e os blocos grandes são
+       cortados por sentença, preservando as que citam termos da pergunta.
+    O mesmo texto é usado pelo answerer e pelo self-checker.
+    """
+    budget = budget or context_budget()
+    blocks = [(_header(doc), text) for doc, text in merge_article_chunks(documents)]
+    terms = _query_terms(question)
+    sizes = [estimate_tokens(header) + 1 + estimate_tokens(text) for header, text in blocks]
+
+    allowance = {}
+    remaining = budget
+    for done, index in enumerate(sorted(range(len(blocks)), key=lambda i: sizes[i])):
+        allowance[index] = min(sizes[index], remaining // (len(blocks) - done))
+        remaining -= allowance[index]
+
+    output = []
+    for index, (header, text) in enumerate(blocks):
+        if allowance[index] >= sizes[index]:
+            output.append(f"{header}\n{text}")
+            continue
+        body = trim_to_budget(text, terms, allowance[index] - estimate_tokens(header) - 1)
+        # Nenhuma sentença coube na fatia deste bloco
+        if body.replace("[...]", "").strip():
+            output.append(f"{header}\n{body}")
+    return "\n\n".join(output)
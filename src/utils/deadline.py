@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from .llm_factory import load_env
+
+# Tempo mínimo restante para uma etapa valer a pena (chamada típica ao LLM).
+# Etapas fora da tabela (ex.: supervisor, quase sempre resolvido pelas regras)
+# só degradam quando a chamada estoura o prazo.
+STAGE_MIN_SECONDS = {
+    "query_expander": 5.0,
+    "answerer": 3.0,
+    "correct_citations": 8.0,
+    "self_check": 5.0,
+    "rephrase": 3.0,
+}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """A chamada não terminou dentro do tempo restante da requisição."""
+
+
+def new_deadline(seconds: Optional[float] = None) -> float:
+    """Instante (time.monotonic) em que a requisição estoura; REQUEST_DEADLINE_SECONDS por padrão."""
+    load_env()
+    if seconds is None:
+        seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+    return time.monotonic() + seconds
+
+
+def remaining(state: Mapping[str, Any]) -> float:
+    """Segundos restantes até o deadline do estado (infinito se não houver)."""
+    deadline = state.get("deadline")
+    return math.inf if deadline is None else deadline - time.monotonic()
+
+
+def has_time_for(state: Mapping[str, Any], stage: str) -> bool:
+    """Se ainda há tempo para uma etapa opcional (STAGE_MIN_SECONDS, ajustável por DEADLINE_MIN_<ETAPA>)."""
+    minimum = float(os.getenv(f"DEADLINE_MIN_{stage.upper()}", STAGE_MIN_SECONDS.get(stage, 0.0)))
+    return remaining(state) >= minimum
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                load_env()
+                max_workers = int(os.getenv("DEADLINE_POOL_SIZE", "8"))
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deadline")
+    return _executor
+
+
+def call_with_deadline(state: Mapping[str, Any], fn: Callable, *args, **kwargs) -> Any:
+    """
+    Executa fn limitada ao tempo restante da requisição; DeadlineExceeded se
+    estourar. Sem deadline no estado, chama fn direto. A chamada roda numa
+    thread com o mesmo contexto (callbacks/streaming do LangGraph continuam
+    valendo); se estourar, ela termina em segundo plano, limitada pelo
+    timeout HTTP do cliente (LLM_TIMEOUT_SECONDS).
+    """
+    timeout = remaining(state)
+    if math.isinf(timeout):
+        return fn(*args, **kwargs)
+    if timeout <= 0:
+        raise DeadlineExceeded("prazo da requisição esgotado")
+    future = _get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(f"sem resposta em {timeout:.1f} s") from None
+
+
+async def acall_with_deadline(state: Mapping[str, Any], awaitable: Awaitable) -> Any:
+    """Versão assíncrona de call_with_deadline: a corrotina é cancelada ao estourar."""
+    timeout = remaining(state)
+    if math.isinf(timeout):
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(timeout, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"sem resposta em {max(timeout, 0):.1f} s") from None
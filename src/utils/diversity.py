@@ -0,0 +1,50 @@
+from typing import List
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza cada linha (norma L2 = 1), para que o produto interno seja o cosseno."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_select(relevance: np.ndarray, doc_vectors: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Maximal Marginal Relevance sobre vetores normalizados: escolhe k índices
+    equilibrando a relevância de cada candidato (lambda_mult = 1) e a
+    diversidade entre os escolhidos (lambda_mult = 0).
+    relevance pode ser o cosseno com a consulta ou um score derivado do ranking.
+    """
+    if len(doc_vectors) == 0 or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = doc_vectors @ doc_vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    # Maior similaridade de cada candidato com algum já escolhido
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(doc_vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def collapse_near_duplicates(doc_vectors: np.ndarray, threshold: float) -> List[int]:
+    """
+    Índices a manter, na ordem original, descartando cada vetor cuja similaridade
+    de cosseno com algum vetor já mantido seja >= threshold (ex.: chunks vizinhos
+    que compartilham o overlap do splitter).
+    """
+    if len(doc_vectors) == 0:
+        return []
+    similarity = doc_vectors @ doc_vectors.T
+    kept: List[int] = []
+    for index in range(len(doc_vectors)):
+        if not kept or similarity[index, kept].max() < threshold:
+            kept.append(index)
+    return kept
@@ -0,0 +1,202 @@
+import json
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .tracing import get_logger
+
+EMBEDDING_MODEL = "thenlper/gte-small"
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8")
+
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model.int8.onnx"
+ONNX_META_FILENAME = "embedding_meta.json"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_ONNX_DIR = PROJECT_ROOT / "models" / "gte-small-onnx"
+
+# Cosseno mínimo entre o vetor do ONNX e o do PyTorch para o mesmo texto.
+# Acima disso os vetores são intercambiáveis com os de um índice já criado.
+TOLERANCES = {"onnx": 0.999, "onnx_int8": 0.98}
+
+logger = get_logger("embeddings")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings do gte-small com ONNX Runtime (CPU), sem PyTorch na inferência.
+    Reproduz o HuggingFaceEmbeddings: mesmo tokenizador, truncamento, pooling
+    (média pela máscara de atenção) e troca de "\\n" por espaço nos textos.
+    Os textos de cada lote são ordenados por tamanho para reduzir o padding.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, batch_size: int = 32, threads: int = 0):
+        # Imports opcionais (onnxruntime/tokenizers) só com este backend
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        with open(model_dir / ONNX_META_FILENAME, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_token_id"], pad_token=self.meta["pad_token"])
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = ONNX_INT8_FILENAME if quantized else ONNX_MODEL_FILENAME
+        self.session = ort.InferenceSession(str(model_dir / model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.meta.get("normalize"):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), self.meta["dimension"]), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            vectors[batch] = self._encode_batch([texts[i] for i in batch])
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def export_onnx(model_dir: str, model_name: str = EMBEDDING_MODEL, quantize: bool = True, opset: int = 14) -> dict:
+    """
+    Exporta o transformer do modelo sentence-transformers para ONNX (eixos de
+    lote e sequência dinâmicos), salva o tokenizador e, com quantize, gera
+    também a versão int8 (quantização dinâmica dos pesos).
+    Retorna os metadados gravados em embedding_meta.json.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    pooling = next((module for module in model if type(module).__name__ == "Pooling"), None)
+    if pooling is not None and pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"Pooling {pooling.get_pooling_mode_str()!r} não suportado pelo backend ONNX (só mean)")
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    sample = tokenizer(["exemplo de texto"], return_tensors="pt")
+    dynamic_axes = {"batch": 0, "sequence": 1}
+    torch.onnx.export(
+        LastHiddenState(transformer),
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        str(model_dir / ONNX_MODEL_FILENAME),
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": dynamic_axes,
+            "attention_mask": dynamic_axes,
+            "token_type_ids": dynamic_axes,
+            "last_hidden_state": dynamic_axes,
+        },
+        opset_version=opset,
+    )
+    tokenizer.save_pretrained(str(model_dir))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(model_dir / ONNX_MODEL_FILENAME), str(model_dir / ONNX_INT8_FILENAME), weight_type=QuantType.QInt8)
+
+    meta = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+    }
+    write_onnx_meta(model_dir, meta)
+    return meta
+
+
+def write_onnx_meta(model_dir: str, meta: dict) -> None:
+    with open(Path(model_dir) / ONNX_META_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Cosseno linha a linha entre duas matrizes de vetores (mesmos textos, backends diferentes)."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1), 1e-12
+    )
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+def create_embeddings(batch_size: Optional[int] = None) -> Embeddings:
+    """
+    Modelo de embeddings do config/.env (EMBEDDING_BACKEND):
+    torch (HuggingFaceEmbeddings, padrão), onnx ou onnx_int8 (ONNX Runtime,
+    modelo exportado por ingest/export_onnx.py em ONNX_MODEL_DIR).
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND inválido: {backend!r} (use {', '.join(EMBEDDING_BACKENDS)})")
+
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        encode_kwargs = {"batch_size": batch_size} if batch_size else {}
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"}, encode_kwargs=encode_kwargs)
+
+    # Caminho relativo é relativo à raiz do projeto
+    model_dir = PROJECT_ROOT / os.getenv("ONNX_MODEL_DIR", str(DEFAULT_ONNX_DIR))
+    if not (model_dir / ONNX_META_FILENAME).exists():
+        raise FileNotFoundError(
+            f"Modelo ONNX não encontrado em {model_dir}. Rode: python ingest/export_onnx.py"
+        )
+    embeddings = OnnxEmbeddings(
+        model_dir,
+        quantized=backend == "onnx_int8",
+        batch_size=batch_size or int(os.getenv("ONNX_BATCH_SIZE", "32")),
+        threads=int(os.getenv("ONNX_THREADS", "0")),
+    )
+    # A exportação registra a concordância com o PyTorch; avisa se ficou fora da tolerância
+    check = embeddings.meta.get("verification", {}).get(backend)
+    if check is None:
+        logger.warning("Backend %s sem verificação de tolerância. Rode: python ingest/export_onnx.py", backend)
+    elif check["min_cosine"] < TOLERANCES[backend]:
+        logger.warning(
+            "Backend %s com cosseno mínimo %.4f (tolerância %s); os vetores podem não bater com o índice.",
+            backend, check["min_cosine"], TOLERANCES[backend],
+        )
+    return embeddings
@@ -0,0 +1,37 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .llm_factory import load_env
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """
+    Pool de threads limitado (BLOCKING_POOL_SIZE) para o trabalho de CPU
+    e E/S bloqueante (embeddings, busca FAISS, SQLite) do caminho assíncrono.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                load_env()
+                max_workers = int(os.getenv("BLOCKING_POOL_SIZE", "4"))
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking")
+    return _executor
+
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Executa uma função bloqueante no pool limitado sem travar o event loop.
+    O contexto é copiado para a thread (o span atual do tracing continua valendo).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(context.run, fn, *args, **kwargs))
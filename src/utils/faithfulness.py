@@ -0,0 +1,178 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from .article_index import article_number, article_numbers, normalize_text
+
+# "[Fonte: Código de Defesa do Consumidor, Art. 30]"
+_source_block = re.compile(r"\[\s*fonte\s*:\s*([^\]]*)\]", re.IGNORECASE)
+# "Art. 30", "art. 6º", "artigo 49" (início da citação; listas via article_numbers)
+_article_pattern = re.compile(r"\bart(?:igo)?s?\.?\s*(\d+)\s*[ºo°]?(?!\d)", re.IGNORECASE)
+_word_pattern = re.compile(r"\w+", re.UNICODE)
+
+# Mesmos sinais de falha que o prompt do self-check e o eval consideram
+ERROR_MARKERS = ("erro:", "não consegui", "nao consegui")
+
+
+@dataclass
+class PrecheckResult:
+    """
+    Resultado da verificação por regras. verdict é "fiel"/"nao_fiel" quando a
+    decisão é segura, ou None quando o caso é ambíguo e deve ir ao LLM.
+    """
+    verdict: Optional[str]
+    reasoning: str
+    citations: List[Tuple[Optional[str], str]] = field(default_factory=list)
+    unsupported: List[Tuple[Optional[str], str]] = field(default_factory=list)
+    overlap: float = 0.0
+
+
+def extract_citations(answer: str) -> List[Tuple[Optional[str], str]]:
+    """
+    Citações de artigo da resposta: [(fonte normalizada ou None, número)].
+    Dentro de "[Fonte: ...]" a fonte acompanha o artigo; "Art. N" soltos no
+    texto ficam sem fonte. Listas no plural ("arts. 6º e 7") citam cada artigo.
+    """
+    citations = []
+    for block in _source_block.findall(answer):
+        source = normalize_text(_article_pattern.split(block)[0]).strip(" ,;-") or None
+        citations.extend((source, number) for number in article_numbers(block))
+    loose = article_numbers(_source_block.sub(" ", answer))
+    citations.extend((None, number) for number in loose)
+    return list(dict.fromkeys(citations))
+
+
+def has_reference(answer: str) -> bool:
+    """Se a resposta tem alguma referência jurídica ([Fonte:], Art., CDC...)."""
+    text = normalize_text(answer)
+    return bool(_source_block.search(answer) or _article_pattern.search(text) or re.search(r"\b(cdc|cf|constituicao|codigo)\b", text))
+
+
+def _ngrams(text: str, n: int) -> Set[tuple]:
+    words = _word_pattern.findall(normalize_text(text))
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def ngram_overlap(answer: str, context: str, n: int = 3) -> float:
+    """Fração dos n-gramas de palavras da resposta (sem as citações) que aparecem no contexto."""
+    answer_ngrams = _ngrams(_source_block.sub(" ", answer), n)
+    if not answer_ngrams:
+        return 0.0
+    return len(answer_ngrams & _ngrams(context, n)) / len(answer_ngrams)
+
+
+def _source_matches(cited: str, pretty_name: str) -> bool:
+    return cited in pretty_name or pretty_name in cited
+
+
+def supported_articles(documents: List[Document], context: str) -> Tuple[Set[Tuple[str, str]], Set[str]]:
+    """
+    Artigos presentes na evidência: (fonte normalizada, número) pelos metadados
+    dos documentos recuperados e números de artigo mencionados no contexto.
+    """
+    by_source = set()
+    for doc in documents:
+        number = article_number(doc.metadata.get("article", ""))
+        if number:
+            by_source.add((normalize_text(doc.metadata.get("pretty_name", "")), number))
+    mentioned = set(article_numbers(normalize_text(context)))
+    return by_source, mentioned
+
+
+@dataclass
+class CitationCheck:
+    """
+    Situação de uma citação da resposta:
+    ok (artigo entre os documentos recuperados), missing (existe no índice de
+    artigos, mas não foi recuperado) ou unknown (não existe no índice).
+    """
+    cited_source: Optional[str]
+    number: str
+    source: Optional[str]
+    status: str
+
+
+def check_citations(answer: str, documents: List[Document], article_index) -> List[CitationCheck]:
+    """
+    Confere cada citação da resposta contra os documentos recuperados e o
+    índice de artigos (ArticleIndex) com acessos a conjuntos/dicionários, sem
+    SQL nem LLM. Citações sem fonte valem para qualquer fonte recuperada.
+    """
+    retrieved = set()
+    for doc in documents:
+        number = article_number(doc.metadata.get("article", ""))
+        if number:
+            retrieved.add((doc.metadata.get("source"), number))
+    retrieved_sources = list(dict.fromkeys(source for source, _ in sorted(retrieved)))
+
+    checks = []
+    for cited_source, number in extract_citations(answer):
+        source = article_index.source_for(cited_source) if cited_source and article_index else None
+        if source:
+            candidates = [source]
+        else:
+            # Sem fonte reconhecida: as fontes recuperadas primeiro, depois as demais que têm o artigo
+            candidates = retrieved_sources + [
+                candidate for candidate in (article_index.sources_for(number) if article_index else [])
+                if candidate not in retrieved_sources
+            ]
+
+        status, match = "unknown", source
+        for candidate in candidates:
+            if (candidate, number) in retrieved:
+                status, match = "ok", candidate
+                break
+        else:
+            for candidate in candidates:
+                if article_index and article_index.exists(candidate, number):
+                    status, match = "missing", candidate
+                    break
+        checks.append(CitationCheck(cited_source, number, match, status))
+    return checks
+
+
+def precheck(answer: str, documents: List[Document], context: str, min_overlap: float = 0.3) -> PrecheckResult:
+    """
+    Verificação determinística dos critérios mecânicos do self-check:
+    - "ERRO:"/"não consegui" ou nenhuma referência jurídica -> nao_fiel;
+    - todas as citações de artigo existem nos documentos recuperados (metadado
+      'article' da mesma fonte, ou o artigo aparece no contexto) e a resposta
+      reaproveita pelo menos min_overlap dos trigramas do contexto -> fiel;
+    - qualquer outro caso (artigo citado fora da evidência, pouca sobreposição,
+      resposta sem artigo) fica para o LLM.
+    """
+    lowered = answer.lower()
+    if any(marker in lowered for marker in ERROR_MARKERS):
+        return PrecheckResult("nao_fiel", "A resposta contém uma mensagem de erro.")
+    if not has_reference(answer):
+        return PrecheckResult("nao_fiel", "A resposta não tem nenhuma citação ou referência jurídica.")
+
+    citations = extract_citations(answer)
+    by_source, mentioned = supported_articles(documents, context)
+    retrieved_sources = {source for source, _ in by_source}
+
+    unsupported = []
+    for source, number in citations:
+        known_source = source and any(_source_matches(source, name) for name in retrieved_sources)
+        if known_source:
+            grounded = any(_source_matches(source, name) and number == n for name, n in by_source)
+        else:
+            grounded = any(number == n for _, n in by_source)
+        if not (grounded or number in mentioned):
+            unsupported.append((source, number))
+
+    overlap = ngram_overlap(answer, context)
+    result = PrecheckResult(None, "", citations, unsupported, overlap)
+    if unsupported:
+        cited = ", ".join(f"Art. {number}" for _, number in unsupported)
+        result.reasoning = f"Artigos citados fora dos documentos recuperados: {cited}."
+    elif not citations:
+        result.reasoning = "A resposta não cita nenhum artigo específico."
+    elif overlap < min_overlap:
+        result.reasoning = f"Pouca sobreposição com o contexto ({overlap:.0%} dos trigramas)."
+    else:
+        result.verdict = "fiel"
+        result.reasoning = f"Citações conferidas com os documentos ({overlap:.0%} dos trigramas no contexto)."
+    return result
@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Callable
+
+
+class LazyProxy:
+    """
+    Proxy thread-safe para singletons caros (modelos, índices, clientes LLM).
+    O objeto real só é construído no primeiro acesso a um atributo
+    (ou numa chamada explícita a resolve(), usada pelo warmup).
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str | None = None):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_name", name or getattr(factory, "__name__", "objeto"))
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_resolved", False)
+        object.__setattr__(self, "_lock", threading.RLock())
+
+    def resolve(self) -> Any:
+        """Constrói (uma única vez) e devolve o objeto real."""
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    object.__setattr__(self, "_instance", self._factory())
+                    object.__setattr__(self, "_resolved", True)
+        return self._instance
+
+    @property
+    def initialized(self) -> bool:
+        return self._resolved
+
+    def __getattr__(self, item: str) -> Any:
+        # Sondagens de atributos especiais (hasattr(x, "__self__") no LangGraph,
+        # "__test__" na coleta do pytest) não devem construir o objeto
+        if item.startswith("__") and item.endswith("__"):
+            raise AttributeError(item)
+        return getattr(self.resolve(), item)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        setattr(self.resolve(), key, value)
+
+    def __repr__(self) -> str:
+        state = "inicializado" if self._resolved else "pendente"
+        return f"<LazyProxy {self._name} ({state})>"
@@ -1,58 +1,206 @@
 import os
+import threading
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_ollama.chat_models import ChatOllama
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
 
-def create_llm() -> BaseChatModel:
+# Resposta padrão do provedor "fake" (testes locais sem Ollama/API)
+FAKE_LLM_RESPONSE = (
+    "**Fundamento Legal:** Resposta de teste do provedor fake "
+    "[Fonte: Código de Defesa do Consumidor, Art. 39]\nFIEL"
+)
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env() -> None:
     """
-    Fábrica de LLMs.
-    Lê a variável de ambiente LLM_PROVIDER para decidir qual LLM instanciar.
-    Retorna uma instância de um modelo de chat (Ollama ou Gemini ou Groq).
-    """
-    project_root = Path(__file__).parent.parent.parent
-    dotenv_path = project_root / "config" / ".env"
-    
-    if not dotenv_path.exists():
-        print(f"Aviso: arquivo .env não encontrado em {dotenv_path}. Usando variáveis de ambiente globais.")
-    
-    load_dotenv(dotenv_path=dotenv_path)
-    
-    provider = os.getenv("LLM_PROVIDER", "ollama").lower()
-    model=os.getenv("LLM_MODEL", "llama3.2:1b" ).lower()
-    
-    #print(f"--- Utilizando o provedor de LLM: {provider} | Modelo: {model} ---")
-    
+    Carrega o config/.env uma única vez por processo.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        project_root = Path(__file__).parent.parent.parent
+        dotenv_path = project_root / "config" / ".env"
+
+        if not dotenv_path.exists():
+            print(f"Aviso: arquivo .env não encontrado em {dotenv_path}. Usando variáveis de ambiente globais.")
+
+        load_dotenv(dotenv_path=dotenv_path)
+        _env_loaded = True
+
+
+def _http_limits() -> httpx.Limits:
+    """Limites do pool de conexões HTTP (keep-alive) de cada cliente."""
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120")),
+    )
+
+
+def _http_timeout() -> float:
+    """
+    Timeout HTTP de cada chamada ao provedor (LLM_TIMEOUT_SECONDS). Limita
+    também as chamadas abandonadas pelo prazo da requisição (utils/deadline.py),
+    que terminam em segundo plano.
+    """
+    return float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+
+def _build_llm(provider: str, model: str, temperature: float, max_tokens: Optional[int]) -> BaseChatModel:
+    """
+    Constrói um novo cliente de chat para o provedor escolhido.
+    Cada cliente mantém o próprio pool de conexões HTTP com keep-alive,
+    por isso deve ser reaproveitado (ver LLMRegistry).
+    Os pacotes de cada provedor só são importados quando usados.
+    Com o tracing ligado, cada cliente registra um span por chamada (utils/tracing.py).
+    """
+    from .tracing import llm_callbacks
+
+    callbacks = llm_callbacks()
     if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         google_api_key = os.getenv("GOOGLE_API_KEY")
         if not google_api_key:
             raise ValueError("A chave GOOGLE_API_KEY não foi encontrada no arquivo .env")
-        
+
         return ChatGoogleGenerativeAI(
             model=model,
             google_api_key=google_api_key,
-            temperature=0,
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            timeout=_http_timeout(),
+            callbacks=callbacks,
             n=1
         )
     elif provider == "groq":
+        from langchain_groq import ChatGroq
+
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
             raise ValueError("A chave GROQ_API_KEY não foi encontrada no arquivo config/.env")
-            
+
         return ChatGroq(
             model_name=model,
             groq_api_key=groq_api_key,
-            temperature=0,
-            n=1
+            temperature=temperature,
+            max_tokens=max_tokens,
+            n=1,
+            timeout=_http_timeout(),
+            http_client=httpx.Client(limits=_http_limits(), timeout=_http_timeout()),
+            http_async_client=httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout()),
+            callbacks=callbacks,
         )
-        
+
     elif provider == "ollama":
-        return ChatOllama(model=model, temperature=0, n=1) 
-    
+        from langchain_ollama.chat_models import ChatOllama
+
+        return ChatOllama(
+            model=model,
+            temperature=temperature,
+            num_predict=max_tokens,
+            client_kwargs={"limits": _http_limits(), "timeout": _http_timeout()},
+            callbacks=callbacks,
+        )
+
+    elif provider == "fake":
+        from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+        return FakeListChatModel(responses=[os.getenv("FAKE_LLM_RESPONSE", FAKE_LLM_RESPONSE)], callbacks=callbacks)
+
     else:
         raise ValueError(
             f"Provedor de LLM '{provider}' não suportado. "
             "Use 'ollama' ou 'gemini'."
-        )
\ No newline at end of file
+        )
+
+
+LLMKey = Tuple[str, str, float, Optional[int]]
+
+
+class LLMRegistry:
+    """
+    Registro de clientes LLM compartilhados pelo processo.
+    Cada combinação (provedor, modelo, temperatura, max_tokens) é construída
+    uma única vez e reaproveitada por todos os agentes e threads.
+    """
+
+    def __init__(self):
+        self._clients: Dict[LLMKey, BaseChatModel] = {}
+        self._lock = threading.Lock()
+        self.constructed = 0
+        self.reused = 0
+
+    def get(self, provider: str, model: str, temperature: float = 0, max_tokens: Optional[int] = None) -> BaseChatModel:
+        key = (provider, model, float(temperature), max_tokens)
+        client = self._clients.get(key)
+        if client is not None:
+            with self._lock:
+                self.reused += 1
+            return client
+
+        with self._lock:
+            # Outra thread pode ter construído o cliente enquanto esperávamos
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            client = _build_llm(provider, model, temperature, max_tokens)
+            self._clients[key] = client
+            self.constructed += 1
+            return client
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de clientes construídos vs. reaproveitados."""
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "constructed": self.constructed,
+                "reused": self.reused,
+            }
+
+    def reset(self) -> None:
+        """Descarta todos os clientes e zera os contadores (uso em testes)."""
+        with self._lock:
+            self._clients.clear()
+            self.constructed = 0
+            self.reused = 0
+
+
+# Instância singleton
+llm_registry = LLMRegistry()
+
+
+def create_llm(temperature: float = 0, max_tokens: Optional[int] = None) -> BaseChatModel:
+    """
+    Fábrica de LLMs.
+    Lê a variável de ambiente LLM_PROVIDER para decidir qual LLM instanciar.
+    Retorna uma instância compartilhada de um modelo de chat (Ollama ou Gemini ou Groq).
+    """
+    load_env()
+
+    provider = os.getenv("LLM_PROVIDER", "ollama").lower()
+    model = os.getenv("LLM_MODEL", "llama3.2:1b").lower()
+
+    #print(f"--- Utilizando o provedor de LLM: {provider} | Modelo: {model} ---")
+
+    return llm_registry.get(provider, model, temperature, max_tokens)
+
+
+def reset() -> None:
+    """
+    Zera o registro de clientes e força a releitura do config/.env
+    na próxima chamada de create_llm (uso em testes).
+    """
+    global _env_loaded
+    llm_registry.reset()
+    with _env_lock:
+        _env_loaded = False
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .llm_factory import load_env
+from .tracing import tracer
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza a pergunta (Unicode, caixa e espaços) para servir de chave."""
+    text = unicodedata.normalize("NFC", question).lower().strip()
+    return re.sub(r"\s+", " ", text)
+
+
+def prompt_hash(prompt_template: str) -> str:
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+
+
+class AgentMemo:
+    """
+    Memoização exata das respostas de um agente.
+    Camada 1: LRU em memória. Camada 2 (opcional): SQLite em disco.
+
+    A chave combina a pergunta normalizada com provedor, modelo e o hash do
+    template de prompt do agente, então alterar o prompt invalida apenas as
+    entradas daquele agente.
+    """
+
+    def __init__(self, namespace: str, prompt_template: str, max_entries: int = 512, sqlite_path: Optional[str] = None):
+        self.namespace = namespace
+        self.prompt_hash = prompt_hash(prompt_template)
+        self.max_entries = max_entries
+
+        self._lru: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if sqlite_path:
+            self._open_sqlite(sqlite_path)
+
+    def _open_sqlite(self, sqlite_path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+        self._conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS memo (
+                namespace TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        # Entradas geradas com uma versão anterior do prompt deste agente
+        self._conn.execute(
+            "DELETE FROM memo WHERE namespace = ? AND prompt_hash != ?",
+            (self.namespace, self.prompt_hash),
+        )
+        self._conn.commit()
+
+    def key(self, question: str) -> str:
+        provider = os.getenv("LLM_PROVIDER", "ollama").lower()
+        model = os.getenv("LLM_MODEL", "llama3.2:1b").lower()
+        raw = "|".join([self.namespace, provider, model, self.prompt_hash, normalize_question(question)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[Any]:
+        value = self._get(question)
+        # Acertos/faltas do memo ficam no span atual (o nó que consultou)
+        tracer.current().add("memo_hits" if value is not None else "memo_misses")
+        return value
+
+    def _get(self, question: str) -> Optional[Any]:
+        key = self.key(question)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return self._lru[key]
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value FROM memo WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, question: str, value: Any) -> None:
+        key = self.key(question)
+        with self._lock:
+            self._remember(key, value)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO memo (namespace, prompt_hash, key, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, self.prompt_hash, key, json.dumps(value, ensure_ascii=False), time.time()),
+                )
+                self._conn.commit()
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM memo WHERE namespace = ?", (self.namespace,))
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._lru),
+            }
+
+
+_memos: Dict[str, AgentMemo] = {}
+_memos_lock = threading.Lock()
+
+
+def get_memo(namespace: str, prompt_template: str) -> AgentMemo:
+    """
+    Retorna o memo do agente, criando-o com a configuração do config/.env
+    (MEMO_MAX_ENTRIES e MEMO_SQLITE_PATH; caminho vazio desativa o disco).
+    """
+    with _memos_lock:
+        memo = _memos.get(namespace)
+        if memo is None or memo.prompt_hash != prompt_hash(prompt_template):
+            load_env()
+            memo = AgentMemo(
+                namespace,
+                prompt_template,
+                max_entries=int(os.getenv("MEMO_MAX_ENTRIES", "512")),
+                sqlite_path=os.getenv("MEMO_SQLITE_PATH") or None,
+            )
+            _memos[namespace] = memo
+        return memo
+
+
+def memo_stats() -> Dict[str, Dict[str, Any]]:
+    """Estatísticas de acertos/erros por agente."""
+    with _memos_lock:
+        memos = dict(_memos)
+    return {namespace: memo.stats() for namespace, memo in memos.items()}
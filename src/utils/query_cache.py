@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from .tracing import tracer
+
+
+def normalize_query(text: str) -> str:
+    """
+    Texto embutido para uma consulta (espaços colapsados). Usado pela busca e
+    pelo cache semântico, para que a mesma pergunta caia na mesma chave daqui.
+    """
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """
+    LRU limitado de consulta -> vetor na frente do modelo de embeddings.
+    embed() resolve uma lista inteira de consultas: as que já estão no cache
+    saem dele e as restantes (sem repetição) são embutidas numa única passada.
+    A chave é o texto exato da consulta, então o vetor é idêntico ao do modelo.
+    """
+
+    def __init__(self, embed_documents: Callable[[List[str]], List[List[float]]], max_entries: int = 1024):
+        self.embed_documents = embed_documents
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, queries: Sequence[str]) -> np.ndarray:
+        """Matriz (len(queries), dim) float32 com o vetor de cada consulta, na mesma ordem."""
+        if not queries:
+            return np.empty((0, 0), dtype=np.float32)
+
+        found = {}
+        with self._lock:
+            for query in queries:
+                vector = self._lru.get(query)
+                if vector is not None:
+                    self._lru.move_to_end(query)
+                    found[query] = vector
+
+        missing = [query for query in dict.fromkeys(queries) if query not in found]
+        if missing:
+            vectors = np.asarray(self.embed_documents(missing), dtype=np.float32)
+            with self._lock:
+                for query, vector in zip(missing, vectors):
+                    found[query] = vector
+                    self._lru[query] = vector
+                    self._lru.move_to_end(query)
+                while len(self._lru) > self.max_entries:
+                    self._lru.popitem(last=False)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(queries) - len(missing)
+        tracer.current().set(queries=len(queries), cache_hits=len(queries) - len(missing))
+        return np.stack([found[query] for query in queries])
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed([query])[0].tolist()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,186 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+from .query_cache import normalize_query
+from .tracing import get_logger
+
+logger = get_logger("semantic_cache")
+
+
+class SemanticCache:
+    """
+    Cache semântico de respostas finais do grafo.
+    Perguntas são comparadas pela similaridade de cosseno dos seus embeddings;
+    acima do limiar, o estado final armazenado é devolvido sem executar o grafo.
+
+    - Expiração por TTL e descarte LRU quando o limite de entradas é atingido.
+    - Persistência em SQLite: cada escrita grava só a entrada nova (e apaga as descartadas).
+    - Invalidação pela versão do índice FAISS: uma nova ingestão descarta o cache,
+      evitando servir citações desatualizadas.
+    - A pergunta é embutida com o mesmo texto da busca (normalize_query), então o
+      vetor sai do cache de consultas do retriever em vez de um segundo embedding.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        index_version: str,
+        path: Optional[str] = None,
+        threshold: float = 0.95,
+        ttl_seconds: float = 86400,
+        max_entries: int = 1000,
+    ):
+        self.embed_fn = embed_fn
+        self.index_version = index_version
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+        self._load()
+
+    # --- API pública ---
+
+    def embed(self, question: str) -> np.ndarray:
+        """Vetor normalizado da pergunta; pode ser passado a lookup/store para não embutir de novo."""
+        vector = np.asarray(self.embed_fn(normalize_query(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, question: str, vector: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retorna o estado armazenado para a pergunta mais parecida,
+        ou None se nenhuma entrada válida passar do limiar.
+        """
+        if vector is None:
+            vector = self.embed(question)
+        with self._lock:
+            self._delete(self._evict_expired())
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[k]["embedding"] for k in keys])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]["state"]
+
+    def store(self, question: str, state: Dict[str, Any], vector: Optional[np.ndarray] = None) -> None:
+        """Armazena o estado final (já serializável em JSON) da pergunta."""
+        if vector is None:
+            vector = self.embed(question)
+        key = normalize_query(question)
+        entry = {"embedding": np.asarray(vector, dtype=np.float32), "state": state, "created_at": time.time()}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            # Sem lookups, as expiradas se acumulariam; cada escrita também as descarta
+            evicted = self._evict_expired() + self._evict_overflow()
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (key, entry["embedding"].tobytes(), json.dumps(state, ensure_ascii=False), entry["created_at"]),
+                )
+            self._delete(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "index_version": self.index_version,
+            }
+
+    # --- Auxiliares ---
+
+    def _evict_expired(self) -> List[str]:
+        now = time.time()
+        expired = [k for k, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        return expired
+
+    def _evict_overflow(self) -> List[str]:
+        """Descarta as entradas menos usadas acima de max_entries."""
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        return evicted
+
+    def _delete(self, keys: List[str]) -> None:
+        """Apaga do disco as entradas descartadas e grava a transação (chamado com o lock)."""
+        if self._conn is None:
+            return
+        if keys:
+            self._conn.executemany("DELETE FROM entries WHERE question = ?", [(key,) for key in keys])
+        self._conn.commit()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    question TEXT PRIMARY KEY,
+                    embedding BLOB NOT NULL,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            row = conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+            if row is not None and row[0] != self.index_version:
+                logger.info("CACHE SEMÂNTICO: índice FAISS mudou, descartando entradas antigas")
+                conn.execute("DELETE FROM entries")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('index_version', ?)", (self.index_version,))
+            conn.commit()
+            rows = conn.execute("SELECT question, embedding, state, created_at FROM entries ORDER BY created_at").fetchall()
+        except (OSError, sqlite3.DatabaseError) as e:
+            logger.warning("Cache semântico ilegível em %s, usando só a memória: %s", self.path, e)
+            return
+
+        self._conn = conn
+        for question, embedding, state, created_at in rows:
+            self._entries[question] = {
+                "embedding": np.frombuffer(embedding, dtype=np.float32),
+                "state": json.loads(state),
+                "created_at": created_at,
+            }
+        # Expiradas e excedentes (max_entries pode ter diminuído) saem do disco já na carga
+        with self._lock:
+            self._delete(self._evict_expired() + self._evict_overflow())
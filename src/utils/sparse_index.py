@@ -0,0 +1,104 @@
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+FTS_TABLE = "docs_fts"
+
+# Palavras muito frequentes nas perguntas que só diluem a consulta BM25
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "em",
+    "é", "na", "nas", "no", "nos", "o", "os", "ou", "para", "pela", "pelo", "por",
+    "qual", "quais", "que", "se", "sobre", "um", "uma",
+}
+
+_token_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+def create_sparse_index(conn: sqlite3.Connection, rows: Iterable[Tuple[int, str, str]]) -> None:
+    """
+    Cria o índice invertido BM25 (FTS5 do SQLite) no docstore gerado pela ingestão.
+    rows: (posição no índice FAISS, texto do chunk, artigo).
+    O tokenizador remove acentos, então "arrependimento"/"ARREPENDIMENTO" e
+    "é"/"e" caem no mesmo termo.
+    """
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        "page_content, article, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    conn.executemany(f"INSERT INTO {FTS_TABLE}(rowid, page_content, article) VALUES (?, ?, ?)", rows)
+
+
+def to_match_query(query: str) -> str:
+    """Converte texto livre numa consulta FTS5 (termos entre aspas unidos por OR)."""
+    terms = []
+    for token in _token_pattern.findall(query.lower()):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        if token not in terms:
+            terms.append(token)
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class BM25Index:
+    """
+    Busca BM25 sobre a tabela FTS5 do docstore.sqlite (somente leitura).
+    Retorna (id do documento, score) com score maior = mais relevante.
+    """
+
+    # Peso das colunas no bm25(): um termo que casa com o artigo ("art", "39") vale mais
+    COLUMN_WEIGHTS = (1.0, 2.0)
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.available = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)
+            ).fetchone() is not None
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        match = to_match_query(query)
+        if not self.available or not match:
+            return []
+        weights = ", ".join(str(weight) for weight in self.COLUMN_WEIGHTS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT docs.doc_id, bm25({FTS_TABLE}, {weights}) AS score
+                FROM {FTS_TABLE} JOIN docs ON docs.position = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match, k),
+            ).fetchall()
+        # O bm25() do SQLite é negativo (menor = melhor); invertemos o sinal
+        return [(doc_id, -score) for doc_id, score in rows]
+
+
+# --- Fusão de rankings ---
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[str, float]]], k: int = 60) -> List[Tuple[str, float]]:
+    """RRF: soma de 1 / (k + posição) de cada documento em cada ranking."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(rankings: Sequence[Sequence[Tuple[str, float]]], weights: Sequence[float]) -> List[Tuple[str, float]]:
+    """Soma ponderada dos scores normalizados (min-max) de cada ranking."""
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        for doc_id, score in ranking:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
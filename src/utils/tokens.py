@@ -0,0 +1,23 @@
+import math
+import os
+
+# Média aproximada para texto jurídico em português nos tokenizadores BPE
+# usados pelos modelos suportados (Llama, Gemini, modelos do Groq)
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata do número de tokens de um texto (sem carregar tokenizador)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_prefill_seconds(tokens: int) -> float:
+    """
+    Tempo estimado de prefill do LLM para `tokens` tokens de prompt.
+    A vazão (LLM_PREFILL_TOKENS_PER_SEC) depende do hardware e do modelo;
+    meça com o seu provedor e ajuste no config/.env.
+    """
+    tokens_per_second = float(os.getenv("LLM_PREFILL_TOKENS_PER_SEC", "500"))
+    return tokens / tokens_per_second if tokens_per_second > 0 else 0.0
@@ -0,0 +1,571 @@
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .llm_factory import load_env
+from .tokens import estimate_tokens
+
+LOGGER_NAME = "drllama"
+PERCENTILES = (50, 95, 99)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+_logging_lock = threading.Lock()
+_logging_configured = False
+
+
+# --- Logging ---
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger de um módulo do projeto (filho de 'drllama', configurado por configure_logging)."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def configure_logging(level: Optional[str] = None) -> logging.Logger:
+    """
+    Configura o logger 'drllama' uma única vez: nível LOG_LEVEL (DEBUG, INFO,
+    WARNING...) e saída no stderr, sem mexer no logger raiz da aplicação.
+    Mensagens abaixo do nível custam só a checagem do nível: use argumentos
+    no estilo logger.debug("... %s", valor), nunca f-strings.
+    """
+    global _logging_configured
+    load_env()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    with _logging_lock:
+        if not _logging_configured:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(name)s] %(message)s", "%H:%M:%S"))
+            logger.addHandler(handler)
+            logger.propagate = False
+            _logging_configured = True
+    return logger
+
+
+logger = get_logger("tracing")
+
+
+# --- Spans ---
+
+@dataclass
+class Span:
+    """
+    Uma operação medida (nó do grafo, chamada ao LLM, embedding, busca
+    FAISS...). trace_id agrupa os spans de uma pergunta e parent_id liga cada
+    um ao span em que foi aberto.
+    """
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float
+    start: float
+    thread: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration_ms: float = 0.0
+    status: str = "ok"
+    otel_span: Any = field(default=None, repr=False)
+
+    recording = True
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "thread": self.thread,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span devolvido com o tracing desligado: não mede nem guarda nada."""
+    recording = False
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, key: str, value: float = 1) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class LatencyHistogram:
+    """
+    Latências de uma operação: as últimas `window` amostras para os
+    percentis (p50/p95/p99) e contagem, total e máximo desde o início.
+    """
+
+    def __init__(self, window: int = 2048):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration_ms: float) -> None:
+        self._samples.append(duration_ms)
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def summary(self) -> dict:
+        samples = sorted(self._samples)
+        summary = {"count": self.count, "avg_ms": self.total_ms / self.count if self.count else 0.0}
+        for percentile in PERCENTILES:
+            # Percentil pelo posto mais próximo (nearest-rank)
+            rank = max(math.ceil(percentile / 100 * len(samples)) - 1, 0)
+            summary[f"p{percentile}_ms"] = samples[rank] if samples else 0.0
+        summary["max_ms"] = self.max_ms
+        return summary
+
+
+class JsonlSpanExporter:
+    """Grava cada span finalizado como uma linha JSON (TRACING_JSONL_PATH)."""
+
+    def __init__(self, path: str):
+        path = PROJECT_ROOT / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent: Optional[Span]) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OtelSpanExporter:
+    """
+    Repassa os spans ao SDK do OpenTelemetry (opentelemetry-sdk, opcional),
+    que os envia em lote a um coletor local por OTLP/gRPC
+    (OTEL_EXPORTER_OTLP_ENDPOINT, padrão http://localhost:4317) ou, com
+    TRACING_OTEL_CONSOLE=true, os imprime no console.
+    """
+
+    def __init__(self, service_name: str = "dr-llama"):
+        # Imports opcionais: só com TRACING_EXPORTER=otel
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+        if os.getenv("TRACING_OTEL_CONSOLE", "false").lower() == "true":
+            exporter = ConsoleSpanExporter()
+        else:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+            exporter = OTLPSpanExporter()
+        self._trace = trace
+        self._provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        self._provider.add_span_processor(BatchSpanProcessor(exporter))
+        self._tracer = self._provider.get_tracer(LOGGER_NAME)
+
+    def on_start(self, span: Span, parent: Optional[Span]) -> None:
+        context = None
+        if parent is not None and parent.otel_span is not None:
+            context = self._trace.set_span_in_context(parent.otel_span)
+        span.otel_span = self._tracer.start_span(
+            f"{span.kind}:{span.name}", context=context, start_time=int(span.start_time * 1e9)
+        )
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.otel_span
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.status == "error":
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+        otel_span.end(end_time=int((span.start_time + span.duration_ms / 1000) * 1e9))
+        span.otel_span = None
+
+    def shutdown(self) -> None:
+        self._provider.shutdown()
+
+
+def _create_exporter(kind: str):
+    if kind == "jsonl":
+        return JsonlSpanExporter(os.getenv("TRACING_JSONL_PATH", "logs/traces.jsonl"))
+    if kind == "otel":
+        try:
+            return OtelSpanExporter()
+        except ImportError:
+            logger.warning("TRACING_EXPORTER=otel, mas o opentelemetry-sdk não está instalado; spans não serão exportados.")
+            return None
+    if kind != "none":
+        logger.warning("TRACING_EXPORTER inválido: %r (use none, jsonl ou otel)", kind)
+    return None
+
+
+class Tracer:
+    """
+    Spans estruturados do processo. Cada span alimenta o histograma de
+    latência da operação ('tipo:nome', ex.: 'node:answerer', 'llm:self_check',
+    'retrieval:faiss') e, se configurado, o exportador (TRACING_EXPORTER:
+    jsonl ou otel). Com TRACING_ENABLED=false, span() devolve um span vazio
+    e nada é medido.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._configured = False
+        self.enabled = True
+        self.window = 2048
+        self.exporter = None
+
+    @property
+    def active(self) -> bool:
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    load_env()
+                    self.enabled = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+                    self.window = int(os.getenv("TRACING_HISTOGRAM_WINDOW", "2048"))
+                    self.exporter = _create_exporter(os.getenv("TRACING_EXPORTER", "none").lower()) if self.enabled else None
+                    self._configured = True
+        return self.enabled
+
+    def start_span(self, name: str, kind: str = "internal", **attributes) -> Optional[Span]:
+        """Abre um span filho do span atual, sem torná-lo o atual (feche com end_span)."""
+        if not self.active:
+            return None
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time(),
+            start=time.perf_counter(),
+            thread=threading.current_thread().name,
+            attributes=attributes,
+        )
+        if self.exporter is not None:
+            self.exporter.on_start(span, parent)
+        return span
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None) -> None:
+        if span is None:
+            return
+        span.duration_ms = (time.perf_counter() - span.start) * 1000
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = repr(error)
+        key = f"{span.kind}:{span.name}"
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.window)
+            histogram.add(span.duration_ms)
+        if self.exporter is not None:
+            try:
+                self.exporter.on_end(span)
+            except Exception as e:
+                logger.warning("Falha ao exportar o span %s: %s", key, e)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """Mede o bloco como um span (o atual durante o bloco, pai dos que forem abertos nele)."""
+        span = self.start_span(name, kind, **attributes)
+        if span is None:
+            yield NOOP_SPAN
+            return
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def current(self):
+        """Span atual (ou o span vazio), para anotar atributos sem abrir um novo."""
+        return _current_span.get() or NOOP_SPAN
+
+    def latency_summary(self, kind: Optional[str] = None) -> Dict[str, dict]:
+        """p50/p95/p99 (ms) de cada operação medida, opcionalmente só de um tipo (node, llm...)."""
+        with self._lock:
+            return {
+                key: histogram.summary()
+                for key, histogram in sorted(self._histograms.items())
+                if kind is None or key.startswith(f"{kind}:")
+            }
+
+    def reset(self) -> None:
+        """Zera os histogramas (uso em testes e benchmarks)."""
+        with self._lock:
+            self._histograms.clear()
+
+
+# Instância singleton
+tracer = Tracer()
+
+
+def format_latency_summary(summary: Dict[str, dict]) -> str:
+    """Tabela textual de latency_summary() (REPL)."""
+    if not summary:
+        return "(nenhuma operação medida)"
+    lines = [f"{'operação':<32} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}"]
+    for key, stats in summary.items():
+        lines.append(
+            f"{key:<32} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+            f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+# --- Chamadas ao LLM ---
+
+def _token_usage(response) -> dict:
+    """Tokens informados pelo provedor (usage_metadata da mensagem ou token_usage do llm_output)."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"prompt_tokens": usage.get("input_tokens"), "completion_tokens": usage.get("output_tokens")}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+    return {}
+
+
+class LLMTracingHandler(BaseCallbackHandler):
+    """
+    Callback do LangChain que abre um span 'llm' por chamada ao modelo,
+    nomeado pelo nó do grafo que a fez, com o modelo, os tokens de prompt e
+    de resposta (do provedor ou, sem essa informação, estimados) e, em
+    streaming, o tempo até o primeiro token.
+    """
+
+    # Roda na mesma thread/contexto da chamada: o span pai é o do nó atual
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, prompt: str, kwargs: dict) -> None:
+        parent = _current_span.get()
+        params = kwargs.get("invocation_params") or {}
+        span = tracer.start_span(
+            parent.name if parent is not None else "chat", kind="llm",
+            model=params.get("model") or params.get("model_name") or params.get("_type", "llm"),
+        )
+        if span is not None:
+            with self._lock:
+                self._spans[run_id] = (span, estimate_tokens(prompt))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id, "".join(str(message.content) for batch in messages for message in batch), kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id, "".join(prompts), kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+        entry = self._spans.get(run_id)
+        if entry is not None and "first_token_ms" not in entry[0].attributes:
+            entry[0].set(first_token_ms=(time.perf_counter() - entry[0].start) * 1000)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        with self._lock:
+            entry = self._spans.pop(run_id, None)
+        if entry is None:
+            return
+        span, prompt_tokens = entry
+        usage = _token_usage(response)
+        if usage:
+            span.set(**usage)
+        else:
+            completion = "".join(generation.text for generations in response.generations for generation in generations)
+            span.set(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(completion), tokens_estimated=True)
+        tracer.end_span(span)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs) -> None:
+        with self._lock:
+            entry = self._spans.pop(run_id, None)
+        if entry is not None:
+            tracer.end_span(entry[0], error)
+
+
+llm_tracing_handler = LLMTracingHandler()
+
+
+def llm_callbacks() -> list:
+    """Callbacks dos clientes LLM: o handler de tracing, se o tracing estiver ligado."""
+    return [llm_tracing_handler] if tracer.active else []
+
+
+# --- Nós do grafo ---
+
+def _node_attributes(result: dict) -> dict:
+    """Atributos do span de um nó a partir da atualização de estado que ele devolveu."""
+    attributes = {}
+    for key in ("documents", "ranked_documents", "expanded_queries"):
+        if result.get(key) is not None:
+            attributes[key] = len(result[key])
+    if "cache_hit" in result:
+        attributes["cache_hit"] = result["cache_hit"]
+    if result.get("verdict") is not None:
+        attributes["verdict"] = result["verdict"].verdict
+    if result.get("skipped_stages"):
+        attributes["skipped_stages"] = ",".join(result["skipped_stages"])
+    return attributes
+
+
+def traced_node(name: str, fn: Callable) -> Callable:
+    """
+    Envolve um nó do grafo num span 'node' (latência no histograma, documentos,
+    cache e veredito como atributos) e registra início/fim (perf_counter) e a
+    thread que o executou. O registro é devolvido na chave 'trace' do estado,
+    que usa um reducer de concatenação, então ramos paralelos não se sobrescrevem.
+    """
+    node_logger = get_logger("graph")
+
+    def record(result, start, span):
+        result = dict(result or {})
+        end = time.perf_counter()
+        if span.recording:
+            span.set(**_node_attributes(result))
+        node_logger.debug("NÓ %s: %.1f ms", name, (end - start) * 1000)
+        result["trace"] = [{
+            "node": name,
+            "start": start,
+            "end": end,
+            "thread": threading.current_thread().name,
+        }]
+        return result
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, *args, **kwargs):
+            node_logger.debug("EXECUTANDO NÓ: %s", name)
+            with tracer.span(name, kind="node") as span:
+                start = time.perf_counter()
+                return record(await fn(state, *args, **kwargs), start, span)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        node_logger.debug("EXECUTANDO NÓ: %s", name)
+        with tracer.span(name, kind="node") as span:
+            start = time.perf_counter()
+            return record(fn(state, *args, **kwargs), start, span)
+
+    return wrapper
+
+
+def find_overlaps(trace: List[Dict]) -> List[tuple]:
+    """Pares de nós cuja execução se sobrepôs no tempo."""
+    overlaps = []
+    spans = sorted(trace, key=lambda s: s["start"])
+    for i, a in enumerate(spans):
+        for b in spans[i + 1:]:
+            if b["start"] >= a["end"]:
+                break
+            overlaps.append((a["node"], b["node"]))
+    return overlaps
+
+
+def format_trace(trace: List[Dict]) -> str:
+    """
+    Linha do tempo textual da execução: offset e duração de cada nó,
+    seguida dos nós que rodaram em paralelo.
+    """
+    if not trace:
+        return "(sem trace)"
+
+    origin = min(s["start"] for s in trace)
+    lines = []
+    for span in sorted(trace, key=lambda s: s["start"]):
+        offset_ms = (span["start"] - origin) * 1000
+        duration_ms = (span["end"] - span["start"]) * 1000
+        lines.append(f"{span['node']:<22} +{offset_ms:8.1f} ms  {duration_ms:8.1f} ms  [{span['thread']}]")
+
+    total_ms = (max(s["end"] for s in trace) - origin) * 1000
+    lines.append(f"{'TOTAL (wall-clock)':<22} {total_ms:9.1f} ms")
+
+    overlaps = find_overlaps(trace)
+    if overlaps:
+        lines.append("Em paralelo: " + ", ".join(f"{a} || {b}" for a, b in overlaps))
+    return "\n".join(lines)
+
+
+class StageTimings:
+    """
+    Tempo acumulado por estágio (ex.: embedding, busca FAISS), thread-safe.
+    Cada medição também é um span (kind), com histograma de latência.
+    """
+
+    def __init__(self, kind: str = "retrieval"):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._totals: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        with tracer.span(stage, kind=self.kind) as span:
+            try:
+                yield span
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                stage: {
+                    "calls": self._counts[stage],
+                    "total_ms": total * 1000,
+                    "avg_ms": total * 1000 / self._counts[stage],
+                }
+                for stage, total in self._totals.items()
+            }
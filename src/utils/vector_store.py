@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .article_index import create_article_index
+from .sparse_index import create_sparse_index
+from .tracing import get_logger
+
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite"
+INDEX_STAMP_KEY = "index_stamp"
+
+logger = get_logger("vector_store")
+
+# Tentativas de carregar um par index.faiss/docstore da mesma ingestão
+_LOAD_ATTEMPTS = 5
+_LOAD_RETRY_SECONDS = 0.2
+
+
+def _connect_readonly(path: Path) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def file_stamp(path: Path, sample_bytes: int = 1 << 16) -> str:
+    """
+    Carimbo de um arquivo de índice FAISS: tamanho e hash do início e do fim
+    (cabeçalho com ntotal e os últimos vetores). Barato de calcular e, ao
+    contrário do mtime, sobrevive a cópias do diretório.
+    """
+    size = path.stat().st_size
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(sample_bytes))
+        f.seek(max(size - sample_bytes, 0))
+        digest.update(f.read(sample_bytes))
+    return digest.hexdigest()[:16]
+
+
+def _read_stamp(conn: sqlite3.Connection) -> Optional[str]:
+    """Carimbo do index.faiss gravado junto com o docstore (None em docstores antigos)."""
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (INDEX_STAMP_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Docstore somente leitura sobre o arquivo SQLite gerado na ingestão.
+    Cada documento é lido sob demanda pelo id, sem desserializar o corpus
+    inteiro (e sem pickle).
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._conn = _connect_readonly(self.path)
+        self._lock = threading.Lock()
+        self.index_stamp = _read_stamp(self._conn)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, page_content, metadata FROM docs WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        doc_id, page_content, metadata = row
+        return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def add(self, texts) -> None:
+        raise NotImplementedError("SQLiteDocstore é somente leitura; regrave o índice pela ingestão.")
+
+    def delete(self, ids) -> None:
+        raise NotImplementedError("SQLiteDocstore é somente leitura; regrave o índice pela ingestão.")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SQLiteIndexMap(Mapping):
+    """Mapa posição no índice FAISS -> id do documento, lido sob demanda."""
+
+    def __init__(self, path: Union[str, Path]):
+        self._conn = _connect_readonly(Path(path))
+        self._lock = threading.Lock()
+        self.index_stamp = _read_stamp(self._conn)
+        with self._lock:
+            self._size = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def __getitem__(self, position: int) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id FROM docs WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def positions(self, doc_ids: List[str]) -> Dict[str, int]:
+        """Mapa inverso (id do documento -> posição) para os ids pedidos."""
+        if not doc_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in doc_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, position FROM docs WHERE doc_id IN ({placeholders})", list(doc_ids)
+            ).fetchall()
+        return dict(rows)
+
+    def __iter__(self) -> Iterator[int]:
+        with self._lock:
+            positions = [row[0] for row in self._conn.execute("SELECT position FROM docs ORDER BY position")]
+        return iter(positions)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# (fonte, página, hash do chunk, id do vetor)
+ManifestRow = Tuple[str, int, str, str]
+
+
+def save_vector_store(
+    db: FAISS,
+    path: Union[str, Path],
+    manifest: Optional[List[ManifestRow]] = None,
+    source_aliases: Optional[Mapping[str, Sequence[str]]] = None,
+) -> None:
+    """
+    Salva o índice no formato sem pickle:
+    - index.faiss: vetores no formato nativo do FAISS (pode ser lido via mmap);
+    - docstore.sqlite: texto e metadados de cada chunk, indexados por posição e id,
+      o índice BM25 (FTS5) sobre os mesmos chunks, o índice de artigos
+      (fonte, número do artigo) -> chunks e texto canônico, e o manifesto
+      (fonte, página, hash do chunk) -> id usado na ingestão incremental,
+      além do carimbo do index.faiss que o acompanha.
+    Os dois arquivos são trocados com os.replace, o índice primeiro; o
+    carimbo deixa load_vector_store detectar um par de versões diferentes.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    # Grava num temporário e troca com os.replace: processos que mapeiam o
+    # index.faiss atual (mmap) continuam lendo o arquivo antigo até recarregarem
+    tmp_index = path / (INDEX_FILENAME + ".tmp")
+    faiss.write_index(db.index, str(tmp_index))
+    index_stamp = file_stamp(tmp_index)
+
+    tmp_path = path / (DOCSTORE_FILENAME + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    conn = sqlite3.connect(tmp_path)
+    conn.execute(
+        """
+        CREATE TABLE docs (
+            position INTEGER PRIMARY KEY,
+            doc_id TEXT UNIQUE NOT NULL,
+            page_content TEXT NOT NULL,
+            metadata TEXT NOT NULL
+        )
+        """
+    )
+    rows = []
+    sparse_rows = []
+    article_rows = []
+    for position, doc_id in db.index_to_docstore_id.items():
+        doc = db.docstore.search(doc_id)
+        rows.append((position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        sparse_rows.append((position, doc.page_content, doc.metadata.get("article", "")))
+        article_rows.append((
+            doc.metadata.get("source", ""), doc.metadata.get("article", ""),
+            doc.metadata.get("page", 0), position, doc_id, doc.page_content,
+        ))
+    conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+
+    # Índice invertido BM25 para a busca esparsa/híbrida do retriever
+    create_sparse_index(conn, sparse_rows)
+    # Citações explícitas ("art. 39 cdc") resolvidas sem busca vetorial
+    create_article_index(conn, article_rows, source_aliases)
+
+    conn.execute(
+        """
+        CREATE TABLE manifest (
+            source TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            chunk_hash TEXT NOT NULL,
+            doc_id TEXT PRIMARY KEY
+        )
+        """
+    )
+    conn.executemany("INSERT INTO manifest VALUES (?, ?, ?, ?)", manifest or [])
+
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("INSERT INTO meta VALUES (?, ?)", (INDEX_STAMP_KEY, index_stamp))
+    conn.commit()
+    conn.close()
+    os.replace(tmp_index, path / INDEX_FILENAME)
+    os.replace(tmp_path, path / DOCSTORE_FILENAME)
+
+    # O pickle do formato antigo (FAISS.save_local) ficaria desatualizado
+    legacy_pickle = path / "index.pkl"
+    if legacy_pickle.exists():
+        legacy_pickle.unlink()
+
+
+def read_manifest(path: Union[str, Path]) -> Dict[str, ManifestRow]:
+    """Manifesto da última ingestão, indexado pelo id do vetor (vazio se não houver)."""
+    docstore_path = Path(path) / DOCSTORE_FILENAME
+    if not docstore_path.exists():
+        return {}
+    conn = _connect_readonly(docstore_path)
+    try:
+        rows = conn.execute("SELECT source, page, chunk_hash, doc_id FROM manifest").fetchall()
+    except sqlite3.OperationalError:
+        # Índice salvo antes da ingestão incremental: sem manifesto
+        rows = []
+    finally:
+        conn.close()
+    return {row[3]: tuple(row) for row in rows}
+
+
+def _mmap_flags() -> int:
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Versões recentes do FAISS também mapeiam índices planos (IndexFlatCodes) sem cópia
+    return flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def read_index(index_path: Union[str, Path], mmap: bool = True):
+    """Lê um índice FAISS, via mmap quando possível (páginas compartilhadas entre processos)."""
+    if mmap:
+        try:
+            return faiss.read_index(str(index_path), _mmap_flags())
+        except RuntimeError as e:
+            logger.warning("Não foi possível mapear %s via mmap (%s). Lendo para a memória.", index_path, e)
+    return faiss.read_index(str(index_path))
+
+
+def load_vector_store_for_update(path: Union[str, Path], embeddings: Embeddings) -> Optional[FAISS]:
+    """
+    Carrega o índice inteiro em memória (docstore mutável) para ser atualizado
+    pela ingestão incremental. Retorna None se ainda não existir índice.
+    """
+    path = Path(path)
+    docstore_path = path / DOCSTORE_FILENAME
+
+    if not docstore_path.exists():
+        if (path / "index.pkl").exists():
+            return FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+        return None
+
+    conn = _connect_readonly(docstore_path)
+    rows = conn.execute("SELECT position, doc_id, page_content, metadata FROM docs ORDER BY position").fetchall()
+    conn.close()
+
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+        for _, doc_id, page_content, metadata in rows
+    })
+    return FAISS(
+        embedding_function=embeddings,
+        index=read_index(path / INDEX_FILENAME, mmap=False),
+        docstore=docstore,
+        index_to_docstore_id={position: doc_id for position, doc_id, _, _ in rows},
+    )
+
+
+def load_vector_store(path: Union[str, Path], embeddings: Embeddings, mmap: bool = True) -> FAISS:
+    """
+    Carrega o índice salvo por save_vector_store: vetores via mmap e
+    docstore/metadados lidos preguiçosamente do SQLite.
+    Índices antigos (index.pkl) ainda são aceitos, com desserialização via pickle.
+    Se uma ingestão estiver trocando os arquivos, o index.faiss pode não
+    corresponder ao carimbo do docstore: tenta de novo antes de desistir.
+    """
+    path = Path(path)
+    docstore_path = path / DOCSTORE_FILENAME
+    index_path = path / INDEX_FILENAME
+
+    if not docstore_path.exists():
+        logger.warning("%s não encontrado; carregando índice legado (pickle). Rode a ingestão novamente.", docstore_path)
+        return FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+
+    for _ in range(_LOAD_ATTEMPTS):
+        docstore = SQLiteDocstore(docstore_path)
+        index_map = SQLiteIndexMap(docstore_path)
+        stamp = docstore.index_stamp
+        if stamp is None:
+            # Docstore salvo antes do carimbo: sem como conferir o par
+            index = read_index(index_path, mmap=mmap)
+            break
+        if index_map.index_stamp == stamp and file_stamp(index_path) == stamp:
+            index = read_index(index_path, mmap=mmap)
+            # Confere de novo: o arquivo pode ter sido trocado durante a leitura
+            if file_stamp(index_path) == stamp:
+                break
+        docstore.close()
+        index_map.close()
+        logger.info("index.faiss e docstore de ingestões diferentes (troca em andamento); tentando de novo.")
+        time.sleep(_LOAD_RETRY_SECONDS)
+    else:
+        raise RuntimeError(
+            f"index.faiss não corresponde ao docstore em {path} após {_LOAD_ATTEMPTS} tentativas; rode a ingestão novamente."
+        )
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_map,
+    )
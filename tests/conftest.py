@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# Os testes importam os módulos de 'src' pelos mesmos nomes usados pelo grafo (utils, agents)
+src_path = str(Path(__file__).resolve().parent.parent / "src")
+if src_path not in sys.path:
+    sys.path.append(src_path)
+
+# Nenhum teste chama um provedor real: agentes criados nos testes usam o LLM fake
+os.environ.setdefault("LLM_PROVIDER", "fake")
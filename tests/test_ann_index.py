@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from utils.ann_index import ANN_FILENAME, ANN_META_FILENAME, build_ann_index, load_ann_index, save_ann_index
+from utils.vector_store import INDEX_FILENAME, file_stamp
+
+
+def _flat(path, seed=0, ntotal=64):
+    index = faiss.IndexFlatL2(8)
+    index.add(np.random.default_rng(seed).random((ntotal, 8), dtype=np.float32))
+    faiss.write_index(index, str(path / INDEX_FILENAME))
+    return index
+
+
+def test_ann_index_round_trip_keeps_search_results(tmp_path):
+    flat = _flat(tmp_path)
+    save_ann_index(build_ann_index(flat, "hnsw"), tmp_path, "hnsw", {"hnsw_m": 32})
+    index, meta = load_ann_index(tmp_path, flat.ntotal, file_stamp(tmp_path / INDEX_FILENAME))
+    assert meta["index_type"] == "hnsw" and meta["hnsw_m"] == 32
+    query = flat.reconstruct(5).reshape(1, -1)
+    assert index.search(query, 1)[1][0][0] == 5
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_ann_index_built_from_another_flat_index_is_ignored(tmp_path):
+    flat = _flat(tmp_path)
+    save_ann_index(build_ann_index(flat, "hnsw"), tmp_path, "hnsw", {})
+    # Nova ingestão com o mesmo número de vetores: o ntotal não denuncia a diferença
+    _flat(tmp_path, seed=1)
+    assert load_ann_index(tmp_path, flat.ntotal, file_stamp(tmp_path / INDEX_FILENAME)) == (None, None)
+
+
+def test_ann_index_not_matching_its_metadata_is_ignored(tmp_path):
+    flat = _flat(tmp_path)
+    save_ann_index(build_ann_index(flat, "hnsw"), tmp_path, "hnsw", {})
+    faiss.write_index(build_ann_index(flat, "hnsw", hnsw_m=8), str(tmp_path / ANN_FILENAME))
+    assert load_ann_index(tmp_path, flat.ntotal, file_stamp(tmp_path / INDEX_FILENAME)) == (None, None)
+
+
+def test_metadata_without_stamps_only_checks_ntotal(tmp_path):
+    flat = _flat(tmp_path)
+    save_ann_index(build_ann_index(flat, "hnsw"), tmp_path, "hnsw", {})
+    meta_path = tmp_path / ANN_META_FILENAME
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta_path.write_text(json.dumps({"index_type": meta["index_type"], "ntotal": meta["ntotal"]}), encoding="utf-8")
+
+    index, _ = load_ann_index(tmp_path, flat.ntotal, "outro carimbo")
+    assert index is not None
+    assert load_ann_index(tmp_path, flat.ntotal + 1) == (None, None)
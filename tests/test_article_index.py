@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from utils.article_index import (
+    ArticleIndex, article_number, article_numbers, create_article_index, join_chunks, normalize_text, strip_overlap,
+)
+
+
+@pytest.fixture
+def article_index(tmp_path):
+    path = tmp_path / "docstore.sqlite"
+    conn = sqlite3.connect(path)
+    rows = [
+        ("cdc.pdf", "Art. 39", 3, 1, "b", "Art. 39 segunda parte"),
+        ("cdc.pdf", "Art. 39", 2, 0, "a", "Art. 39 primeira parte"),
+        ("cdc.pdf", "", 2, 2, "x", "Preâmbulo sem artigo"),
+        ("cf88.pdf", "Art. 5º", 1, 3, "c", "Art. 5º Todos são iguais"),
+        ("cf88.pdf", "Art. 39", 9, 4, "d", "Art. 39 da CF"),
+    ]
+    create_article_index(conn, rows, {"cdc.pdf": ["CDC", "Código de Defesa do Consumidor"], "cf88.pdf": ["CF"]})
+    conn.commit()
+    conn.close()
+    return ArticleIndex(path, max_chunks=4)
+
+
+def test_normalize_text_removes_accents_and_case():
+    assert normalize_text("Constituição ÓRGÃO") == "constituicao orgao"
+
+
+@pytest.mark.parametrize("article, number", [("Art. 5º", "5"), ("Artigo 49", "49"), ("", None), (None, None)])
+def test_article_number(article, number):
+    assert article_number(article) == number
+
+
+@pytest.mark.parametrize("text, numbers", [
+    ("art. 39", ["39"]),
+    ("Art 5º e art. 6", ["5", "6"]),
+    ("arts. 6º e 7", ["6", "7"]),
+    ("artigos 6, 7 e 8", ["6", "7", "8"]),
+    ("art. 49 e 30 dias", ["49"]),
+    ("parte 39", []),
+])
+def test_article_numbers(text, numbers):
+    assert article_numbers(text) == numbers
+
+
+def test_parse_pure_citation_with_source(article_index):
+    assert article_index.parse("art. 39 cdc") == ([("cdc.pdf", "39")], True)
+
+
+def test_parse_without_source_searches_every_source(article_index):
+    citations, pure = article_index.parse("o que diz o art. 39 sobre venda casada?")
+    assert citations == [(None, "39")]
+    assert not pure
+
+
+def test_parse_plural_list(article_index):
+    citations, pure = article_index.parse("arts. 5º e 39 da CF")
+    assert citations == [("cf88.pdf", "5"), ("cf88.pdf", "39")]
+    assert pure
+
+
+def test_lookup_and_resolve_follow_page_order(article_index):
+    assert article_index.lookup("cdc.pdf", "39") == ["a", "b"]
+    assert article_index.lookup(None, "39") == ["a", "b", "d"]
+    assert article_index.resolve("art. 39 cdc") == (["a", "b"], True)
+
+
+def test_sources_and_text(article_index):
+    assert article_index.sources_for("39") == ["cdc.pdf", "cf88.pdf"]
+    assert article_index.source_for("Código de Defesa do Consumidor") == "cdc.pdf"
+    assert article_index.exists("cf88.pdf", "5")
+    assert not article_index.exists("cdc.pdf", "5")
+    assert article_index.text("cdc.pdf", "39") == "Art. 39 primeira parte\nArt. 39 segunda parte"
+
+
+def test_strip_overlap_and_join_chunks():
+    previous = "a" * 10 + " trecho repetido entre os dois chunks"
+    current = " trecho repetido entre os dois chunks e a continuação"
+    assert strip_overlap(previous, current) == " e a continuação"
+    assert strip_overlap("sem relação alguma", "outro texto qualquer") is None
+    assert join_chunks([previous, current]) == previous + " e a continuação"
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from utils.batching import MicroBatcher, QueueFullError
+
+
+def test_concurrent_submits_share_one_batch_and_keep_order():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5))), batcher.stats()
+        finally:
+            await batcher.stop()
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert stats["batches"] == 1 and stats["avg_batch_size"] == 5
+
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+
+    def batch_fn(items):
+        sizes.append(len(items))
+        return items
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+    assert sizes == [2, 2, 1]
+
+
+def test_batch_errors_reach_every_caller_and_the_worker_survives():
+    def batch_fn(items):
+        if "erro" in items:
+            raise ValueError("falhou")
+        return items
+
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_wait_ms=20)
+        try:
+            failed = await asyncio.gather(batcher.submit("erro"), batcher.submit("ok"), return_exceptions=True)
+            return failed, await batcher.submit("depois")
+        finally:
+            await batcher.stop()
+
+    failed, after = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in failed)
+    assert after == "depois"
+
+
+def test_full_queue_raises_queue_full_error():
+    async def main():
+        batcher = MicroBatcher(lambda items: items, max_queue=1, max_wait_ms=50)
+        batcher.start()
+        first = asyncio.ensure_future(batcher.submit(1))
+        second = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(QueueFullError):
+                await second
+        finally:
+            await batcher.stop()
+            first.cancel()
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from utils.deadline import DeadlineExceeded, acall_with_deadline, call_with_deadline, has_time_for, new_deadline, remaining
+
+graph = pytest.importorskip("graph")
+
+
+def test_remaining_without_deadline_is_unbounded():
+    assert math.isinf(remaining({}))
+    assert 9 < remaining({"deadline": new_deadline(10)}) <= 10
+
+
+def test_has_time_for_uses_stage_minimum_and_env_override(monkeypatch):
+    state = {"deadline": time.monotonic() + 4}
+    assert has_time_for(state, "answerer")
+    assert not has_time_for(state, "self_check")
+    monkeypatch.setenv("DEADLINE_MIN_SELF_CHECK", "1")
+    assert has_time_for(state, "self_check")
+
+
+def test_call_with_deadline_returns_or_raises():
+    assert call_with_deadline({}, lambda x: x * 2, 21) == 42
+    assert call_with_deadline({"deadline": new_deadline(5)}, lambda: "ok") == "ok"
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline({"deadline": new_deadline(0.05)}, time.sleep, 0.3)
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline({"deadline": time.monotonic() - 1}, lambda: "tarde")
+
+
+def test_acall_with_deadline_cancels_slow_coroutine():
+    assert asyncio.run(acall_with_deadline({"deadline": new_deadline(5)}, asyncio.sleep(0, "ok"))) == "ok"
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(acall_with_deadline({"deadline": new_deadline(0.05)}, asyncio.sleep(1)))
+
+
+def test_run_stage_degrades_to_fallback():
+    calls = []
+    state = {"deadline": time.monotonic() + 1}
+    result, update = graph._run_stage(state, "self_check", lambda: "fallback", calls.append, "chamada")
+    assert (result, update, calls) == ("fallback", {"skipped_stages": ["self_check"]}, [])
+
+    state = {"deadline": new_deadline(0.05)}
+    result, update = graph._run_stage(state, "supervisor", lambda: "fallback", time.sleep, 0.3)
+    assert (result, update) == ("fallback", {"skipped_stages": ["supervisor"]})
+
+    assert graph._run_stage({}, "self_check", lambda: "fallback", lambda: "ok") == ("ok", {})
+
+
+def test_retry_is_not_allowed_past_the_request_deadline():
+    state = {
+        "attempts": [{"seconds": 3.0}],
+        "answer_started": time.perf_counter(),
+        "deadline": time.monotonic() + 2,
+    }
+    assert not graph._retry_allowed(state)
+    state["deadline"] = time.monotonic() + 10
+    assert graph._retry_allowed(state)
+
+
+def test_quick_supervise_returns_a_copy_of_the_memo_entry():
+    question = "Quais os direitos do titular de dados previstos na LGPD?"
+    memo = graph.supervisor_agent.memo
+    memo.set(question, {"intent": "consulta", "needs_clarification": False})
+    try:
+        first = graph.quick_supervise_question(question)
+        first["needs_clarification"] = True
+        assert graph.quick_supervise_question(question)["needs_clarification"] is False
+    finally:
+        memo.clear()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from utils.diversity import collapse_near_duplicates, mmr_select, normalize_rows
+
+
+def test_normalize_rows_gives_unit_norm_and_keeps_zero_rows():
+    vectors = normalize_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    assert np.allclose(vectors[0], [0.6, 0.8])
+    assert np.allclose(vectors[1], [0.0, 0.0])
+
+
+def _vectors():
+    # 0 e 1 quase idênticos; 2 ortogonal
+    return normalize_rows(np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]]))
+
+
+def test_mmr_with_lambda_one_is_pure_relevance():
+    relevance = np.array([0.9, 0.8, 0.1])
+    assert mmr_select(relevance, _vectors(), k=2, lambda_mult=1.0) == [0, 1]
+
+
+def test_mmr_prefers_a_diverse_second_pick():
+    relevance = np.array([0.9, 0.8, 0.5])
+    assert mmr_select(relevance, _vectors(), k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_handles_k_larger_than_candidates_and_empty_input():
+    assert sorted(mmr_select(np.array([0.9, 0.8, 0.5]), _vectors(), k=10, lambda_mult=0.7)) == [0, 1, 2]
+    assert mmr_select(np.array([]), np.empty((0, 2)), k=3, lambda_mult=0.7) == []
+    assert mmr_select(np.array([0.9, 0.8, 0.5]), _vectors(), k=0, lambda_mult=0.7) == []
+
+
+def test_collapse_near_duplicates_keeps_first_of_each_group():
+    assert collapse_near_duplicates(_vectors(), threshold=0.95) == [0, 2]
+    assert collapse_near_duplicates(_vectors(), threshold=1.01) == [0, 1, 2]
+    assert collapse_near_duplicates(np.empty((0, 2)), threshold=0.95) == []
@@ -0,0 +1,133 @@
+import sqlite3
+
+import pytest
+from langchain_core.documents import Document
+
+from utils.article_index import ArticleIndex, create_article_index
+from utils.faithfulness import check_citations, extract_citations, precheck
+
+CDC = "Código de Defesa do Consumidor"
+CDC_TEXT = (
+    "São direitos básicos do consumidor a proteção da vida, saúde e segurança "
+    "contra os riscos provocados por práticas no fornecimento de produtos e serviços."
+)
+
+
+def _doc(article: str, text: str = CDC_TEXT, source: str = "cdc.pdf") -> Document:
+    return Document(page_content=text, metadata={"source": source, "pretty_name": CDC, "article": article})
+
+
+@pytest.fixture
+def article_index(tmp_path):
+    path = tmp_path / "docstore.sqlite"
+    conn = sqlite3.connect(path)
+    rows = [
+        ("cdc.pdf", "Art. 6º", 1, 0, "a", "Art. 6º texto"),
+        ("cdc.pdf", "Art. 7º", 1, 1, "b", "Art. 7º texto"),
+        ("cdc.pdf", "Art. 49", 5, 2, "c", "Art. 49 texto"),
+        ("cf88.pdf", "Art. 5º", 2, 3, "d", "Art. 5º texto"),
+    ]
+    create_article_index(conn, rows, {"cdc.pdf": ["cdc", "codigo de defesa do consumidor"], "cf88.pdf": ["cf"]})
+    conn.commit()
+    conn.close()
+    return ArticleIndex(path)
+
+
+# --- extract_citations ---
+
+def test_extract_citations_keeps_source_inside_block():
+    answer = f"O consumidor tem direito à informação [Fonte: {CDC}, Art. 6º]."
+    assert extract_citations(answer) == [("codigo de defesa do consumidor", "6")]
+
+
+def test_extract_citations_loose_articles_have_no_source():
+    assert extract_citations("Conforme o artigo 49, o prazo é de 7 dias.") == [(None, "49")]
+
+
+@pytest.mark.parametrize("answer, numbers", [
+    ("Veja os arts. 6º e 7.", ["6", "7"]),
+    ("Veja os arts. 6, 7 e 8.", ["6", "7", "8"]),
+    ("Veja os artigos 6º, 7º e 8º.", ["6", "7", "8"]),
+    ("Arts. 18 do CDC.", ["18"]),
+])
+def test_extract_citations_plural_lists(answer, numbers):
+    assert [number for _, number in extract_citations(answer)] == numbers
+
+
+def test_extract_citations_list_inside_source_block():
+    answer = f"[Fonte: {CDC}, arts. 6º e 7]"
+    assert extract_citations(answer) == [
+        ("codigo de defesa do consumidor", "6"), ("codigo de defesa do consumidor", "7"),
+    ]
+
+
+def test_extract_citations_singular_does_not_open_a_list():
+    assert extract_citations("Pelo art. 49 e 30 dias depois...") == [(None, "49")]
+
+
+def test_extract_citations_deduplicates():
+    assert extract_citations("Art. 6º ... de novo o Art. 6") == [(None, "6")]
+
+
+# --- precheck ---
+
+def test_precheck_error_marker_is_unfaithful():
+    result = precheck("ERRO: não foi possível responder.", [_doc("Art. 6º")], CDC_TEXT)
+    assert result.verdict == "nao_fiel"
+
+
+def test_precheck_without_reference_is_unfaithful():
+    result = precheck("O consumidor tem muitos direitos.", [_doc("Art. 6º")], CDC_TEXT)
+    assert result.verdict == "nao_fiel"
+
+
+def test_precheck_grounded_answer_is_faithful():
+    answer = f"{CDC_TEXT} [Fonte: {CDC}, Art. 6º]"
+    result = precheck(answer, [_doc("Art. 6º")], CDC_TEXT)
+    assert result.verdict == "fiel"
+    assert result.unsupported == []
+
+
+def test_precheck_every_article_of_a_list_must_be_grounded():
+    answer = f"{CDC_TEXT} [Fonte: {CDC}, arts. 6º e 7]"
+    result = precheck(answer, [_doc("Art. 6º")], CDC_TEXT)
+    assert result.verdict is None
+    assert result.unsupported == [("codigo de defesa do consumidor", "7")]
+
+
+def test_precheck_low_overlap_goes_to_the_llm():
+    answer = f"Uma resposta com palavras totalmente diferentes do contexto. [Fonte: {CDC}, Art. 6º]"
+    result = precheck(answer, [_doc("Art. 6º")], CDC_TEXT)
+    assert result.verdict is None
+    assert "sobreposição" in result.reasoning
+
+
+def test_precheck_article_mentioned_in_context_is_grounded():
+    context = CDC_TEXT + " Ver também o art. 7º."
+    answer = f"{CDC_TEXT} [Fonte: {CDC}, Art. 7º]"
+    assert precheck(answer, [_doc("Art. 6º")], context).verdict == "fiel"
+
+
+# --- check_citations ---
+
+def test_check_citations_statuses(article_index):
+    answer = "[Fonte: CDC, arts. 6º e 49] e também o Art. 99."
+    checks = {check.number: check for check in check_citations(answer, [_doc("Art. 6º")], article_index)}
+    assert checks["6"].status == "ok"
+    assert (checks["49"].status, checks["49"].source) == ("missing", "cdc.pdf")
+    assert checks["99"].status == "unknown"
+
+
+def test_check_citations_uses_the_cited_source(article_index):
+    checks = check_citations("[Fonte: CF, Art. 6º]", [_doc("Art. 6º")], article_index)
+    assert [(check.source, check.status) for check in checks] == [("cf88.pdf", "unknown")]
+
+
+def test_check_citations_loose_article_found_in_another_source(article_index):
+    checks = check_citations("Pelo Art. 5º...", [_doc("Art. 6º")], article_index)
+    assert [(check.source, check.status) for check in checks] == [("cf88.pdf", "missing")]
+
+
+def test_check_citations_without_article_index():
+    checks = check_citations("Art. 6º e Art. 7º", [_doc("Art. 6º")], None)
+    assert [(check.number, check.status) for check in checks] == [("6", "ok"), ("7", "unknown")]
@@ -0,0 +1,87 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.article_index import ArticleIndex, create_article_index
+
+graph = pytest.importorskip("graph")
+
+
+def test_route_after_cache_hit_ends_the_flow():
+    assert graph.route_after_cache({"question": "O que é venda casada?", "cache_hit": True}) == "cached"
+
+
+def test_route_after_cache_fans_out_to_the_original_retrieval():
+    route = graph.route_after_cache({"question": "O que é venda casada?", "cache_hit": False})
+    assert route == ["supervisor", "retrieve_original"]
+
+
+def test_route_after_cache_skips_retrieval_when_rules_ask_for_clarification():
+    route = graph.route_after_cache({"question": "Posso processar?", "cache_hit": False})
+    assert route == ["supervisor"]
+    # O supervisor chega à mesma decisão sem LLM
+    assert graph.quick_supervise_question("Posso processar?")["needs_clarification"] is True
+
+
+def _retry_state(verdict="nao_fiel", reasoning="", attempts=1, seconds=2.0, started=0.0, **extra):
+    return {
+        "question": "O que é venda casada?",
+        "verdict": SimpleNamespace(verdict=verdict, reasoning=reasoning),
+        "attempts": [{"seconds": seconds}] * attempts,
+        "answer_started": time.perf_counter() - started,
+        **extra,
+    }
+
+
+def test_faithful_answer_ends_without_retry():
+    assert graph.route_after_check(_retry_state(verdict="fiel")) == "end_safe"
+
+
+def test_unfaithful_answer_retries_until_max_attempts(monkeypatch):
+    monkeypatch.setenv("RETRY_MAX_ATTEMPTS", "2")
+    assert graph.route_after_check(_retry_state(attempts=1)) == "retry"
+    assert graph.route_after_check(_retry_state(attempts=2)) == "fail"
+    assert graph.route_after_check(_retry_state(attempts=0)) == "fail"
+
+
+def test_retry_needs_room_for_another_attempt_in_the_budget(monkeypatch):
+    monkeypatch.setenv("RETRY_DEADLINE_SECONDS", "10")
+    assert graph._retry_allowed(_retry_state(seconds=4.0, started=5.0))
+    assert not graph._retry_allowed(_retry_state(seconds=4.0, started=7.0))
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    path = tmp_path / "docstore.sqlite"
+    conn = sqlite3.connect(path)
+    rows = [
+        ("cdc.pdf", "Art. 39", 1, 0, "a", "Art. 39 É vedado"),
+        ("cdc.pdf", "Art. 6º", 2, 1, "b", "Art. 6º São direitos básicos"),
+        ("cf88.pdf", "Art. 6º", 3, 2, "c", "Art. 6º São direitos sociais"),
+    ]
+    create_article_index(conn, rows, {"cdc.pdf": ["CDC"], "cf88.pdf": ["CF"]})
+    conn.commit()
+    conn.close()
+    return SimpleNamespace(article_index=ArticleIndex(path), config=SimpleNamespace(k=2))
+
+
+def test_retry_plan_fetches_articles_cited_in_the_verdict_and_widens_k(retriever, monkeypatch):
+    monkeypatch.setenv("RETRY_K_FACTOR", "2")
+    state = _retry_state(reasoning="A resposta omite os arts. 39 e 6º do CDC.")
+    targets, k, strategy = graph._retry_plan(state, retriever)
+    assert targets == [("cdc.pdf", "39"), ("cdc.pdf", "6")]
+    assert k == 4
+    assert strategy == "k=4 + Art. 39 + Art. 6"
+
+
+def test_retry_plan_looks_up_an_article_without_source_in_every_source(retriever):
+    targets, _, _ = graph._retry_plan(_retry_state(reasoning="Falta o art. 6º."), retriever)
+    assert targets == [("cdc.pdf", "6"), ("cf88.pdf", "6")]
+
+
+def test_retry_plan_without_citations_only_widens_k(retriever, monkeypatch):
+    monkeypatch.setenv("RETRY_K_FACTOR", "3")
+    targets, k, strategy = graph._retry_plan(_retry_state(reasoning="Sem fundamento.", attempts=2), retriever)
+    assert (targets, k, strategy) == ([], 18, "k=18")
@@ -0,0 +1,109 @@
+import queue
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from langchain_core.documents import Document
+
+pytest.importorskip("faiss")
+pytest.importorskip("tqdm")
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from ingest import ingest_data
+from utils.vector_store import load_vector_store, read_manifest
+
+
+def _chunk(text, page=1, source="data/cdc.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page, "article": ""})
+
+
+def test_chunk_identity_is_stable_and_counts_repeated_chunks():
+    occurrences = {}
+    first_hash, first_id = ingest_data.chunk_identity(_chunk("Art. 1"), occurrences)
+    repeated_hash, repeated_id = ingest_data.chunk_identity(_chunk("Art. 1"), occurrences)
+    assert first_hash == repeated_hash and first_id != repeated_id
+    assert ingest_data.chunk_identity(_chunk("Art. 1"), {}) == (first_hash, first_id)
+    assert ingest_data.chunk_identity(_chunk("Art. 1", page=2), {})[1] != first_id
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    """Roda create_vector_db sobre os chunks dados, contando os textos embutidos."""
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "cdc.pdf").write_bytes(b"")
+    db_path = tmp_path / "db"
+    embedded = []
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            embedded.extend(texts)
+            return super().embed_documents(texts)
+
+    monkeypatch.setattr(ingest_data, "DATA_PATH", str(tmp_path / "data"))
+    monkeypatch.setattr(ingest_data, "DB_FAISS_PATH", str(db_path))
+    monkeypatch.setattr(ingest_data, "SOURCES", [{"name": "cdc.pdf", "pretty_name": "CDC"}])
+    monkeypatch.setattr(ingest_data, "create_embeddings", lambda batch_size: CountingEmbedding(size=8))
+
+    def run(chunks):
+        embedded.clear()
+        monkeypatch.setattr(ingest_data, "stream_chunks", lambda sources, workers: iter(chunks))
+        ingest_data.create_vector_db(batch_size=2)
+        db = load_vector_store(db_path, DeterministicFakeEmbedding(size=8))
+        texts = sorted(db.docstore.search(doc_id).page_content for doc_id in db.index_to_docstore_id.values())
+        return texts, list(embedded), read_manifest(db_path)
+
+    return run
+
+
+def test_reingestion_embeds_only_new_chunks_and_deletes_removed_ones(ingest):
+    texts, embedded, manifest = ingest([_chunk("Art. 1"), _chunk("Art. 2"), _chunk("Art. 3", page=2)])
+    assert texts == ["Art. 1", "Art. 2", "Art. 3"]
+    assert sorted(embedded) == texts
+    assert len(manifest) == 3
+
+    texts, embedded, manifest = ingest([_chunk("Art. 1"), _chunk("Art. 3", page=2), _chunk("Art. 4", page=2)])
+    assert texts == ["Art. 1", "Art. 3", "Art. 4"]
+    assert embedded == ["Art. 4"]
+    assert sorted(row[2] for row in manifest.values()) == sorted(
+        ingest_data.chunk_identity(_chunk(text, page), {})[0] for text, page in [("Art. 1", 1), ("Art. 3", 2), ("Art. 4", 2)]
+    )
+
+
+def test_unchanged_corpus_embeds_nothing(ingest):
+    chunks = [_chunk("Art. 1"), _chunk("Art. 2")]
+    ingest(chunks)
+    texts, embedded, _ = ingest(chunks)
+    assert texts == ["Art. 1", "Art. 2"]
+    assert embedded == []
+
+
+def _future(result=None, exception=None, done=True):
+    future = Future()
+    if done and exception:
+        future.set_exception(exception)
+    elif done:
+        future.set_result(result)
+    return future
+
+
+def test_drain_chunk_queue_yields_every_batch_until_each_source_ends():
+    chunk_queue = queue.Queue()
+    for item in (["a", "b"], None, ["c"], None):
+        chunk_queue.put(item)
+    assert list(ingest_data.drain_chunk_queue(chunk_queue, [_future(), _future()], poll_seconds=0.01)) == ["a", "b", "c"]
+
+
+def test_drain_chunk_queue_raises_when_a_worker_dies():
+    chunk_queue = queue.Queue()
+    chunk_queue.put(["a"])
+    futures = [_future(exception=BrokenProcessPool("worker morto")), _future(done=False)]
+    chunks = ingest_data.drain_chunk_queue(chunk_queue, futures, poll_seconds=0.01)
+    assert next(chunks) == "a"
+    with pytest.raises(BrokenProcessPool):
+        next(chunks)
+
+
+def test_drain_chunk_queue_raises_when_workers_end_without_the_end_marker():
+    chunks = ingest_data.drain_chunk_queue(queue.Queue(), [_future()], poll_seconds=0.01)
+    with pytest.raises(RuntimeError, match="sem sinalizar"):
+        list(chunks)
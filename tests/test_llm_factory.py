@@ -0,0 +1,46 @@
+import threading
+
+from utils import llm_factory
+from utils.llm_factory import LLMRegistry
+
+
+def test_same_settings_reuse_one_client():
+    registry = LLMRegistry()
+    first = registry.get("fake", "modelo", 0)
+    assert registry.get("fake", "modelo", 0.0) is first
+    assert registry.get("fake", "modelo", 0.5) is not first
+    assert registry.stats() == {"clients": 2, "constructed": 2, "reused": 1}
+
+
+def test_concurrent_first_calls_build_a_single_client(monkeypatch):
+    built = []
+    barrier = threading.Barrier(8)
+    original = llm_factory._build_llm
+
+    def counting_build(*args):
+        built.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(llm_factory, "_build_llm", counting_build)
+    registry = LLMRegistry()
+    clients = []
+
+    def worker():
+        barrier.wait()
+        clients.append(registry.get("fake", "modelo"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_reset_discards_clients():
+    registry = LLMRegistry()
+    first = registry.get("fake", "modelo")
+    registry.reset()
+    assert registry.stats() == {"clients": 0, "constructed": 0, "reused": 0}
+    assert registry.get("fake", "modelo") is not first
@@ -0,0 +1,43 @@
+from utils.memo import AgentMemo, normalize_question
+
+
+def test_normalized_variants_share_an_entry():
+    memo = AgentMemo("supervisor", "prompt v1")
+    memo.set("  O que é   DADO pessoal? ", {"needs_clarification": False})
+    assert normalize_question("O QUE é dado PESSOAL?") == "o que é dado pessoal?"
+    assert memo.get("o que é dado pessoal?") == {"needs_clarification": False}
+    assert memo.stats()["hits"] == 1
+
+
+def test_lru_keeps_at_most_max_entries():
+    memo = AgentMemo("supervisor", "prompt v1", max_entries=2)
+    memo.set("a", 1)
+    memo.set("b", 2)
+    assert memo.get("a") == 1
+    memo.set("c", 3)
+    assert memo.get("b") is None
+    assert memo.get("a") == 1 and memo.get("c") == 3
+    assert memo.stats()["entries"] == 2
+
+
+def test_model_change_misses(monkeypatch):
+    memo = AgentMemo("supervisor", "prompt v1")
+    monkeypatch.setenv("LLM_MODEL", "modelo-a")
+    memo.set("pergunta", "a")
+    monkeypatch.setenv("LLM_MODEL", "modelo-b")
+    assert memo.get("pergunta") is None
+
+
+def test_disk_layer_survives_restart_and_prompt_change_invalidates(tmp_path):
+    path = str(tmp_path / "memo.db")
+    AgentMemo("supervisor", "prompt v1", sqlite_path=path).set("pergunta", {"ok": True})
+
+    reopened = AgentMemo("supervisor", "prompt v1", sqlite_path=path)
+    assert reopened.get("pergunta") == {"ok": True}
+    assert reopened.stats()["disk_hits"] == 1
+
+    # Outro agente no mesmo arquivo não é afetado pela troca de prompt
+    AgentMemo("rephrase", "outro prompt", sqlite_path=path).set("pergunta", "reescrita")
+    assert AgentMemo("supervisor", "prompt v2", sqlite_path=path).get("pergunta") is None
+    assert AgentMemo("supervisor", "prompt v1", sqlite_path=path).get("pergunta") is None
+    assert AgentMemo("rephrase", "outro prompt", sqlite_path=path).get("pergunta") == "reescrita"
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+retriever = pytest.importorskip("agents.retriever")
+from utils.tracing import StageTimings
+
+
+class _Docstore:
+    def search(self, doc_id):
+        return Document(page_content=f"texto {doc_id}", metadata={"source": doc_id.split("-")[0]})
+
+
+def _agent():
+    agent = object.__new__(retriever.RetrieverAgent)
+    agent.db = SimpleNamespace(docstore=_Docstore())
+    agent.timings = StageTimings()
+    return agent
+
+
+def _ids(documents):
+    return [doc.page_content.split()[-1] for doc in documents]
+
+
+def test_long_cited_article_keeps_room_for_search_results():
+    config = retriever.RetrievalConfig(k=2, max_documents=6)
+    cited = [f"art-{index}" for index in range(10)]
+    documents = _agent()._finalize([(cited, ["busca-1", "busca-2"])], {}, config)
+    assert _ids(documents) == ["art-0", "art-1", "art-2", "art-3", "busca-1", "busca-2"]
+
+
+def test_search_results_fill_the_slots_left_by_short_citations():
+    config = retriever.RetrievalConfig(k=2, max_documents=6)
+    id_lists = [(["art-0"], ["busca-1", "busca-2"]), ([], ["busca-3", "busca-4", "busca-5", "busca-6"])]
+    documents = _agent()._finalize(id_lists, {}, config)
+    assert _ids(documents) == ["art-0", "busca-1", "busca-2", "busca-3", "busca-4", "busca-5"]
+
+
+def test_citation_only_query_uses_the_whole_cap():
+    config = retriever.RetrievalConfig(k=2, max_documents=3)
+    documents = _agent()._finalize([([f"art-{index}" for index in range(5)], [])], {}, config)
+    assert _ids(documents) == ["art-0", "art-1", "art-2"]
@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+from utils.semantic_cache import SemanticCache
+
+# Perguntas parecidas caem no mesmo eixo; as demais são ortogonais
+_VECTORS = {
+    "o que é dado pessoal?": [1.0, 0.0, 0.0],
+    "o que é um dado pessoal?": [0.99, 0.05, 0.0],
+    "quais são as sanções?": [0.0, 1.0, 0.0],
+    "quem é o controlador?": [0.0, 0.0, 1.0],
+}
+
+
+def _cache(tmp_path=None, **kwargs):
+    path = str(tmp_path / "cache.db") if tmp_path is not None else None
+    return SemanticCache(lambda text: _VECTORS[text.lower()], index_version=kwargs.pop("index_version", "v1"), path=path, **kwargs)
+
+
+def _rows(tmp_path):
+    with sqlite3.connect(tmp_path / "cache.db") as conn:
+        return sorted(row[0] for row in conn.execute("SELECT question FROM entries"))
+
+
+def test_similar_question_hits_and_unrelated_misses():
+    cache = _cache()
+    cache.store("O que é dado pessoal?", {"final_answer": "Art. 5º, I"})
+    assert cache.lookup("O que é um dado pessoal?") == {"final_answer": "Art. 5º, I"}
+    assert cache.lookup("Quais são as sanções?") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_pruned_on_store(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, ttl_seconds=10)
+    cache.store("O que é dado pessoal?", {"final_answer": "a"})
+    now = cache._entries["O que é dado pessoal?"]["created_at"]
+    monkeypatch.setattr("utils.semantic_cache.time.time", lambda: now + 60)
+    cache.store("Quais são as sanções?", {"final_answer": "b"})
+    assert list(cache._entries) == ["Quais são as sanções?"]
+    assert _rows(tmp_path) == ["Quais são as sanções?"]
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.store("O que é dado pessoal?", {"final_answer": "a"})
+    cache.store("Quais são as sanções?", {"final_answer": "b"})
+    assert cache.lookup("O que é dado pessoal?") is not None
+    cache.store("Quem é o controlador?", {"final_answer": "c"})
+    assert _rows(tmp_path) == ["O que é dado pessoal?", "Quem é o controlador?"]
+
+
+def test_entries_persist_and_are_trimmed_at_load(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("O que é dado pessoal?", {"final_answer": "a"})
+    cache.store("Quais são as sanções?", {"final_answer": "b"})
+    cache.store("Quem é o controlador?", {"final_answer": "c"})
+
+    reloaded = _cache(tmp_path, max_entries=2)
+    assert reloaded.stats()["entries"] == 2
+    assert reloaded.lookup("Quem é o controlador?") == {"final_answer": "c"}
+    assert _rows(tmp_path) == ["Quais são as sanções?", "Quem é o controlador?"]
+
+
+def test_expired_entries_are_dropped_at_load(tmp_path, monkeypatch):
+    _cache(tmp_path).store("O que é dado pessoal?", {"final_answer": "a"})
+    later = time.time() + 3600
+    monkeypatch.setattr("utils.semantic_cache.time.time", lambda: later)
+    assert _cache(tmp_path, ttl_seconds=60).stats()["entries"] == 0
+    assert _rows(tmp_path) == []
+
+
+def test_new_index_version_discards_persisted_entries(tmp_path):
+    _cache(tmp_path).store("O que é dado pessoal?", {"final_answer": "a"})
+    cache = _cache(tmp_path, index_version="v2")
+    assert cache.lookup("O que é dado pessoal?") is None
+    assert _rows(tmp_path) == []
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+httpx = pytest.importorskip("httpx")
+server = pytest.importorskip("api.server")
+from agents import reranker_agent
+
+
+class _BlockingGraph:
+    """Grafo falso: cada pergunta espera até o teste liberar."""
+
+    def __init__(self):
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def ainvoke(self, inputs, config):
+        self.started += 1
+        await self.release.wait()
+        return {"answer": f"resposta para {inputs['question']}"}
+
+
+class _Retriever:
+    def stats(self):
+        return {}
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_questions_above_max_pending_get_429(monkeypatch):
+    monkeypatch.setenv("SERVER_MAX_PENDING", "2")
+
+    async def scenario():
+        graph = _BlockingGraph()
+        app = server.create_app(graph=graph, retriever=_Retriever())
+        async with _client(app) as client:
+            admitted = [asyncio.create_task(client.post("/ask", json={"question": f"pergunta {index}"})) for index in range(2)]
+            while graph.started < 2:
+                await asyncio.sleep(0.01)
+
+            rejected = await client.post("/ask", json={"question": "mais uma"})
+            assert rejected.status_code == 429
+            assert rejected.headers["Retry-After"] == "1"
+            assert (await client.get("/stats")).json()["pending_questions"] == 2
+
+            graph.release.set()
+            assert [response.status_code for response in await asyncio.gather(*admitted)] == [200, 200]
+            assert (await client.get("/stats")).json()["pending_questions"] == 0
+            assert (await client.post("/ask", json={"question": "depois"})).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_stats_does_not_build_the_reranker():
+    async def scenario():
+        app = server.create_app(graph=_BlockingGraph(), retriever=_Retriever())
+        async with _client(app) as client:
+            return (await client.get("/stats")).json()
+
+    assert reranker_agent.initialized is False
+    assert asyncio.run(scenario())["reranker"] is None
+    assert reranker_agent.initialized is False
@@ -0,0 +1,46 @@
+import pytest
+from langchain_core.documents import Document
+
+pytest.importorskip("faiss")
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from utils import vector_store
+from utils.vector_store import INDEX_FILENAME, load_vector_store, read_manifest, save_vector_store
+
+
+def _store(texts):
+    documents = [Document(page_content=text, metadata={"source": "cdc.pdf", "page": page, "article": f"Art. {page}"})
+                 for page, text in enumerate(texts, start=1)]
+    return FAISS.from_documents(documents, DeterministicFakeEmbedding(size=8))
+
+
+def test_saved_store_loads_with_the_same_documents_and_manifest(tmp_path):
+    save_vector_store(_store(["Art. 1 texto", "Art. 2 texto"]), tmp_path, manifest=[("cdc.pdf", 1, "h1", "id1")])
+    db = load_vector_store(tmp_path, DeterministicFakeEmbedding(size=8))
+    assert db.index.ntotal == 2
+    assert [doc.page_content for doc in db.similarity_search("Art. 1 texto", k=1)] == ["Art. 1 texto"]
+    assert db.docstore.index_stamp == vector_store.file_stamp(tmp_path / INDEX_FILENAME)
+    assert read_manifest(tmp_path) == {"id1": ("cdc.pdf", 1, "h1", "id1")}
+
+
+def test_index_from_another_ingestion_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_LOAD_RETRY_SECONDS", 0)
+    save_vector_store(_store(["Art. 1 texto", "Art. 2 texto"]), tmp_path)
+    other = tmp_path / "outro"
+    save_vector_store(_store(["Art. 3 texto"]), other)
+    (other / INDEX_FILENAME).replace(tmp_path / INDEX_FILENAME)
+    with pytest.raises(RuntimeError, match="não corresponde"):
+        load_vector_store(tmp_path, DeterministicFakeEmbedding(size=8))
+
+
+def test_load_retries_until_the_pair_matches(tmp_path, monkeypatch):
+    save_vector_store(_store(["Art. 1 texto"]), tmp_path)
+    index_path = tmp_path / INDEX_FILENAME
+    good = index_path.read_bytes()
+    index_path.write_bytes(good + b"!")
+
+    # A "ingestão" termina de trocar o arquivo durante a espera entre tentativas
+    monkeypatch.setattr(vector_store.time, "sleep", lambda seconds: index_path.write_bytes(good))
+    db = load_vector_store(tmp_path, DeterministicFakeEmbedding(size=8))
+    assert db.index.ntotal == 1